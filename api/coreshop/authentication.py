@@ -11,3 +11,46 @@ class CookieJWTAuthentication(JWTAuthentication):
 
         validated_token = self.get_validated_token(raw_token)
         return self.get_user(validated_token), validated_token
+
+
+def async_api_view(*permission_classes):
+    """
+    Decorator for plain async Django views (DRF's APIView only runs sync): authenticates the
+    request like the API does (access_token cookie, else the session), checks the DRF
+    permission classes and sets request.user, answering 401/403 the way DRF would.
+    """
+    from functools import wraps
+
+    from asgiref.sync import sync_to_async
+    from django.http import JsonResponse
+    from rest_framework.authentication import SessionAuthentication
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework.permissions import IsAuthenticated
+    from rest_framework.request import Request
+
+    permission_classes = permission_classes or (IsAuthenticated,)
+
+    def check(request):
+        api_request = Request(request, authenticators=[CookieJWTAuthentication(), SessionAuthentication()])
+        try:
+            user = api_request.user
+        except AuthenticationFailed as exc:
+            detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+            return None, JsonResponse(detail, status=401)
+        for permission in permission_classes:
+            if not permission().has_permission(api_request, None):
+                if not user.is_authenticated:
+                    return None, JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+                return None, JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+        return user, None
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            user, denied = await sync_to_async(check)(request)
+            if denied:
+                return denied
+            request.user = user
+            return await view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -79,8 +79,8 @@ class SaleItemAdmin(admin.ModelAdmin):
 
 
 class PaymentAdmin(admin.ModelAdmin):
-    list_display = ('sale', 'amount_paid', 'payment_date', 'cashier', 'payment_method')
-    list_filter = ('payment_date', 'cashier', 'payment_method')
+    list_display = ('sale', 'amount_paid', 'payment_date', 'cashier', 'payment_method', 'method')
+    list_filter = ('payment_date', 'cashier', 'method')
     search_fields = ('sale__id', 'cashier__username')
     readonly_fields = ('payment_date',)
     ordering = ('-payment_date',)
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from .lookup import evict_product
+        post_save.connect(evict_product, sender='main.Product', dispatch_uid='product_lookup_save')
+        post_delete.connect(evict_product, sender='main.Product', dispatch_uid='product_lookup_delete')
+        from .events import subscribe
+        from .timeline import record_events
+        from .live import publish_events
+        subscribe(record_events)
+        subscribe(publish_events)
@@ -0,0 +1,250 @@
+"""
+End-of-day cashbook totals per unit.
+
+unit_summaries() computes per-day totals for a date range with one grouped query per source
+(payments, material settlements, expenses). close_day() freezes a day's totals on the
+DailyCashClose row, and the cashbook views read a frozen close instead of re-scanning that
+day's payments.
+
+Shop: in = sale payments (+ cleared material payments from the workshop), out = expenses.
+Workshop: in = repair payments, out = material payments to the shop + expenses.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCashClose, Expense, Payment
+
+ZERO = Decimal('0')
+SUMMARY_FIELDS = (
+    'payments_total', 'payments_by_method', 'loan_repayments_total',
+    'settlements_cleared_total', 'settlements_uncleared_total',
+    'expenses_total', 'expenses_by_category',
+)
+
+
+def _empty_summary():
+    return {
+        'payments_total': ZERO,
+        'payments_by_method': {},
+        'loan_repayments_total': ZERO,
+        'settlements_cleared_total': ZERO,
+        'settlements_uncleared_total': ZERO,
+        'expenses_total': ZERO,
+        'expenses_by_category': {},
+    }
+
+
+def _add(mapping, key, amount):
+    mapping[key] = mapping.get(key, ZERO) + amount
+
+
+def unit_summaries(unit, date_from, date_to):
+    """
+    {date: summary} for every day in [date_from, date_to], as Decimals. One grouped query per
+    source (payments, material settlements, expenses), however long the range.
+    """
+    from onyango.models import RepairPayment, TransferSettlement
+
+    days = {}
+    day = date_from
+    while day <= date_to:
+        days[day] = _empty_summary()
+        day += timedelta(days=1)
+
+    if unit.code == 'workshop':
+        payments = (
+            RepairPayment.objects.filter(payment_date__date__range=(date_from, date_to), invoice__job__unit=unit)
+            .values('method', day=TruncDate('payment_date'))
+            .annotate(total=Sum('amount'), is_loan=Value(False))
+        )
+        settlements = TransferSettlement.objects.filter(transfer_order__to_unit=unit)
+    else:
+        # Sales with no unit are shop sales
+        payments = (
+            Payment.objects.filter(payment_date__date__range=(date_from, date_to), sale__status='confirmed')
+            .filter(Q(sale__unit=unit) | Q(sale__unit__isnull=True))
+            .values('method', day=TruncDate('payment_date'), is_loan=F('sale__is_loan'))
+            .annotate(total=Sum('amount_paid'))
+        )
+        settlements = TransferSettlement.objects.filter(transfer_order__from_unit=unit)
+
+    for row in payments.order_by():
+        summary = days[row['day']]
+        summary['payments_total'] += row['total']
+        _add(summary['payments_by_method'], row['method'], row['total'])
+        if row['is_loan']:
+            summary['loan_repayments_total'] += row['total']
+
+    settlement_rows = (
+        settlements.filter(settlement_date__date__range=(date_from, date_to))
+        .values('cleared', day=TruncDate('settlement_date')).annotate(total=Sum('amount')).order_by()
+    )
+    for row in settlement_rows:
+        key = 'settlements_cleared_total' if row['cleared'] else 'settlements_uncleared_total'
+        days[row['day']][key] += row['total']
+
+    expense_rows = (
+        Expense.objects.filter(date__range=(date_from, date_to), unit=unit)
+        .values('date', 'category').annotate(total=Sum('amount')).order_by()
+    )
+    for row in expense_rows:
+        summary = days[row['date']]
+        summary['expenses_total'] += row['total']
+        _add(summary['expenses_by_category'], row['category'], row['total'])
+    return days
+
+
+def unit_day_summary(unit, day):
+    """Totals for one unit's cashbook day (see unit_summaries)."""
+    return unit_summaries(unit, day, day)[day]
+
+
+def expected_cash(unit, summary):
+    if unit.code == 'workshop':
+        materials = summary['settlements_cleared_total'] + summary['settlements_uncleared_total']
+        return summary['payments_total'] - materials - summary['expenses_total']
+    # Only cleared material payments are in the shop till
+    return summary['payments_total'] + summary['settlements_cleared_total'] - summary['expenses_total']
+
+
+def frozen_summary(close):
+    """The summary stored on a close, or None for closes recorded before summaries were frozen."""
+    if close is None or close.summarized_at is None:
+        return None
+    summary = {field: getattr(close, field) for field in SUMMARY_FIELDS}
+    for field in ('payments_by_method', 'expenses_by_category'):
+        summary[field] = {k: Decimal(str(v)) for k, v in summary[field].items()}
+    return summary
+
+
+def day_summary(unit, day, close=None):
+    """(summary, frozen): the frozen close summary if there is one, else computed live."""
+    summary = frozen_summary(close)
+    if summary is not None:
+        return summary, True
+    return unit_day_summary(unit, day), False
+
+
+@transaction.atomic
+def close_day(unit, day, actual_cash, user):
+    """Record (or re-record) the day's close and freeze its summary. Returns (close, created)."""
+    summary = unit_day_summary(unit, day)
+    expected = expected_cash(unit, summary)
+    return DailyCashClose.objects.update_or_create(
+        unit=unit,
+        date=day,
+        defaults={
+            **summary,
+            'expected_cash': expected,
+            'actual_cash': actual_cash,
+            'variance': actual_cash - expected,
+            'closed_by': user,
+            'summarized_at': timezone.now(),
+        },
+    )
+
+
+def freeze_summary(close):
+    """Backfill the summary on an older close without touching its recorded expected/actual cash."""
+    for field, value in unit_day_summary(close.unit, close.date).items():
+        setattr(close, field, value)
+    close.summarized_at = timezone.now()
+    close.save(update_fields=[*SUMMARY_FIELDS, 'summarized_at'])
+    return close
+
+
+def summary_json(summary):
+    """Summary with floats, matching how the cashbook endpoints report money."""
+    data = {}
+    for field, value in summary.items():
+        if isinstance(value, dict):
+            data[field] = {k: float(v) for k, v in value.items()}
+        else:
+            data[field] = float(value)
+    return data
+
+
+def _detail_rows(unit, date_from, date_to):
+    """Individual payments, material payments and expenses in the range (flat values, no models)."""
+    from onyango.models import RepairPayment, TransferSettlement
+
+    if unit.code == 'workshop':
+        payments = RepairPayment.objects.filter(
+            payment_date__date__range=(date_from, date_to), invoice__job__unit=unit,
+        ).values('id', 'amount', 'payment_method', 'method', 'payment_date', job_id=F('invoice__job_id'), cashier_username=F('received_by__username'))
+        settlements = TransferSettlement.objects.filter(transfer_order__to_unit=unit)
+    else:
+        payments = Payment.objects.filter(
+            payment_date__date__range=(date_from, date_to), sale__status='confirmed',
+        ).filter(
+            Q(sale__unit=unit) | Q(sale__unit__isnull=True)
+        ).values('id', 'sale_id', 'payment_method', 'method', 'payment_date', amount=F('amount_paid'), cashier_username=F('cashier__username'))
+        settlements = TransferSettlement.objects.filter(transfer_order__from_unit=unit)
+    settlements = settlements.filter(
+        settlement_date__date__range=(date_from, date_to),
+    ).values('id', 'amount', 'cleared', 'settlement_date', transfer_id=F('transfer_order_id'), cashier_username=F('settled_by__username'))
+    expenses = Expense.objects.filter(
+        date__range=(date_from, date_to), unit=unit,
+    ).values('id', 'date', 'description', 'category', 'amount', recorded_by_username=F('recorded_by__username'))
+
+    def rows(qs, order):
+        for row in qs.order_by(order).iterator(chunk_size=2000):
+            yield {k: float(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+
+    return {
+        'payments': list(rows(payments, 'payment_date')),
+        'material_payments': list(rows(settlements, 'settlement_date')),
+        'expenses': list(rows(expenses, 'date')),
+    }
+
+
+def range_report(unit, date_from, date_to, detail=False):
+    """Per-day cashbook totals with a running balance; frozen closes are used where they exist."""
+    days = unit_summaries(unit, date_from, date_to)
+    closes = {
+        close.date: close
+        for close in DailyCashClose.objects.filter(unit=unit, date__range=(date_from, date_to)).select_related('closed_by')
+    }
+
+    rows, totals, balance = [], _empty_summary(), ZERO
+    for day, summary in days.items():
+        close = closes.get(day)
+        frozen = frozen_summary(close)
+        if frozen is not None:
+            summary = frozen
+        net = expected_cash(unit, summary)
+        balance += net
+        for field, value in summary.items():
+            if isinstance(value, dict):
+                for key, amount in value.items():
+                    _add(totals[field], key, amount)
+            else:
+                totals[field] += value
+        rows.append({
+            'date': day.isoformat(),
+            **summary_json(summary),
+            'net_cash': float(net),
+            'running_balance': float(balance),
+            'frozen': frozen is not None,
+            'close': {
+                'actual_cash': float(close.actual_cash),
+                'variance': float(close.variance),
+                'closed_by': close.closed_by.username if close.closed_by else None,
+            } if close else None,
+        })
+
+    data = {
+        'unit': {'id': unit.id, 'code': unit.code, 'name': unit.name},
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'totals': {**summary_json(totals), 'net_cash': float(balance)},
+        'days': rows,
+    }
+    if detail:
+        data['details'] = _detail_rows(unit, date_from, date_to)
+    return data
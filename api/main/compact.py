@@ -0,0 +1,69 @@
+"""
+Compact list mode for the big grids (?view=compact, or ?fields=a,b,c for a subset).
+Rows come straight from values() with the joins the grid needs, skipping the nested
+serializers the full list uses; retrieve/create/update are unchanged.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import F
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+_DATETIME = serializers.DateTimeField()
+
+
+def _compact_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return _DATETIME.to_representation(value)
+    return value
+
+
+class CompactListMixin:
+    """
+    ViewSet mixin. compact_fields is a sequence of (name, lookup) pairs; lookup is a
+    field path ('category__name') or an expression (Count('items')).
+    """
+    compact_fields = ()
+
+    def get_compact_fields(self):
+        """The (name, lookup) pairs requested, None for a normal list, or a list of unknown names."""
+        params = self.request.query_params
+        requested = params.get('fields')
+        if params.get('view') != 'compact' and not requested:
+            return None
+        if not requested:
+            return list(self.compact_fields)
+        available = dict(self.compact_fields)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise serializers.ValidationError(unknown)
+        return [(name, available[name]) for name in names]
+
+    def list(self, request, *args, **kwargs):
+        try:
+            fields = self.get_compact_fields()
+        except serializers.ValidationError as exc:
+            return Response(
+                {'error': f"Unknown fields: {', '.join(exc.detail)}. Available: {', '.join(n for n, _ in self.compact_fields)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if fields is None:
+            return super().list(request, *args, **kwargs)
+
+        plain = [name for name, lookup in fields if name == lookup]
+        expressions = {
+            name: F(lookup) if isinstance(lookup, str) else lookup
+            for name, lookup in fields if name != lookup
+        }
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*plain, **expressions)
+
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = [{name: _compact_value(row[name]) for name, _ in fields} for row in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,40 @@
+"""
+Run the independent read blocks of a report concurrently from an async view.
+
+Django's async ORM methods (acount, aaggregate, ...) all run on the one thread-sensitive
+executor thread, so awaiting several of them together still executes the queries one after
+another. run_blocks() instead runs each block (a plain sync function doing its queries and
+serialization) on its own worker thread, with that thread's own database connection, and
+awaits them together. Connections are closed after each block unless CONN_MAX_AGE keeps them;
+set CONN_MAX_AGE where the async views are served, or every block pays for a new connection.
+
+Blocks must be read-only: each sees its own connection, not the request's transaction.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def _in_worker(block):
+    def run():
+        close_old_connections()
+        try:
+            return block()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def run_blocks(blocks):
+    """{key: fn} -> {key: fn()}, the blocks running concurrently."""
+    keys = list(blocks)
+    results = await asyncio.gather(*(
+        sync_to_async(_in_worker(blocks[key]), thread_sensitive=False)() for key in keys
+    ))
+    return dict(zip(keys, results))
+
+
+def run_blocks_sync(blocks):
+    """{key: fn} -> {key: fn()}, one block after another on the calling thread."""
+    return {key: block() for key, block in blocks.items()}
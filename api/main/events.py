@@ -0,0 +1,169 @@
+"""
+Domain events. A view emits one typed event per business action with emit(); subscribers (the
+timeline, the workshop activity log, rollups, cache invalidation) are registered in
+AppConfig.ready() and receive the events after the transaction commits.
+
+The events emitted in one transaction reach each subscriber as one batch (one per savepoint when
+nested atomic blocks emit), so a subscriber writes them with a single bulk insert. Events emitted
+inside a block that rolls back are dropped with it; outside a transaction an event is dispatched
+straight away. A subscriber that raises is logged and does not stop the others.
+
+Dispatch is not moved off the request path: the on_commit callback runs the subscribers
+synchronously on the request thread, after the commit and before the response is sent. What the
+bus saves is the per-action inline writes (one bulk insert per subscriber per transaction instead
+of one or two log rows per action). Keeping it in process means the timeline and activity rows
+are not lost when a worker exits with a queue still pending, and the profitability cache is
+already invalidated when the next request reads it.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_subscribers = []
+_local = threading.local()
+
+
+def subscribe(handler):
+    """Register handler(events) for every committed batch of events."""
+    if handler not in _subscribers:
+        _subscribers.append(handler)
+    return handler
+
+
+def dispatch(events):
+    for handler in list(_subscribers):
+        try:
+            handler(events)
+        except Exception:
+            logger.exception("Event subscriber %r failed", handler)
+
+
+class _Batch:
+    def __init__(self, savepoints):
+        self.savepoints = savepoints
+        self.events = []
+
+    def __call__(self):
+        dispatch(self.events)
+
+
+def emit(event):
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        dispatch([event])
+        return
+    savepoints = tuple(connection.savepoint_ids)
+    batch = getattr(_local, 'batch', None)
+    # Join the current batch only at the savepoint it was queued in (rolling that savepoint back
+    # discards its on_commit callback and the events with it) and while that callback is queued
+    if (
+        batch is None or batch.savepoints != savepoints
+        or not any(entry[1] is batch for entry in connection.run_on_commit)
+    ):
+        batch = _local.batch = _Batch(savepoints)
+        transaction.on_commit(batch)
+    batch.events.append(event)
+
+
+@dataclass(kw_only=True)
+class Event:
+    user: Any = None
+
+    def timeline(self):
+        """[(event_type, entity_type, entity_id, description, details), ...] for the timeline."""
+        return []
+
+    def activity(self):
+        """(action, entity_type, entity_id, details) for the workshop activity log, or None."""
+        return None
+
+
+def _payment_entry(sale):
+    if not sale.paid_amount or sale.paid_amount <= 0:
+        return []
+    event_type = 'loan_payment' if getattr(sale, 'is_loan', False) else 'payment_recorded'
+    return [(event_type, 'payment', None, f"Payment TZS {sale.paid_amount} for Sale #{sale.id}", {'sale_id': sale.id, 'amount': str(sale.paid_amount)})]
+
+
+# ---------- Shop ----------
+@dataclass(kw_only=True)
+class SaleCompleted(Event):
+    """A POS sale, or a sale from a confirmed order (order_id set)."""
+    sale: Any
+    order_id: int = None
+
+    def timeline(self):
+        sale = self.sale
+        entries = []
+        if self.order_id:
+            entries.append(('order_confirmed', 'order', self.order_id, f"Order #{self.order_id} confirmed → Sale #{sale.id}", {'order_id': self.order_id, 'sale_id': sale.id}))
+        entries.append(('sale_created', 'sale', sale.id, f"Sale #{sale.id} - TZS {sale.final_amount} ({sale.get_payment_status_display()})", {'amount': str(sale.final_amount), 'payment_status': sale.payment_status, 'is_loan': sale.is_loan}))
+        return entries + _payment_entry(sale)
+
+
+@dataclass(kw_only=True)
+class PaymentRecorded(Event):
+    payment: Any
+
+    def timeline(self):
+        payment = self.payment
+        event_type = 'loan_payment' if getattr(payment.sale, 'is_loan', False) else 'payment_recorded'
+        return [(event_type, 'payment', payment.id, f"Payment TZS {payment.amount_paid} for Sale #{payment.sale_id} ({payment.payment_method or 'N/A'})", {'payment_id': payment.id, 'sale_id': payment.sale_id, 'amount': str(payment.amount_paid)})]
+
+
+@dataclass(kw_only=True)
+class LoanPaymentRecorded(Event):
+    sale_id: int
+    amount: Any
+
+    def timeline(self):
+        return [('loan_payment', 'payment', None, f"Loan payment TZS {self.amount} for Sale #{self.sale_id}", {'sale_id': self.sale_id, 'amount': str(self.amount)})]
+
+
+@dataclass(kw_only=True)
+class OrderCreated(Event):
+    order: Any
+
+    def timeline(self):
+        order = self.order
+        return [('order_created', 'order', order.id, f"Order #{order.id} created ({order.get_order_type_display()})", {'order_id': order.id, 'status': order.status})]
+
+
+@dataclass(kw_only=True)
+class OrderRejected(Event):
+    order_id: int
+
+    def timeline(self):
+        return [('order_rejected', 'order', self.order_id, f"Order #{self.order_id} rejected", {'order_id': self.order_id})]
+
+
+@dataclass(kw_only=True)
+class RefundCreated(Event):
+    refund: Any
+
+    def timeline(self):
+        refund = self.refund
+        return [('refund_created', 'refund', refund.id, f"Refund #{refund.id} - TZS {refund.total_refund_amount} for Sale #{refund.sale_id}", {'refund_id': refund.id, 'sale_id': refund.sale_id, 'amount': str(refund.total_refund_amount)})]
+
+
+@dataclass(kw_only=True)
+class ExpenseRecorded(Event):
+    expense: Any
+
+    def timeline(self):
+        expense = self.expense
+        return [('expense_created', 'expense', expense.id, f"Expense: {expense.description} - TZS {expense.amount} ({expense.get_category_display()})", {'expense_id': expense.id, 'amount': str(expense.amount), 'category': expense.category})]
+
+
+@dataclass(kw_only=True)
+class ProductsImported(Event):
+    report: dict
+
+    def timeline(self):
+        report = self.report
+        return [('stock_adjusted', 'product', None, f"Product import: {report['created']} created, {report['updated']} updated", {'created': report['created'], 'updated': report['updated'], 'categories_created': report['categories_created']})]
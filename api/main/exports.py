@@ -0,0 +1,140 @@
+"""
+CSV / XLSX exports for list and report endpoints (?format=csv or ?format=xlsx).
+Rows are read with values_list() over .iterator(chunk_size=...), so a multi-year export
+never holds more than one chunk of rows in memory.
+
+Only CSV is streamed: rows go to the client as they are read. XLSX is a zip whose parts are
+assembled when the workbook is saved, so the export is written to a temporary file first (a
+write-only workbook spills rows to disk as they are appended) and sent once it is complete.
+"""
+import csv
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_CHUNK_SIZE = 2000
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Lets ?format=csv pass DRF content negotiation. Exports bypass rendering (they stream);
+    anything else returned under this format, e.g. a validation error, is rendered as JSON.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data, renderer_context=renderer_context)
+
+
+class XLSXRenderer(CSVRenderer):
+    media_type = XLSX_CONTENT_TYPE
+    format = 'xlsx'
+
+
+EXPORT_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, CSVRenderer, XLSXRenderer]
+
+
+def export_format(request):
+    """'csv' / 'xlsx' when the request asks for an export, else None."""
+    fmt = (request.query_params.get('format') or '').lower()
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+class _Echo:
+    """File-like object whose write() hands the row back, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def _local(value):
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    value = _local(value)
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def stream_export(queryset, columns, filename, fmt):
+    """
+    Stream queryset as CSV or XLSX. columns is a sequence of (header, lookup) pairs;
+    lookups may be field paths ('customer__name') or annotation names on the queryset.
+    """
+    headers = [header for header, _ in columns]
+    rows = (
+        queryset.prefetch_related(None)
+        .values_list(*[lookup for _, lookup in columns])
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    return export_rows(headers, rows, filename, fmt)
+
+
+def export_rows(headers, rows, filename, fmt):
+    """Stream an iterable of row sequences (one value per header) as CSV or XLSX."""
+    if fmt == 'xlsx':
+        return _xlsx_response(headers, rows, filename)
+
+    writer = csv.writer(_Echo())
+
+    def generate():
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow([_csv_cell(v) for v in row])
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def _xlsx_response(headers, rows, filename):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        return Response(
+            {'error': 'XLSX export is not available on this server (openpyxl is not installed). Use format=csv.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    # Not streamed (see the module docstring): write_only workbooks flush rows to disk as
+    # they are appended, and the finished file is sent from a temporary file
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(headers)
+    for row in rows:
+        ws.append([_local(v) for v in row])
+    tmp = tempfile.TemporaryFile()
+    wb.save(tmp)
+    tmp.seek(0)
+    return FileResponse(tmp, as_attachment=True, filename=f'{filename}.xlsx', content_type=XLSX_CONTENT_TYPE)
+
+
+class ExportMixin:
+    """
+    ViewSet mixin: list() streams the filtered queryset when ?format=csv|xlsx is given.
+    Set export_columns to (header, lookup) pairs and export_filename.
+    """
+    renderer_classes = EXPORT_RENDERER_CLASSES
+    export_columns = ()
+    export_filename = 'export'
+
+    def list(self, request, *args, **kwargs):
+        fmt = export_format(request)
+        if fmt:
+            queryset = self.filter_queryset(self.get_queryset())
+            return stream_export(queryset, self.export_columns, self.export_filename, fmt)
+        return super().list(request, *args, **kwargs)
@@ -0,0 +1,199 @@
+"""
+Live dashboard feed (dashboard/stream/, Server-Sent Events over coreshop/asgi.py).
+
+publish_events() is a domain-event subscriber (main/events.py): after commit it turns sales,
+payments, repair status changes and products crossing their low-stock threshold into compact
+deltas and hands them to the process-wide LiveFeed. Stream clients wait on the feed without
+touching the database; dashboards apply the deltas instead of polling and re-aggregating.
+
+The feed lives in process memory: a client sees the deltas of requests served by the same
+server process, so run the ASGI server with a single worker process (threads are fine) while
+the feed is in use. Every delta goes into a ring buffer, connected client or not, so a
+reconnecting EventSource resumes from Last-Event-ID; a client whose Last-Event-ID is older
+than the buffer (or from before a restart) gets a `resync` event and should reload the
+dashboard. The low-stock lookups are skipped while no client is connected.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from django.db.models import F
+
+BUFFER_SIZE = 500
+KEEPALIVE_SECONDS = 15
+RETRY_MS = 5000
+DELTA_TYPES = ('sale', 'payment', 'repair_status', 'low_stock')
+
+
+class LiveFeed:
+    def __init__(self, size=BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self._deltas = deque(maxlen=size)
+        # Ids start from the clock so a client resuming after a restart does not skip new ones
+        self._last_id = int(time.time() * 1000)
+        self._waiters = set()
+        self.clients = 0
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, deltas):
+        """Append deltas (dicts with a 'type') and wake every waiting client. Thread-safe."""
+        if not deltas:
+            return
+        with self._lock:
+            for delta in deltas:
+                self._last_id += 1
+                self._deltas.append((self._last_id, delta))
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def since(self, last_id):
+        """
+        [(id, delta), ...] after last_id, or None when some of them are no longer buffered
+        (evicted, or last_id is from another run of the server).
+        """
+        with self._lock:
+            first_id = self._deltas[0][0] if self._deltas else self._last_id + 1
+            if last_id < first_id - 1 or last_id > self._last_id:
+                return None
+            return [(i, d) for i, d in self._deltas if i > last_id]
+
+    async def wait(self, last_id, timeout):
+        """since(last_id), waiting up to timeout seconds for some deltas ([] on timeout)."""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            pending = self.since(last_id)
+            if pending is None or pending:
+                return pending
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            return self.since(last_id)
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+feed = LiveFeed()
+
+
+def _money(value):
+    return float(value) if value is not None else None
+
+
+def _low_stock_crossings(taken):
+    """Deltas for products that {product_id: quantity taken} pushed to or below their threshold."""
+    from .models import Product
+
+    if taken is None:
+        return []
+    taken = {pk: qty for pk, qty in taken.items() if pk and qty}
+    if not taken:
+        return []
+    rows = Product.objects.filter(pk__in=list(taken), quantity_in_stock__lte=F('threshold')).values(
+        'id', 'name', 'unit_id', 'quantity_in_stock', 'threshold',
+    )
+    return [
+        {
+            'type': 'low_stock',
+            'product_id': row['id'],
+            'name': row['name'],
+            'unit_id': row['unit_id'],
+            'quantity_in_stock': float(row['quantity_in_stock']),
+            'threshold': row['threshold'],
+        }
+        for row in rows
+        if row['quantity_in_stock'] + taken[row['id']] > row['threshold']
+    ]
+
+
+def _taken(lines):
+    """{product_id: quantity} from (product_id, quantity) rows."""
+    taken = {}
+    for product_id, quantity in lines.values_list('product_id', 'quantity'):
+        taken[product_id] = taken.get(product_id, 0) + quantity
+    return taken
+
+
+def _deltas(event, with_stock):
+    from onyango import events as workshop
+    from . import events as shop
+
+    if isinstance(event, shop.SaleCompleted):
+        sale = event.sale
+        return [{
+            'type': 'sale',
+            'sale_id': sale.id,
+            'unit_id': sale.unit_id,
+            'amount': _money(sale.final_amount),
+            'paid': _money(sale.paid_amount),
+            'payment_status': sale.payment_status,
+            'is_loan': sale.is_loan,
+        }] + _low_stock_crossings(_taken(sale.items) if with_stock else None)
+    if isinstance(event, shop.PaymentRecorded):
+        payment = event.payment
+        return [{'type': 'payment', 'sale_id': payment.sale_id, 'amount': _money(payment.amount_paid), 'method': payment.method}]
+    if isinstance(event, shop.LoanPaymentRecorded):
+        return [{'type': 'payment', 'sale_id': event.sale_id, 'amount': _money(event.amount), 'loan': True}]
+    if isinstance(event, workshop.RepairPaymentRecorded):
+        payment = event.payment
+        return [{'type': 'payment', 'repair_job_id': payment.invoice.job_id, 'amount': _money(payment.amount), 'method': payment.method}]
+    if isinstance(event, workshop.RepairJobCreated):
+        return [{'type': 'repair_status', 'job_id': event.job.id, 'status': event.job.status, 'assigned_to': event.job.assigned_to_id}]
+    if isinstance(event, workshop.RepairJobCompleted):
+        return [{'type': 'repair_status', 'job_id': event.job_id, 'status': 'completed'}]
+    if isinstance(event, workshop.RepairJobCollected):
+        return [{'type': 'repair_status', 'job_id': event.job_id, 'status': 'collected'}]
+    if isinstance(event, workshop.MaterialRequestApproved):
+        return _low_stock_crossings(_taken(event.transfer.lines) if with_stock else None)
+    return []
+
+
+def publish_events(events):
+    """Event subscriber: publish the live deltas of a committed batch (low stock only with clients)."""
+    with_stock = feed.clients > 0
+    feed.publish([delta for event in events for delta in _deltas(event, with_stock)])
+
+
+def format_resync(delta_id):
+    return f"id: {delta_id}\nevent: resync\ndata: {{}}\n\n"
+
+
+def format_sse(delta_id, delta):
+    return f"id: {delta_id}\nevent: {delta['type']}\ndata: {json.dumps(delta, separators=(',', ':'))}\n\n"
+
+
+async def stream(last_id, types=None, keepalive=KEEPALIVE_SECONDS):
+    """
+    SSE body: replay from last_id (None = only new deltas), then push deltas as they arrive.
+    When deltas after last_id are gone from the buffer, send `resync` and carry on from now.
+    """
+    feed.clients += 1
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if last_id is None:
+            last_id = feed.last_id
+        while True:
+            deltas = await feed.wait(last_id, keepalive)
+            if deltas is None:
+                last_id = feed.last_id
+                yield format_resync(last_id)
+                continue
+            if not deltas:
+                yield ": keepalive\n\n"
+                continue
+            last_id = deltas[-1][0]
+            body = ''.join(format_sse(i, d) for i, d in deltas if types is None or d['type'] in types)
+            if body:
+                yield body
+    finally:
+        feed.clients -= 1
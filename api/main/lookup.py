@@ -0,0 +1,109 @@
+"""
+Process-local code -> product cache for POS scanning (products/lookup/?code=).
+
+Rows are cached on first scan. Saves and deletes in this process evict the product at once
+(signals wired in MainConfig.ready); changes made by other workers or through .update() are
+picked up by a delta read on Product.updated_at / ProductTombstone.deleted_at, at most once
+every LOOKUP_REFRESH_SECONDS. A hit inside that window costs no query at all.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Product, ProductTombstone
+
+LOOKUP_REFRESH_SECONDS = 1.0
+# Re-read a little behind the watermark so rows committed late (saved before, committed after
+# the last delta read) are not missed.
+LOOKUP_SYNC_OVERLAP = timedelta(seconds=5)
+LOOKUP_FIELDS = ('id', 'code', 'name', 'selling_price', 'wholesale_price', 'quantity_in_stock', 'unit_id')
+
+
+def _row(values):
+    return {
+        'id': values['id'],
+        'code': values['code'],
+        'name': values['name'],
+        'price': str(values['selling_price']),
+        'wholesale_price': str(values['wholesale_price']),
+        'stock': str(values['quantity_in_stock']),
+        'unit': values['unit_id'],
+    }
+
+
+class ProductCodeCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_code = {}
+        self._code_by_id = {}
+        self._synced_at = None  # DB watermark of the last delta read
+        self._checked = 0.0  # monotonic time of the last delta read
+
+    def clear(self):
+        with self._lock:
+            self._by_code.clear()
+            self._code_by_id.clear()
+            self._synced_at = None
+
+    def evict_ids(self, ids):
+        with self._lock:
+            self._evict(ids)
+
+    def _evict(self, ids):
+        for product_id in ids:
+            code = self._code_by_id.pop(product_id, None)
+            if code is not None:
+                self._by_code.pop(code, None)
+
+    def _store(self, values):
+        row = _row(values)
+        old_code = self._code_by_id.get(row['id'])
+        if old_code is not None and old_code != row['code']:
+            self._by_code.pop(old_code, None)
+        if row['code']:
+            self._by_code[row['code']] = row
+            self._code_by_id[row['id']] = row['code']
+
+    def _refresh(self):
+        if time.monotonic() - self._checked < LOOKUP_REFRESH_SECONDS:
+            return
+        started = timezone.now()
+        changed, deleted = [], []
+        if self._synced_at is not None and self._code_by_id:
+            since = self._synced_at - LOOKUP_SYNC_OVERLAP
+            changed = list(Product.objects.filter(updated_at__gte=since).values(*LOOKUP_FIELDS))
+            deleted = list(ProductTombstone.objects.filter(deleted_at__gte=since).values_list('product_id', flat=True))
+        # The delta and the watermark it was read up to are applied together, so a concurrent
+        # refresh never sees the new watermark with the old rows
+        with self._lock:
+            for values in changed:
+                if values['id'] in self._code_by_id:
+                    self._store(values)
+            self._evict(deleted)
+            self._synced_at = started
+            self._checked = time.monotonic()
+
+    def get_many(self, codes):
+        """{code: row} for the codes that exist; unknown codes are simply absent."""
+        self._refresh()
+        found = {code: self._by_code[code] for code in codes if code in self._by_code}
+        missing = [code for code in codes if code not in found]
+        if missing:
+            rows = Product.objects.filter(code__in=missing).values(*LOOKUP_FIELDS)
+            with self._lock:
+                for values in rows:
+                    self._store(values)
+                    found[values['code']] = self._by_code[values['code']]
+        return found
+
+    def get(self, code):
+        return self.get_many([code]).get(code)
+
+
+product_code_cache = ProductCodeCache()
+
+
+def evict_product(sender, instance, **kwargs):
+    product_code_cache.evict_ids([instance.pk])
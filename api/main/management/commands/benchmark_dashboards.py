@@ -0,0 +1,101 @@
+import asyncio
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+# name: (sync path, async path)
+ENDPOINTS = {
+    'unit-overview': ('/api/admin/unit-overview/', '/api/admin/unit-overview/async/'),
+    'onyango-dashboard': ('/api/onyango/dashboard/', '/api/onyango/dashboard/async/'),
+}
+
+
+async def _get(app, path, token):
+    """One GET through the ASGI application; returns the response status."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'cookie', f'access_token={token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+    done = asyncio.Event()
+    received = False
+    response = {}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client stays connected until the response is complete
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            done.set()
+
+    await app(scope, receive, send)
+    return response.get('status')
+
+
+async def _load(app, path, token, concurrency, total):
+    """total GETs with at most concurrency in flight: (latencies in ms, failures, wall seconds)."""
+    latencies, failures = [], 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal failures
+        async with slots:
+            started = time.perf_counter()
+            status = await _get(app, path, token)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies, failures, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare end-to-end latency of the sync dashboard views with their async variants under "
+        "concurrent load, driving coreshop/asgi.py in process (no network or server overhead)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="User to authenticate as (cashier or admin for unit-overview)")
+        parser.add_argument('--concurrency', type=int, default=10, help="Requests in flight at once")
+        parser.add_argument('--requests', type=int, default=100, help="Requests per variant")
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), action='append', help="Endpoint(s) to run (default: all)")
+
+    def handle(self, *args, **options):
+        from coreshop.asgi import application
+
+        user = get_user_model().objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']!r}.")
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be at least 1.")
+        token = str(AccessToken.for_user(user))
+        concurrency, total = options['concurrency'], options['requests']
+
+        self.stdout.write(f"{total} requests per variant, {concurrency} concurrent")
+        self.stdout.write(f"{'endpoint':<20} {'variant':<6} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8} {'req/s':>8}  failed")
+        for name in options['endpoint'] or sorted(ENDPOINTS):
+            for variant, path in zip(('sync', 'async'), ENDPOINTS[name]):
+                asyncio.run(_get(application, path, token))  # warm up
+                latencies, failures, wall = asyncio.run(_load(application, path, token, concurrency, total))
+                latencies.sort()
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                self.stdout.write(
+                    f"{name:<20} {variant:<6} {statistics.mean(latencies):>7.1f}ms {statistics.median(latencies):>7.1f}ms "
+                    f"{p95:>7.1f}ms {latencies[-1]:>7.1f}ms {total / wall:>8.1f}  {failures}"
+                )
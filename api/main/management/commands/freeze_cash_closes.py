@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main.cashbook import freeze_summary
+from main.models import DailyCashClose
+
+
+class Command(BaseCommand):
+    help = "Backfill the frozen day summary on cash closes recorded before summaries existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute every close, not only unsummarized ones")
+
+    def handle(self, *args, **options):
+        closes = DailyCashClose.objects.select_related('unit').order_by('date')
+        if not options['all']:
+            closes = closes.filter(summarized_at__isnull=True)
+        count = 0
+        for close in closes.iterator():
+            freeze_summary(close)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Froze {count} cash close summary(ies)"))
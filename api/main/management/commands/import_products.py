@@ -0,0 +1,44 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from main.product_import import import_products, read_rows, ImportFormatError
+
+
+class Command(BaseCommand):
+    help = "Bulk create / reprice products from a CSV or JSON file, keyed on product code."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (header row) or JSON (list of objects) file")
+        parser.add_argument('--dry-run', action='store_true', help="Validate and print the diff without writing")
+        parser.add_argument('--user', help="Username recorded on the stock entries")
+        parser.add_argument('--diff', action='store_true', help="Print the per-product diff")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = get_user_model().objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user '{options['user']}'.")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                report, ok = import_products(read_rows(f, options['path']), user=user, dry_run=options['dry_run'])
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+
+        if not ok:
+            for error in report['errors']:
+                self.stderr.write(f"row {error['row']} ({error.get('code') or '-'}): {json.dumps(error['errors'])}")
+            raise CommandError(f"{len(report['errors'])} invalid row(s); nothing imported.")
+
+        if options['diff'] or options['dry_run']:
+            for diff in report['diffs']:
+                changes = ', '.join(f"{field}: {c['old']} -> {c['new']}" for field, c in diff['changes'].items())
+                self.stdout.write(f"{diff['action']} {diff['code']}: {changes}")
+        prefix = "[dry run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{report['rows']} rows: {report['created']} created, {report['updated']} updated, "
+            f"{report['unchanged']} unchanged, {len(report['categories_created'])} new categories"
+        ))
@@ -0,0 +1,37 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import report_jobs
+
+
+class Command(BaseCommand):
+    help = "Worker for queued reports (reports/jobs/). Runs until stopped, or once with --once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run every queued job, then exit")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument(
+            '--stale-minutes', type=int, default=int(report_jobs.STALE_AFTER.total_seconds() // 60),
+            help="Requeue running jobs older than this (their worker died)",
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options['stale_minutes'])
+        requeued = report_jobs.requeue_stale(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        while True:
+            close_old_connections()
+            job = report_jobs.claim_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+            started = time.monotonic()
+            report_jobs.run_job(job)
+            self.stdout.write(f"{job} in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,83 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from main.models import Payment, Sale
+from onyango.models import RepairInvoice, RepairPayment, TransferBalance, TransferOrder, TransferSettlement
+
+
+def _sum_of(model, fk, field):
+    total = (
+        model.objects.filter(**{fk: OuterRef('pk')}).order_by()
+        .values(fk).annotate(total=Sum(field)).values('total')
+    )
+    return Coalesce(Subquery(total), Value(Decimal('0')), output_field=DecimalField(max_digits=20, decimal_places=2))
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute sale paid_amount, repair invoice paid_amount and transfer settled_amount from "
+        "their payments, and the per unit pair transfer balances from the open transfers, and "
+        "report drift from the incrementally maintained totals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rewrite drifted totals (and their statuses)")
+
+    def handle(self, *args, **options):
+        checks = (
+            ('Sale', Sale, 'paid_amount', _sum_of(Payment, 'sale', 'amount_paid')),
+            ('RepairInvoice', RepairInvoice, 'paid_amount', _sum_of(RepairPayment, 'invoice', 'amount')),
+            ('TransferOrder', TransferOrder, 'settled_amount', _sum_of(TransferSettlement, 'transfer_order', 'amount')),
+        )
+        drifted_total = 0
+        for label, model, field, actual in checks:
+            drifted = list(
+                model.objects.annotate(actual=actual).exclude(**{field: F('actual')})
+                .order_by('pk').values_list('pk', field, 'actual')
+            )
+            drifted_total += len(drifted)
+            for pk, stored, expected in drifted:
+                self.stdout.write(f"{label} #{pk}: stored {stored}, payments sum {expected} (drift {stored - expected})")
+            if options['fix'] and drifted:
+                self._fix(model, field, drifted)
+            self.stdout.write(f"{label}: {len(drifted)} drifted")
+        drifted_total += self._check_transfer_balances(options['fix'])
+
+        if not drifted_total:
+            self.stdout.write(self.style.SUCCESS("All totals match their payments"))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {drifted_total} total(s)"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{drifted_total} total(s) drifted; rerun with --fix to rewrite them"))
+
+    def _fix(self, model, field, drifted):
+        # Apply the difference through the same increment path the payments use, so statuses follow
+        add = 'add_settled_amount' if model is TransferOrder else 'add_paid_amount'
+        deltas = {pk: expected - stored for pk, stored, expected in drifted}
+        for obj in model.objects.filter(pk__in=list(deltas)).order_by('pk'):
+            getattr(obj, add)(deltas[obj.pk])
+
+    def _check_transfer_balances(self, fix):
+        expected = TransferBalance.expected()
+        stored = {
+            (b.from_unit_id, b.to_unit_id): b
+            for b in TransferBalance.objects.all()
+        }
+        drifted = []
+        for pair in set(expected) | set(stored):
+            count, outstanding = expected.get(pair, (0, Decimal('0')))
+            balance = stored.get(pair)
+            have = (balance.open_count, balance.outstanding) if balance else (0, Decimal('0'))
+            if have != (count, outstanding):
+                drifted.append(pair)
+                self.stdout.write(
+                    f"TransferBalance {pair[0]} -> {pair[1]}: stored {have[0]} open / {have[1]}, "
+                    f"transfers {count} open / {outstanding}"
+                )
+        if fix:
+            TransferBalance.recount(drifted, expected)
+        self.stdout.write(f"TransferBalance: {len(drifted)} drifted")
+        return len(drifted)
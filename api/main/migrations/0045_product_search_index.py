@@ -0,0 +1,72 @@
+# Full-text product search (main/search.py): SQLite FTS5 trigram index over name, code and
+# category name, kept in sync by triggers. Skipped on other backends or SQLite builds without
+# FTS5; search then falls back to icontains.
+
+from django.db import migrations, OperationalError
+
+FTS_TABLE = 'main_product_fts'
+
+ROW_VALUES = (
+    "new.id, new.name, coalesce(new.code, ''), "
+    "coalesce((SELECT name FROM main_category WHERE id = new.category_id), '')"
+)
+
+CREATE_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, code, category, tokenize='trigram')",
+    f"""INSERT INTO {FTS_TABLE}(rowid, name, code, category)
+        SELECT p.id, p.name, coalesce(p.code, ''), coalesce(c.name, '')
+        FROM main_product p LEFT JOIN main_category c ON c.id = p.category_id""",
+    f"""CREATE TRIGGER main_product_fts_ai AFTER INSERT ON main_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, code, category) VALUES ({ROW_VALUES});
+    END""",
+    f"""CREATE TRIGGER main_product_fts_au AFTER UPDATE OF name, code, category_id ON main_product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, name, code, category) VALUES ({ROW_VALUES});
+    END""",
+    f"""CREATE TRIGGER main_product_fts_ad AFTER DELETE ON main_product BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER main_category_fts_au AFTER UPDATE OF name ON main_category BEGIN
+        UPDATE {FTS_TABLE} SET category = new.name
+        WHERE rowid IN (SELECT id FROM main_product WHERE category_id = new.id);
+    END""",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS main_category_fts_au",
+    "DROP TRIGGER IF EXISTS main_product_fts_ad",
+    "DROP TRIGGER IF EXISTS main_product_fts_au",
+    "DROP TRIGGER IF EXISTS main_product_fts_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SQL[0])
+        except OperationalError:
+            return  # no FTS5 / trigram tokenizer in this SQLite build
+        for sql in CREATE_SQL[1:]:
+            cursor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0044_product_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
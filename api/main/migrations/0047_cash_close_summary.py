@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:05
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0046_report_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='expenses_by_category',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='expenses_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='loan_repayments_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='payments_by_method',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='payments_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='settlements_cleared_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='settlements_uncleared_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailycashclose',
+            name='summarized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from main.migrations._payment_methods_0048 import normalize_payment_method
+
+
+def backfill_method(apps, schema_editor):
+    # One UPDATE per distinct free-text value, not per payment
+    Payment = apps.get_model('main', 'Payment')
+    raw_values = Payment.objects.values_list('payment_method', flat=True).distinct().order_by()
+    for raw in list(raw_values):
+        method = normalize_payment_method(raw)
+        if method != 'other':
+            Payment.objects.filter(payment_method=raw).update(method=method)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0047_cash_close_summary'),
+        ('onyango', '0005_payment_method'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MobileMoneyTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=50, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('occurred_at', models.DateTimeField()),
+                ('sender', models.CharField(blank=True, max_length=150)),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('matched_at', models.DateTimeField(blank=True, null=True)),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-occurred_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='method',
+            field=models.CharField(choices=[('cash', 'Cash'), ('mobile_money', 'Mobile money'), ('card', 'Card'), ('bank', 'Bank transfer'), ('refund', 'Refund'), ('other', 'Other')], default='other', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['method', 'amount_paid', 'payment_date'], name='payment_method_match_idx'),
+        ),
+        migrations.AddField(
+            model_name='mobilemoneytransaction',
+            name='imported_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='mobilemoneytransaction',
+            name='payment',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mobile_money_transaction', to='main.payment'),
+        ),
+        migrations.AddField(
+            model_name='mobilemoneytransaction',
+            name='repair_payment',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mobile_money_transaction', to='onyango.repairpayment'),
+        ),
+        migrations.AddIndex(
+            model_name='mobilemoneytransaction',
+            index=models.Index(fields=['amount', 'occurred_at'], name='momo_amount_time_idx'),
+        ),
+        migrations.RunPython(backfill_method, migrations.RunPython.noop),
+    ]
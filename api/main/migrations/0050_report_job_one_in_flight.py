@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:53
+
+from django.db import migrations, models
+
+
+def fail_duplicate_in_flight(apps, schema_editor):
+    """Keep the oldest queued/running job per params_key; fail the others so the constraint applies."""
+    ReportJob = apps.get_model('main', 'ReportJob')
+    kept = {}
+    for job_id, key in ReportJob.objects.filter(status__in=('queued', 'running')).order_by('created_at', 'id').values_list('id', 'params_key'):
+        if key in kept:
+            ReportJob.objects.filter(id=job_id).update(status='failed', error=f"Duplicate of report job #{kept[key]}.")
+        else:
+            kept[key] = job_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0049_refund_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_in_flight, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('queued', 'running'))), fields=('params_key',), name='report_job_one_in_flight'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+"""
+Frozen copy of main/payment_methods.normalize_payment_method as of migrations
+main 0048 / onyango 0005, which backfill `method` with it. Do not edit or import app
+code here: later changes to the live mapping must not change what those migrations do.
+"""
+import re
+
+_ALIASES = {
+    'cash': 'cash',
+    'mobile_money': 'mobile_money',
+    'mobile': 'mobile_money',
+    'mobilemoney': 'mobile_money',
+    'momo': 'mobile_money',
+    'mpesa': 'mobile_money',
+    'm_pesa': 'mobile_money',
+    'tigopesa': 'mobile_money',
+    'tigo_pesa': 'mobile_money',
+    'tigo': 'mobile_money',
+    'mixx': 'mobile_money',
+    'airtel': 'mobile_money',
+    'airtel_money': 'mobile_money',
+    'halopesa': 'mobile_money',
+    'halo_pesa': 'mobile_money',
+    'card': 'card',
+    'credit_card': 'card',
+    'debit_card': 'card',
+    'visa': 'card',
+    'mastercard': 'card',
+    'pos': 'card',
+    'bank': 'bank',
+    'bank_transfer': 'bank',
+    'transfer': 'bank',
+    'eft': 'bank',
+    'cheque': 'bank',
+    'check': 'bank',
+    'refund': 'refund',
+}
+
+
+def normalize_payment_method(raw):
+    """Map a free-text payment method ('M-Pesa', 'Tigo Pesa', 'VISA', ...) to a PAYMENT_METHODS key."""
+    if not raw:
+        return 'other'
+    key = re.sub(r'[^a-z0-9]+', '_', str(raw).strip().lower()).strip('_')
+    return _ALIASES.get(key) or _ALIASES.get(key.replace('_', '')) or 'other'
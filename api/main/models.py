@@ -2,8 +2,14 @@ from decimal import Decimal
 from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual, LessThan
 from django.conf import settings
 from datetime import timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .payment_methods import PAYMENT_METHODS, normalize_payment_method
 
 # ----------------------------
 # Unit (Onyango: Shop vs Workshop)
@@ -96,7 +102,7 @@ class Product(models.Model):
     quantity_in_stock = models.DecimalField(max_digits=20, decimal_places=2, default=0)
     threshold = models.IntegerField(default=5, help_text="Minimum quantity before stock is considered low.")
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # catalog sync watermark
     _created_by = None  # temp holder for auto stock entry
 
     def __str__(self):
@@ -167,6 +173,16 @@ class StockEntry(models.Model):
         return f"{self.get_entry_type_display()} - {self.quantity} units of {self.product.name}"
 
 
+class ProductTombstone(models.Model):
+    """Deleted product ids, so catalog sync (products/sync/?since=) can tell tills what to drop."""
+    product_id = models.PositiveIntegerField()
+    code = models.CharField(max_length=50, blank=True, null=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Product #{self.product_id} deleted {self.deleted_at}"
+
+
 # ----------------------------
 # Order & OrderItems (Created by staff, pending cashier confirmation)
 # ----------------------------
@@ -349,15 +365,44 @@ class Sale(models.Model):
             self.payment_status = 'pending'
 
         super().save(*args, **kwargs)
+
+    def add_paid_amount(self, amount):
+        """Apply a payment (negative to reverse one) with a single UPDATE; payments are not re-read."""
+        paid = F('paid_amount') + Value(amount)
+        Sale.objects.filter(pk=self.pk).update(
+            payment_status=sale_payment_status(paid),
+            paid_amount=paid,
+            updated_at=timezone.now(),
+        )
+        self.refresh_from_db(fields=['paid_amount', 'payment_status', 'updated_at'])
+
     def update_paid_amount(self):
-        # Recalculate paid amount based on Payment entries
-        self.paid_amount = sum(p.amount_paid for p in self.payments.all())
+        # Recalculate paid amount from all Payment entries (payments themselves use add_paid_amount)
+        self.paid_amount = self.payments.aggregate(total=Coalesce(Sum('amount_paid'), Value(Decimal('0'))))['total']
         self.save()
 
     def __str__(self):
         return f"Sale #{self.id} - {self.final_amount} TZS"
 
 
+def sale_payment_status(paid):
+    """
+    Sale.payment_status as a SQL expression of the paid amount (same rules as Sale.save).
+
+    In an UPDATE that also changes paid_amount, pass the new amount as `paid` and list the
+    status before paid_amount: MySQL evaluates SET clauses left to right, so a status listed
+    after would see the already-updated column. The repair invoice and transfer order
+    conditional updates follow the same order.
+    """
+    final = F('final_amount')
+    return Case(
+        When(GreaterThanOrEqual(paid, final) & GreaterThan(final, 0), then=Value('paid')),
+        When(GreaterThan(paid, 0) & LessThan(paid, final), then=Value('partial')),
+        When(Exact(paid, 0), then=Value('not_paid')),
+        default=Value('pending'),
+    )
+
+
 class SaleItem(models.Model):
     sale = models.ForeignKey(Sale, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
@@ -382,52 +427,69 @@ class Payment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     cashier = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     payment_method = models.CharField(max_length=50, blank=True, null=True)
+    # Normalized from payment_method on save (see payment_methods.py)
+    method = models.CharField(max_length=20, choices=PAYMENT_METHODS, default='other', editable=False)
+
+    class Meta:
+        indexes = [
+            # Mobile-money statement matching: method + exact amount + time window
+            models.Index(fields=['method', 'amount_paid', 'payment_date'], name='payment_method_match_idx'),
+        ]
 
     def __str__(self):
         return f"{self.amount_paid} TZS for Sale #{self.sale.id}"
 
     def save(self, *args, **kwargs):
-        is_new = self._state.adding  # Only trigger update when creating, not updating
-        super().save(*args, **kwargs)
-        if is_new:
-            self.sale.update_paid_amount()
+        self.method = normalize_payment_method(self.payment_method)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'payment_method' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'method'}
+        with transaction.atomic():
+            delta = self._amount_delta(update_fields)
+            super().save(*args, **kwargs)
+            if delta:
+                self.sale.add_paid_amount(delta)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.sale.add_paid_amount(-self.amount_paid)
+        return result
+
+    def _amount_delta(self, update_fields):
+        if self._state.adding:
+            return self.amount_paid
+        if update_fields is not None and 'amount_paid' not in update_fields:
+            return 0
+        previous = Payment.objects.filter(pk=self.pk).values_list('amount_paid', flat=True).first()
+        return self.amount_paid - (previous or 0)
 
 
 # ----------------------------
 # Refunds
 # ----------------------------
 class Refund(models.Model):
+    """Money and stock returned for a sale; created by main.refunds.create_refund (whole sale or per line)."""
     sale = models.ForeignKey(Sale, related_name="refunds", on_delete=models.CASCADE)
     refunded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     refund_date = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     total_refund_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
 
-    def save(self, *args, **kwargs):
-        # Auto set refund amount to the paid amount of the sale
-        self.total_refund_amount = self.sale.paid_amount
-        super().save(*args, **kwargs)
-        # Update sale status and refund total (once)
-        self.sale.status = 'refunded'
-        self.sale.payment_status = 'refunded'
-        self.sale.refund_total = (self.sale.refund_total or 0) + self.total_refund_amount
-        self.sale.save()
-        # Log reverse payment (single negative payment)
-        Payment.objects.create(
-            sale=self.sale,
-            amount_paid=-self.total_refund_amount,
-            cashier=self.refunded_by,
-            payment_method="refund"
-        )
-        self.sale.update_paid_amount()
-        # Return items to stock
-        for item in self.sale.items.select_related("product").all():
-            if item.product:
-                item.product.add_stock(item.quantity, self.refunded_by)
-
     def __str__(self):
         return f"Refund #{self.id} for Sale #{self.sale.id}"
 
+
+class RefundItem(models.Model):
+    refund = models.ForeignKey(Refund, related_name='items', on_delete=models.CASCADE)
+    sale_item = models.ForeignKey(SaleItem, related_name='refund_items', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
+    quantity = models.DecimalField(max_digits=20, decimal_places=2)
+    amount = models.DecimalField(max_digits=20, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.product} x {self.quantity} (Refund #{self.refund_id})"
+
 # ----------------------------
 # Expenses
 # ----------------------------
@@ -512,6 +574,16 @@ class DailyCashClose(models.Model):
     closed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Day summary frozen at close (main/cashbook.py); null on closes recorded before it existed
+    payments_total = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    payments_by_method = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    loan_repayments_total = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    settlements_cleared_total = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    settlements_uncleared_total = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    expenses_total = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    expenses_by_category = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    summarized_at = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         unique_together = ('unit', 'date')
         ordering = ['-date', '-created_at']
@@ -578,3 +650,69 @@ class QuoteItem(models.Model):
 
     def __str__(self):
         return f"{self.description} x {self.quantity} (Quote #{self.quote_id})"
+
+
+class ReportJob(models.Model):
+    """A heavy report run by the `run_report_jobs` worker instead of inside the request (reports/jobs/)."""
+    REPORT_TYPES = (
+        ('sales', 'Sales report'),
+        ('stock', 'Stock report'),
+        ('short', 'Short report'),
+    )
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPES)
+    params = models.JSONField(default=dict, blank=True)
+    # Hash of report_type + params + user; identical queued/running requests share one job
+    params_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='report_jobs')
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # One queued/running job per params_key: concurrent identical submits cannot both queue
+            models.UniqueConstraint(
+                fields=['params_key'], condition=models.Q(status__in=('queued', 'running')),
+                name='report_job_one_in_flight',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_report_type_display()} #{self.id} ({self.status})"
+
+
+class MobileMoneyTransaction(models.Model):
+    """A line from an imported mobile-money statement, matched to the payment it settles (finance/mobile-money/)."""
+    reference = models.CharField(max_length=50, unique=True)
+    amount = models.DecimalField(max_digits=20, decimal_places=2)
+    occurred_at = models.DateTimeField()
+    sender = models.CharField(max_length=150, blank=True)
+    description = models.CharField(max_length=255, blank=True)
+    payment = models.OneToOneField(
+        Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='mobile_money_transaction',
+    )
+    repair_payment = models.OneToOneField(
+        'onyango.RepairPayment', on_delete=models.SET_NULL, null=True, blank=True, related_name='mobile_money_transaction',
+    )
+    matched_at = models.DateTimeField(null=True, blank=True)
+    imported_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-occurred_at']
+        indexes = [
+            models.Index(fields=['amount', 'occurred_at'], name='momo_amount_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reference}: {self.amount} TZS at {self.occurred_at}"
@@ -0,0 +1,122 @@
+"""
+Admin unit overview (admin/unit-overview/): expenses, loans and stock movements per unit, the
+workshop's repair debts and all-unit totals.
+
+The report is a set of independent blocks. unit_overview() runs them one after another for
+the sync view; aunit_overview() runs them concurrently (main/concurrency.py) for the async
+view at admin/unit-overview/async/. Both return the same payload.
+"""
+from functools import partial
+
+from django.db.models import Q, Sum
+from django.utils.timezone import now
+
+from .concurrency import run_blocks, run_blocks_sync
+from .models import Expense, Sale, StockEntry, Unit
+from .serializers import ExpenseSerializer, LoanSerializer, StockEntrySerializer
+
+OPEN_LOAN = Q(payment_status='not_paid') | Q(payment_status='partial')
+
+
+def _expenses(unit, start_of_month):
+    expenses_qs = Expense.objects.filter(unit=unit, date__gte=start_of_month)
+    return {
+        'count': expenses_qs.count(),
+        'total': float(expenses_qs.aggregate(t=Sum('amount'))['t'] or 0),
+        'recent': ExpenseSerializer(
+            expenses_qs.select_related('unit', 'recorded_by').order_by('-date')[:10], many=True
+        ).data,
+    }
+
+
+def _loans(unit):
+    loans_qs = Sale.objects.filter(is_loan=True).exclude(status='refunded')
+    if unit.code == 'shop':
+        loans_qs = loans_qs.filter(Q(unit=unit) | Q(unit__isnull=True))
+    else:
+        loans_qs = loans_qs.filter(unit=unit)
+    return {
+        'count': loans_qs.filter(OPEN_LOAN).count(),
+        'outstanding': float(sum((s.final_amount - s.paid_amount) for s in loans_qs.filter(OPEN_LOAN))),
+        'recent': LoanSerializer(loans_qs.select_related('unit', 'customer', 'user')[:10], many=True).data,
+    }
+
+
+def _stock_movements(unit):
+    if unit.code == 'shop':
+        entries = StockEntry.objects.filter(Q(product__unit=unit) | Q(product__unit__isnull=True))
+    else:
+        entries = StockEntry.objects.filter(product__unit=unit)
+    recent = entries.select_related('product', 'product__unit', 'recorded_by').order_by('-date')[:15]
+    return {
+        'count': entries.count(),
+        'recent': StockEntrySerializer(recent, many=True).data,
+    }
+
+
+def _repair_debts(workshop):
+    """Workshop repair debts (RepairInvoice unpaid/partial), or None if unavailable."""
+    try:
+        from onyango.models import RepairInvoice
+        repair_invoices = RepairInvoice.objects.filter(
+            job__unit=workshop
+        ).filter(
+            Q(payment_status='unpaid') | Q(payment_status='partial')
+        )
+        return {
+            'count': repair_invoices.count(),
+            'outstanding': sum(float(i.total_amount - i.paid_amount) for i in repair_invoices),
+        }
+    except Exception:
+        return None
+
+
+def _totals(start_of_month):
+    """All units combined (for admin overview)."""
+    all_expenses = Expense.objects.filter(date__gte=start_of_month)
+    all_loans = Sale.objects.filter(is_loan=True).exclude(status='refunded').filter(OPEN_LOAN)
+    return {
+        'expenses_count': all_expenses.count(),
+        'expenses_total': float(all_expenses.aggregate(t=Sum('amount'))['t'] or 0),
+        'loans_count': all_loans.count(),
+        'loans_outstanding': sum(float(s.final_amount - s.paid_amount) for s in all_loans),
+    }
+
+
+def _blocks(units):
+    start_of_month = now().date().replace(day=1)
+    blocks = {}
+    for unit in units:
+        blocks[unit.id, 'expenses'] = partial(_expenses, unit, start_of_month)
+        blocks[unit.id, 'loans'] = partial(_loans, unit)
+        blocks[unit.id, 'stock_movements'] = partial(_stock_movements, unit)
+    workshop = next((unit for unit in units if unit.code == 'workshop'), None)
+    if workshop:
+        blocks[workshop.id, 'repair_debts'] = partial(_repair_debts, workshop)
+    blocks['totals'] = partial(_totals, start_of_month)
+    return blocks
+
+
+def _assemble(units, results):
+    result = []
+    for unit in units:
+        unit_data = {
+            'unit': {'id': unit.id, 'code': unit.code, 'name': unit.name},
+            'expenses': results[unit.id, 'expenses'],
+            'loans': results[unit.id, 'loans'],
+            'stock_movements': results[unit.id, 'stock_movements'],
+        }
+        if results.get((unit.id, 'repair_debts')) is not None:
+            unit_data['repair_debts'] = results[unit.id, 'repair_debts']
+        result.append(unit_data)
+    return {'units': result, 'totals': results['totals']}
+
+
+def unit_overview():
+    units = list(Unit.objects.order_by('id'))
+    return _assemble(units, run_blocks_sync(_blocks(units)))
+
+
+async def aunit_overview():
+    units = [unit async for unit in Unit.objects.order_by('id')]
+    return _assemble(units, await run_blocks(_blocks(units)))
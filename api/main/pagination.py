@@ -8,4 +8,10 @@ class OrderPagination(PageNumberPagination):
 class ProductPagination(PageNumberPagination):
     page_size = 50  # tweak this for scroll performance
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Opt-in: the POS and products pages expect a plain list unless they ask for a page
+        if self.page_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
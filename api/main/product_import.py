@@ -0,0 +1,204 @@
+"""
+Bulk product import / repricing (products/import/ and `manage.py import_products`).
+
+Rows are keyed on Product.code. Every row is validated first; any error aborts the whole
+import. Then categories are created in bulk, new products are written with bulk_create,
+changed products with bulk_update, and a StockEntry is bulk-written for every new product
+with stock and every product whose quantity changed. dry_run stops before writing and
+returns the same report, including a per-product diff.
+"""
+import csv
+import io
+import itertools
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from .lookup import product_code_cache
+from .models import Category, Product, StockEntry, Unit
+from .serializers import ProductImportRowSerializer
+
+IMPORT_BATCH_SIZE = 500
+UPDATABLE_FIELDS = (
+    'name', 'category', 'unit', 'buying_price', 'selling_price',
+    'wholesale_price', 'quantity_in_stock', 'threshold',
+)
+REQUIRED_FOR_NEW = ('name', 'buying_price', 'selling_price')
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def read_rows(fileobj, filename=''):
+    """
+    Yield row dicts from an uploaded/opened CSV or JSON file (binary or text).
+
+    CSV is decoded and parsed one line at a time, so a large upload is never held in memory
+    as a whole; JSON has to be parsed as one document.
+    """
+    text = fileobj if isinstance(fileobj, io.TextIOBase) else io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        first = text.readline()
+        while first and not first.strip():
+            first = text.readline()
+        if filename.lower().endswith('.json') or first.lstrip().startswith('['):
+            try:
+                rows = json.loads(first + text.read())
+            except ValueError as exc:
+                raise ImportFormatError(f"Invalid JSON: {exc}")
+            if not isinstance(rows, list):
+                raise ImportFormatError("JSON import must be a list of objects.")
+            yield from rows
+            return
+        yield from csv.DictReader(itertools.chain([first], text))
+    except UnicodeDecodeError:
+        raise ImportFormatError("File must be UTF-8 encoded")
+    finally:
+        if text is not fileobj:
+            # Leave the caller's file open
+            text.detach()
+
+
+def _clean(raw):
+    # Blank cells mean "leave as is", not "set to empty"
+    return {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in raw.items()
+        if key and value is not None and value != ''
+    }
+
+
+def _diff_value(value):
+    return None if value is None else str(value)
+
+
+def import_products(rows, user=None, dry_run=False):
+    """Validate and upsert rows. Returns (report, ok); nothing is written unless ok and not dry_run."""
+    errors = []
+    by_code = {}
+    count = 0
+    for number, raw in enumerate(rows, start=1):
+        count += 1
+        if not isinstance(raw, dict):
+            errors.append({'row': number, 'errors': {'row': ['Expected an object.']}})
+            continue
+        serializer = ProductImportRowSerializer(data=_clean(raw))
+        if not serializer.is_valid():
+            errors.append({'row': number, 'code': raw.get('code'), 'errors': serializer.errors})
+            continue
+        row = serializer.validated_data
+        by_code[row['code']] = {**by_code.get(row['code'], {}), **row, 'row': number}  # last row per code wins
+
+    existing = Product.objects.select_related('category', 'unit').in_bulk(list(by_code), field_name='code')
+    category_names = {row['category'] for row in by_code.values() if 'category' in row}
+    categories = {c.name: c for c in Category.objects.filter(name__in=category_names)}
+    new_category_names = sorted(category_names - set(categories))
+    units = {u.code: u for u in Unit.objects.all()}
+    shop = units.get('shop')
+
+    for code, row in by_code.items():
+        if 'unit' in row and row['unit'] not in units:
+            errors.append({'row': row['row'], 'code': code, 'errors': {'unit': [f"Unknown unit '{row['unit']}'."]}})
+        if code not in existing:
+            missing = [f for f in REQUIRED_FOR_NEW if f not in row]
+            if missing:
+                errors.append({'row': row['row'], 'code': code, 'errors': {f: ['Required for a new product.'] for f in missing}})
+
+    report = {
+        'dry_run': dry_run,
+        'rows': count,
+        'created': 0,
+        'updated': 0,
+        'unchanged': 0,
+        'categories_created': new_category_names,
+        'errors': sorted(errors, key=lambda e: e['row']),
+        'diffs': [],
+    }
+    if errors:
+        return report, False
+
+    # Placeholder categories so new ones can be referenced before they exist (dry run)
+    for name in new_category_names:
+        categories[name] = Category(name=name)
+
+    def target_values(row, product=None):
+        values = {}
+        if 'category' in row:
+            values['category'] = categories[row['category']]
+        if 'unit' in row:
+            values['unit'] = units[row['unit']]
+        elif product is None:
+            values['unit'] = shop
+        for field in ('name', 'buying_price', 'selling_price', 'wholesale_price', 'quantity_in_stock', 'threshold'):
+            if field in row:
+                values[field] = row[field]
+        return values
+
+    to_create, to_update, quantity_changed = [], [], []
+    for code, row in by_code.items():
+        product = existing.get(code)
+        values = target_values(row, product)
+        if product is None:
+            product = Product(code=code, **values)
+            to_create.append(product)
+            report['diffs'].append({
+                'code': code, 'action': 'create',
+                'changes': {k: {'old': None, 'new': _diff_value(getattr(v, 'name', v))} for k, v in values.items() if v is not None},
+            })
+            continue
+        changes = {}
+        for field, new in values.items():
+            old = getattr(product, field)
+            if old != new:
+                changes[field] = {'old': _diff_value(getattr(old, 'name', old)), 'new': _diff_value(getattr(new, 'name', new))}
+                setattr(product, field, new)
+        if not changes:
+            report['unchanged'] += 1
+            continue
+        to_update.append(product)
+        if 'quantity_in_stock' in changes:
+            quantity_changed.append(product)
+        report['diffs'].append({'code': code, 'action': 'update', 'changes': changes})
+
+    report['created'] = len(to_create)
+    report['updated'] = len(to_update)
+    if dry_run:
+        return report, True
+
+    with transaction.atomic():
+        if new_category_names:
+            Category.objects.bulk_create([categories[name] for name in new_category_names], batch_size=IMPORT_BATCH_SIZE)
+            created = {c.name: c for c in Category.objects.filter(name__in=new_category_names)}
+            for product in to_create + to_update:
+                if product.category is not None and product.category.pk is None:
+                    product.category = created[product.category.name]
+
+        Product.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+        if to_update:
+            now = timezone.now()  # bulk_update skips auto_now; catalog sync relies on it
+            for product in to_update:
+                product.updated_at = now
+            Product.objects.bulk_update(to_update, [*UPDATABLE_FIELDS, 'updated_at'], batch_size=IMPORT_BATCH_SIZE)
+
+        # bulk_create only returns ids on some backends; re-read them by code
+        if to_create and any(p.pk is None for p in to_create):
+            ids = dict(Product.objects.filter(code__in=[p.code for p in to_create]).values_list('code', 'id'))
+            for product in to_create:
+                product.pk = ids[product.code]
+
+        StockEntry.objects.bulk_create(
+            [
+                StockEntry(product=p, entry_type='added', quantity=p.quantity_in_stock, recorded_by=user, ref_type='product_import')
+                for p in to_create if p.quantity_in_stock > 0
+            ] + [
+                StockEntry(product=p, entry_type='updated', quantity=p.quantity_in_stock, recorded_by=user, ref_type='product_import')
+                for p in quantity_changed
+            ],
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+        updated_ids = [p.pk for p in to_update]
+        transaction.on_commit(lambda: product_code_cache.evict_ids(updated_ids))
+
+    return report, True
@@ -0,0 +1,287 @@
+"""
+Payment-method reconciliation (finance/reconciliation/) and mobile-money statement import
+(finance/mobile-money/import/).
+
+Expected totals are grouped per day, unit and normalized method in SQL. Statement lines are
+matched to unmatched mobile-money payments with one indexed query per payment model
+(method + amount IN (...) + payment_date window); candidates are bucketed by amount and the
+nearest payment in time is taken with bisect, so matching stays O(n log n).
+"""
+import csv
+import io
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import MobileMoneyTransaction, Payment, Unit
+
+MATCH_WINDOW = timedelta(minutes=30)
+IMPORT_BATCH_SIZE = 500
+
+# Statement column -> accepted headers (M-Pesa, Tigo/Mixx, Airtel exports and our own)
+STATEMENT_COLUMNS = {
+    'reference': ('reference', 'receipt no.', 'receipt no', 'receipt', 'transaction id', 'transid', 'txn id'),
+    'occurred_at': ('occurred_at', 'completion time', 'date', 'transaction date', 'date time', 'time'),
+    'amount': ('amount', 'paid in', 'credit', 'amount (tzs)'),
+    'sender': ('sender', 'from', 'other party info', 'msisdn', 'name'),
+    'description': ('description', 'details', 'narration'),
+}
+DATETIME_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d-%m-%Y %H:%M:%S', '%d.%m.%Y %H:%M:%S')
+
+
+class StatementFormatError(ValueError):
+    pass
+
+
+def _parse_amount(value):
+    try:
+        return Decimal(re.sub(r'[^0-9.\-]', '', str(value)))
+    except InvalidOperation:
+        return None
+
+
+def _parse_datetime(value):
+    value = str(value).strip()
+    parsed = parse_datetime(value.replace(' ', 'T', 1)) if value else None
+    if parsed is None:
+        for fmt in DATETIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def read_statement(fileobj):
+    """Parse a statement CSV. Returns (rows, errors); rows without money paid in are skipped."""
+    data = fileobj.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    reader = csv.DictReader(io.StringIO(data))
+    headers = {(h or '').strip().lower(): h for h in reader.fieldnames or ()}
+    columns = {}
+    for column, aliases in STATEMENT_COLUMNS.items():
+        columns[column] = next((headers[a] for a in aliases if a in headers), None)
+    missing = [c for c in ('reference', 'occurred_at', 'amount') if columns[c] is None]
+    if missing:
+        raise StatementFormatError(f"Statement is missing column(s): {', '.join(missing)}.")
+
+    rows, errors = [], []
+    for number, raw in enumerate(reader, start=2):  # row 1 is the header
+        reference = (raw.get(columns['reference']) or '').strip()
+        raw_amount = (raw.get(columns['amount']) or '').strip()
+        if not raw_amount:
+            continue  # withdrawals / charges have nothing paid in
+        amount = _parse_amount(raw_amount)
+        occurred_at = _parse_datetime(raw.get(columns['occurred_at']) or '')
+        if not reference or occurred_at is None or amount is None:
+            errors.append({'row': number, 'reference': reference or None, 'error': 'Missing or invalid reference, time or amount.'})
+            continue
+        if amount <= 0:
+            continue
+        rows.append({
+            'reference': reference,
+            'amount': amount,
+            'occurred_at': occurred_at,
+            'sender': (raw.get(columns['sender']) or '').strip()[:150] if columns['sender'] else '',
+            'description': (raw.get(columns['description']) or '').strip()[:255] if columns['description'] else '',
+        })
+    return rows, errors
+
+
+def _candidates(amounts, start, end):
+    """{amount: [(payment_date, kind, id), ...] sorted} for unmatched mobile-money payments in the window."""
+    from onyango.models import RepairPayment
+
+    buckets = defaultdict(list)
+    shop = Payment.objects.filter(
+        method='mobile_money', amount_paid__in=amounts, payment_date__range=(start, end),
+        mobile_money_transaction__isnull=True,
+    ).values_list('payment_date', 'id', 'amount_paid')
+    for paid_at, pk, amount in shop.iterator():
+        buckets[amount].append((paid_at, 'payment', pk))
+    workshop = RepairPayment.objects.filter(
+        method='mobile_money', amount__in=amounts, payment_date__range=(start, end),
+        mobile_money_transaction__isnull=True,
+    ).values_list('payment_date', 'id', 'amount')
+    for paid_at, pk, amount in workshop.iterator():
+        buckets[amount].append((paid_at, 'repair_payment', pk))
+    for bucket in buckets.values():
+        bucket.sort()
+    return buckets
+
+
+def match_transactions(transactions, window=MATCH_WINDOW):
+    """
+    Match unmatched statement lines to the nearest unmatched mobile-money payment with the same
+    amount within +/- window. Each payment is used once. Returns the number matched.
+    """
+    transactions = sorted((t for t in transactions if t.payment_id is None and t.repair_payment_id is None), key=lambda t: t.occurred_at)
+    if not transactions:
+        return 0
+    buckets = _candidates(
+        {t.amount for t in transactions},
+        transactions[0].occurred_at - window,
+        transactions[-1].occurred_at + window,
+    )
+    now = timezone.now()
+    matched = []
+    for txn in transactions:
+        bucket = buckets.get(txn.amount)
+        if not bucket:
+            continue
+        i = bisect_left(bucket, (txn.occurred_at,))
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(bucket):
+                gap = abs(bucket[j][0] - txn.occurred_at)
+                if gap <= window and (best is None or gap < best[0]):
+                    best = (gap, j)
+        if best is None:
+            continue
+        _, kind, pk = bucket.pop(best[1])
+        setattr(txn, f'{kind}_id', pk)
+        txn.matched_at = now
+        matched.append(txn)
+    MobileMoneyTransaction.objects.bulk_update(matched, ['payment', 'repair_payment', 'matched_at'], batch_size=IMPORT_BATCH_SIZE)
+    return len(matched)
+
+
+@transaction.atomic
+def import_statement(rows, user=None, window=MATCH_WINDOW):
+    """
+    Store new statement lines (references already imported are skipped) and match every
+    unmatched line in the statement's time span, including ones left over from earlier imports.
+    """
+    by_reference = {row['reference']: row for row in rows}
+    existing = set(
+        MobileMoneyTransaction.objects.filter(reference__in=list(by_reference)).values_list('reference', flat=True)
+    )
+    new = [
+        MobileMoneyTransaction(imported_by=user, **row)
+        for reference, row in by_reference.items() if reference not in existing
+    ]
+    MobileMoneyTransaction.objects.bulk_create(new, batch_size=IMPORT_BATCH_SIZE)
+
+    matched = 0
+    if by_reference:
+        times = [row['occurred_at'] for row in by_reference.values()]
+        unmatched = MobileMoneyTransaction.objects.filter(
+            occurred_at__range=(min(times), max(times)), payment__isnull=True, repair_payment__isnull=True,
+        )
+        matched = match_transactions(list(unmatched), window)
+    return {
+        'rows': len(rows),
+        'imported': len(new),
+        'skipped_existing': len(existing),
+        'matched': matched,
+    }
+
+
+def reconciliation(date_from, date_to, unit=None):
+    """
+    Expected takings per day, unit and method (confirmed sale payments + repair payments),
+    with statement-matched totals, and mobile-money statement totals per day.
+    """
+    from onyango.models import RepairPayment
+
+    units = {u.id: u for u in Unit.objects.all()}
+    shop_id = next((u.id for u in units.values() if u.code == 'shop'), None)
+    workshop_ids = {u.id for u in units.values() if u.code == 'workshop'}
+    matched = Q(mobile_money_transaction__isnull=False)
+
+    rows = []
+    if unit is None or unit.id not in workshop_ids:
+        # Sales with no unit are shop sales
+        payments = Payment.objects.filter(payment_date__date__range=(date_from, date_to), sale__status='confirmed')
+        if unit is not None:
+            payments = payments.filter(Q(sale__unit=unit) | Q(sale__unit__isnull=True)) if unit.id == shop_id else payments.filter(sale__unit=unit)
+        payment_unit = Coalesce('sale__unit_id', Value(shop_id)) if shop_id else F('sale__unit_id')
+        rows += list(
+            payments.values('method', day=TruncDate('payment_date'), unit_id=payment_unit)
+            .annotate(
+                total=Sum('amount_paid'), count=Count('id'),
+                matched_total=Coalesce(Sum('amount_paid', filter=matched), Value(Decimal('0'))),
+                matched_count=Count('id', filter=matched),
+            ).order_by()
+        )
+    if unit is None or unit.id in workshop_ids:
+        repair_payments = RepairPayment.objects.filter(payment_date__date__range=(date_from, date_to))
+        if unit is not None:
+            repair_payments = repair_payments.filter(invoice__job__unit=unit)
+        rows += list(
+            repair_payments.values('method', day=TruncDate('payment_date'), unit_id=F('invoice__job__unit_id'))
+            .annotate(
+                total=Sum('amount'), count=Count('id'),
+                matched_total=Coalesce(Sum('amount', filter=matched), Value(Decimal('0'))),
+                matched_count=Count('id', filter=matched),
+            ).order_by()
+        )
+
+    statement = (
+        MobileMoneyTransaction.objects.filter(occurred_at__date__range=(date_from, date_to))
+        .values(day=TruncDate('occurred_at'))
+        .annotate(
+            total=Sum('amount'), count=Count('id'),
+            matched_count=Count('id', filter=Q(payment__isnull=False) | Q(repair_payment__isnull=False)),
+            unmatched_total=Coalesce(Sum('amount', filter=Q(payment__isnull=True, repair_payment__isnull=True)), Value(Decimal('0'))),
+        ).order_by('day')
+    )
+
+    days = defaultdict(lambda: {'units': defaultdict(dict), 'statement': None})
+    totals = defaultdict(lambda: {'expected': Decimal('0'), 'count': 0})
+    for row in rows:
+        entry = {
+            'expected': float(row['total']),
+            'count': row['count'],
+        }
+        if row['method'] == 'mobile_money':
+            entry.update({
+                'matched': float(row['matched_total']),
+                'matched_count': row['matched_count'],
+                'unmatched': float(row['total'] - row['matched_total']),
+            })
+        days[row['day']]['units'][row['unit_id']][row['method']] = entry
+        totals[row['method']]['expected'] += row['total']
+        totals[row['method']]['count'] += row['count']
+    for row in statement:
+        days[row['day']]['statement'] = {
+            'total': float(row['total']),
+            'count': row['count'],
+            'matched_count': row['matched_count'],
+            'unmatched_count': row['count'] - row['matched_count'],
+            'unmatched_total': float(row['unmatched_total']),
+        }
+
+    def unit_json(unit_id):
+        u = units.get(unit_id)
+        return {'id': unit_id, 'code': u.code if u else None, 'name': u.name if u else None}
+
+    return {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'unit': unit_json(unit.id) if unit else None,
+        'totals': {method: {'expected': float(t['expected']), 'count': t['count']} for method, t in totals.items()},
+        'days': [
+            {
+                'date': day.isoformat(),
+                'units': [
+                    {'unit': unit_json(unit_id), 'methods': methods}
+                    for unit_id, methods in sorted(data['units'].items(), key=lambda item: item[0] or 0)
+                ],
+                'statement': data['statement'],
+            }
+            for day, data in sorted(days.items())
+        ],
+    }
@@ -0,0 +1,161 @@
+"""
+Sale refunds (sales/<id>/refund/ and refunds/).
+
+create_refund() refunds the whole sale or selected quantities of its lines. Whatever the
+number of lines it runs a fixed number of queries: stock goes back with one CASE-based F()
+UPDATE on products plus bulk-created 'returned' StockEntry rows, the reversing payment is
+bulk-inserted, and the sale's paid_amount / refund_total / status change in one UPDATE.
+reverse_refund() undoes a refund the same way.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .lookup import product_code_cache
+from .models import Payment, Product, Refund, RefundItem, Sale, StockEntry, sale_payment_status
+from .rounding import round_two
+
+ZERO = Decimal('0')
+
+
+class RefundError(ValueError):
+    pass
+
+
+def _line_amount(sale, item, quantity):
+    """Refund value of `quantity` of a sale line, net of the sale-level discount."""
+    if not item.quantity:
+        return ZERO
+    amount = item.total_price * quantity / item.quantity
+    if sale.total_amount and sale.final_amount is not None and sale.final_amount != sale.total_amount:
+        amount = amount * sale.final_amount / sale.total_amount
+    return round_two(amount)
+
+
+def _adjust_stock(quantities, user, entry_type, refund_id, sign):
+    """Add (sign=1) or remove (sign=-1) {product_id: quantity} with one UPDATE and one bulk insert."""
+    if not quantities:
+        return
+    delta = Case(
+        *(When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+    stock = F('quantity_in_stock') + delta if sign > 0 else F('quantity_in_stock') - delta
+    Product.objects.filter(pk__in=list(quantities)).update(quantity_in_stock=stock, updated_at=timezone.now())
+    StockEntry.objects.bulk_create([
+        StockEntry(product_id=pk, entry_type=entry_type, quantity=qty, recorded_by=user, ref_type='refund', ref_id=refund_id)
+        for pk, qty in quantities.items()
+    ])
+    ids = list(quantities)
+    transaction.on_commit(lambda: product_code_cache.evict_ids(ids))
+
+
+def _apply_to_sale(sale, amount, user, status):
+    """Reversing (or restoring) payment plus a single sale UPDATE for paid_amount, refund_total and status."""
+    if amount:
+        # bulk_create skips Payment.save, which would write the sale a second time
+        Payment.objects.bulk_create([
+            Payment(sale=sale, amount_paid=-amount, cashier=user, payment_method='refund', method='refund'),
+        ])
+    paid = F('paid_amount') - Value(amount)
+    Sale.objects.filter(pk=sale.pk).update(
+        payment_status=sale_payment_status(paid),
+        paid_amount=paid,
+        refund_total=Coalesce(F('refund_total'), Value(ZERO)) + Value(amount),
+        status=status,
+        updated_at=timezone.now(),
+    )
+    sale.refresh_from_db(fields=['paid_amount', 'payment_status', 'refund_total', 'status', 'updated_at'])
+
+
+@transaction.atomic
+def create_refund(sale, user, lines=None):
+    """
+    Refund `lines` ([{'sale_item': id, 'quantity': q}, ...]) of a sale, or everything not yet
+    refunded when lines is None. The money refunded is the discounted value of the lines,
+    capped at what the customer has paid; refunding the last remaining quantity refunds the
+    rest of paid_amount and marks the sale refunded.
+    """
+    sale = Sale.objects.select_for_update().get(pk=sale.pk)
+    if sale.status == 'refunded':
+        raise RefundError("This sale has already been refunded.")
+
+    items = {
+        item.id: item
+        for item in sale.items.annotate(
+            refunded=Coalesce(Sum('refund_items__quantity'), Value(ZERO), output_field=DecimalField(max_digits=20, decimal_places=2)),
+        ).order_by('id')
+    }
+    remaining = {item_id: item.quantity - item.refunded for item_id, item in items.items()}
+
+    if lines is None:
+        requested = {item_id: qty for item_id, qty in remaining.items() if qty > 0}
+    else:
+        requested = {}
+        for line in lines:
+            item_id, quantity = line['sale_item'], Decimal(str(line['quantity']))
+            if item_id not in items:
+                raise RefundError(f"Sale item {item_id} does not belong to sale #{sale.id}.")
+            if quantity <= 0:
+                raise RefundError("Refund quantities must be greater than 0.")
+            requested[item_id] = requested.get(item_id, ZERO) + quantity
+        for item_id, quantity in requested.items():
+            if quantity > remaining[item_id]:
+                raise RefundError(f"Only {remaining[item_id]} of sale item {item_id} can still be refunded.")
+    if not requested:
+        raise RefundError("Nothing left to refund on this sale.")
+
+    full = all(requested.get(item_id, ZERO) >= qty for item_id, qty in remaining.items())
+    paid = max(sale.paid_amount or ZERO, ZERO)
+    refund_items = [
+        RefundItem(
+            sale_item_id=item_id,
+            product_id=items[item_id].product_id,
+            quantity=quantity,
+            amount=_line_amount(sale, items[item_id], quantity),
+        )
+        for item_id, quantity in requested.items()
+    ]
+    amount = paid if full else min(sum((ri.amount for ri in refund_items), ZERO), paid)
+
+    refund = Refund.objects.create(sale=sale, refunded_by=user, total_refund_amount=amount)
+    for ri in refund_items:
+        ri.refund = refund
+    RefundItem.objects.bulk_create(refund_items)
+
+    returned = {}
+    for ri in refund_items:
+        if ri.product_id:
+            returned[ri.product_id] = returned.get(ri.product_id, ZERO) + ri.quantity
+    _adjust_stock(returned, user, 'returned', refund.id, sign=1)
+    _apply_to_sale(sale, amount, user, 'refunded' if full else sale.status)
+    # Loaded for serialization in a constant number of queries
+    return Refund.objects.select_related('sale', 'refunded_by').prefetch_related('items__product').get(pk=refund.pk)
+
+
+@transaction.atomic
+def reverse_refund(refund, user):
+    """Undo a refund: take the returned stock back out, restore the money and sale status, delete it."""
+    sale = Sale.objects.select_for_update().get(pk=refund.sale_id)
+    refund_items = list(refund.items.all())
+    if not refund_items:
+        raise RefundError("Refunds recorded before line-level refunds cannot be reversed.")
+
+    taken = {}
+    for ri in refund_items:
+        if ri.product_id:
+            taken[ri.product_id] = taken.get(ri.product_id, ZERO) + ri.quantity
+    short = [
+        name for name, in_stock, pk in Product.objects.select_for_update().filter(pk__in=list(taken)).values_list('name', 'quantity_in_stock', 'pk')
+        if in_stock < taken[pk]
+    ]
+    if short:
+        raise RefundError(f"Not enough stock to reverse this refund: {', '.join(short)}.")
+
+    _adjust_stock(taken, user, 'adjusted', refund.id, sign=-1)
+    _apply_to_sale(sale, -refund.total_refund_amount, user, 'confirmed')
+    refund.delete()
+    return sale
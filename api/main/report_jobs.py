@@ -0,0 +1,120 @@
+"""
+DB-backed queue for heavy reports (reports/jobs/ + `manage.py run_report_jobs`).
+
+A job re-runs the existing report view's get() in the worker with the submitter as
+request.user, so the numbers are identical to the synchronous endpoint. Jobs are claimed
+with a conditional UPDATE (status queued -> running), which is safe with several workers
+and needs no broker or SELECT ... FOR UPDATE SKIP LOCKED.
+"""
+import hashlib
+import json
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+from rest_framework.request import Request
+
+from .models import ReportJob
+
+# report_type -> (view class path, accepted query params)
+REPORTS = {
+    'sales': ('main.views.SalesReportAPIView', ('start_date', 'end_date')),
+    'stock': ('main.views.StockReportAPIView', ('start_date', 'end_date')),
+    'short': ('main.views.ShortReportAPIView', ('start', 'end')),
+}
+IN_FLIGHT = ('queued', 'running')
+STALE_AFTER = timedelta(minutes=30)
+
+
+def report_view_class(report_type):
+    from django.utils.module_loading import import_string
+    return import_string(REPORTS[report_type][0])
+
+
+def clean_params(report_type, params):
+    allowed = REPORTS[report_type][1]
+    return {k: str(params[k]).strip() for k in allowed if params.get(k) not in (None, '')}
+
+
+def params_key(report_type, params, user):
+    raw = json.dumps([report_type, params, user.pk], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def submit(report_type, params, user):
+    """Queue a job, or return the identical queued/running one. Returns (job, created)."""
+    params = clean_params(report_type, params)
+    key = params_key(report_type, params, user)
+    for attempt in range(3):
+        existing = ReportJob.objects.filter(params_key=key, status__in=IN_FLIGHT).first()
+        if existing:
+            return existing, False
+        # The report_job_one_in_flight constraint rejects a concurrent identical submit;
+        # the loser then returns the winner's job (or retries if it already finished)
+        try:
+            with transaction.atomic():
+                return ReportJob.objects.create(report_type=report_type, params=params, params_key=key, requested_by=user), True
+        except IntegrityError:
+            if attempt == 2:
+                raise
+
+
+def claim_next():
+    """Atomically take the oldest queued job, or None."""
+    for job_id in ReportJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:10]:
+        if ReportJob.objects.filter(id=job_id, status='queued').update(status='running', started_at=timezone.now()):
+            return ReportJob.objects.select_related('requested_by').get(id=job_id)
+    return None
+
+
+def requeue_stale(max_age):
+    """Put running jobs whose worker died (started more than max_age ago) back in the queue."""
+    return ReportJob.objects.filter(status='running', started_at__lt=timezone.now() - max_age).update(status='queued', started_at=None)
+
+
+def run_job(job):
+    http_request = HttpRequest()
+    http_request.method = 'GET'
+    http_request.GET = QueryDict(mutable=True)
+    http_request.GET.update(job.params)
+    request = Request(http_request)
+    request.user = job.requested_by
+
+    view = report_view_class(job.report_type)()
+    view.request, view.args, view.kwargs, view.format_kwarg = request, (), {}, None
+    try:
+        response = view.get(request)
+    except Exception:
+        job.status, job.error = 'failed', traceback.format_exc()
+    else:
+        if response.status_code >= 400:
+            job.status, job.error = 'failed', json.dumps(response.data, default=str)
+        else:
+            job.status, job.result = 'done', response.data
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    return job
+
+
+def _table(job):
+    """The tabular part of a report result, as a list of flat dicts."""
+    data = job.result or {}
+    if job.report_type == 'sales':
+        chart = data.get('chart') or {}
+        series = [k for k in chart if k != 'dates']
+        return [
+            {'date': date, **{k: chart[k][i] for k in series}}
+            for i, date in enumerate(chart.get('dates', []))
+        ]
+    if job.report_type == 'stock':
+        return data.get('stockMovement') or []
+    return data.get('report') or []
+
+
+def result_table(job):
+    """(headers, rows) of the job's table, for export_rows()."""
+    rows = _table(job)
+    headers = list(rows[0]) if rows else []
+    return headers, ([row.get(header) for header in headers] for row in rows)
@@ -0,0 +1,114 @@
+"""
+Ranked product search over name, code and category (products/search/?q=).
+
+On SQLite the FTS5 trigram index from migration 0045 answers substring matches for
+every query word; when that finds too little, the words are broken into trigrams and
+OR-ed, so misspellings and partial part numbers still rank the closest products first.
+Other backends (or SQLite without FTS5) fall back to icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+FTS_TABLE = 'main_product_fts'
+# bm25 column weights: name, code, category
+FTS_RANK = f'bm25({FTS_TABLE}, 4.0, 8.0, 1.0)'
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+_fts_available = None
+
+
+def fts_available():
+    global _fts_available
+    if _fts_available is None:
+        if connection.vendor != 'sqlite':
+            _fts_available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _fts_available = cursor.fetchone() is not None
+    return _fts_available
+
+
+def _terms(query):
+    return [t for t in re.split(r'[\s"]+', query.lower()) if t]
+
+
+def _phrase(text):
+    return '"%s"' % text.replace('"', '""')
+
+
+def _fts_ids(match, limit, exclude=()):
+    sql = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    params = [match]
+    if exclude:
+        sql += ' AND rowid NOT IN (%s)' % ', '.join(['%s'] * len(exclude))
+        params += list(exclude)
+    sql += f' ORDER BY {FTS_RANK} LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _candidate_ids(terms, limit):
+    # Trigram tokens need 3+ characters; shorter words are applied as a filter afterwards
+    long_terms = [t for t in terms if len(t) >= 3]
+    if not long_terms:
+        return None
+    ids = _fts_ids(' AND '.join(_phrase(t) for t in long_terms), limit)
+    if len(ids) < limit:
+        trigrams = {t[i:i + 3] for t in long_terms for i in range(len(t) - 2)}
+        fuzzy = ' OR '.join(_phrase(g) for g in sorted(trigrams))
+        ids += _fts_ids(fuzzy, limit - len(ids), exclude=ids)
+    return ids
+
+
+def _rank_key(product, terms, position):
+    """Exact code, then code/name prefix, then the index's own order."""
+    code = (product.code or '').lower()
+    name = product.name.lower()
+    query = ' '.join(terms)
+    if code and code == query:
+        tier = 0
+    elif code.startswith(terms[0]) or name.startswith(query):
+        tier = 1
+    elif any(word.startswith(terms[0]) for word in name.split()):
+        tier = 2
+    elif all(t in name or t in code for t in terms):
+        tier = 3
+    else:
+        tier = 4
+    return (tier, position)
+
+
+def search_products(query, limit=SEARCH_LIMIT, queryset=None):
+    """Products matching query, best first. queryset narrows the candidates (e.g. by unit)."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    queryset = Product.objects.select_related('category') if queryset is None else queryset
+
+    ids = _candidate_ids(terms, limit * 3) if fts_available() else None
+    if ids is None:
+        q = Q()
+        for t in terms:
+            q &= Q(name__icontains=t) | Q(code__icontains=t) | Q(category__name__icontains=t)
+        products = list(queryset.filter(q).order_by('name')[:limit * 3])
+    else:
+        by_id = queryset.in_bulk(ids)
+        products = [by_id[i] for i in ids if i in by_id]
+        short_terms = [t for t in terms if len(t) < 3]
+        if short_terms:
+            products = [
+                p for p in products
+                if all(t in p.name.lower() or t in (p.code or '').lower() for t in short_terms)
+            ]
+
+    order = {p.id: position for position, p in enumerate(products)}
+    products.sort(key=lambda p: _rank_key(p, terms, order[p.id]))
+    return products[:limit]
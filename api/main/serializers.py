@@ -2,9 +2,9 @@ from datetime import timedelta
 from django.utils import timezone
 from rest_framework import serializers
 from .models import (
-    Category, Customer, Refund, User, Product, StockEntry,
+    Category, Customer, Refund, RefundItem, User, Product, StockEntry,
     Sale, SaleItem, Expense, Payment, Unit,
-    Order, OrderItem, TimelineEvent, Quote, QuoteItem,
+    Order, OrderItem, TimelineEvent, Quote, QuoteItem, ReportJob,
     get_portion_factor,
     get_effective_quantity,
 )
@@ -13,6 +13,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import update_last_login
 from django.db import transaction
 from .rounding import round_two
+from .refunds import RefundError, create_refund
 from decimal import Decimal, ROUND_HALF_UP
 
 
@@ -135,6 +136,19 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ProductImportRowSerializer(serializers.Serializer):
+    """One row of a bulk product import (main/product_import.py). code is the upsert key."""
+    code = serializers.CharField(max_length=50)
+    name = serializers.CharField(max_length=255, required=False)
+    category = serializers.CharField(max_length=100, required=False)
+    unit = serializers.CharField(max_length=20, required=False)
+    buying_price = serializers.DecimalField(max_digits=20, decimal_places=2, min_value=0, required=False)
+    selling_price = serializers.DecimalField(max_digits=20, decimal_places=2, min_value=0, required=False)
+    wholesale_price = serializers.DecimalField(max_digits=20, decimal_places=2, min_value=0, required=False)
+    quantity_in_stock = serializers.DecimalField(max_digits=20, decimal_places=2, min_value=0, required=False)
+    threshold = serializers.IntegerField(min_value=0, required=False)
+
+
 # ------------------------------ CUSTOMER ------------------------------
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -633,7 +647,6 @@ class ConfirmOrderSerializer(serializers.Serializer):
             total_amount=total_amount,
             discount_amount=discount_amount,
             final_amount=final_amount,
-            paid_amount=amount_paid,
             payment_status=payment_status,
             payment_method=payment_method,
             status='confirmed',
@@ -670,8 +683,7 @@ class ConfirmOrderSerializer(serializers.Serializer):
                 amount_paid=amount_paid,
                 cashier=cashier,
                 payment_method=payment_method,
-            )
-            sale.update_paid_amount()
+            )  # Payment.save adds amount_paid to sale.paid_amount
 
         # Finalize order
         order.status = 'confirmed'
@@ -822,7 +834,6 @@ class POSCompleteSaleSerializer(serializers.Serializer):
                 total_amount=total_amount,
                 discount_amount=discount_amount,
                 final_amount=final_amount,
-                paid_amount=amount_paid,
                 payment_status=payment_status,
                 payment_method=payment_method,
                 status='confirmed',
@@ -840,8 +851,7 @@ class POSCompleteSaleSerializer(serializers.Serializer):
                 Payment.objects.create(
                     sale=sale, amount_paid=amount_paid,
                     cashier=user, payment_method=payment_method,
-                )
-                sale.update_paid_amount()
+                )  # Payment.save adds amount_paid to sale.paid_amount
 
         return sale
 
@@ -882,8 +892,8 @@ class PaymentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Payment
-        fields = ['id', 'sale', 'amount_paid', 'payment_date', 'cashier', 'cashier_username', 'payment_method']
-        read_only_fields = ['payment_date']
+        fields = ['id', 'sale', 'amount_paid', 'payment_date', 'cashier', 'cashier_username', 'payment_method', 'method']
+        read_only_fields = ['payment_date', 'method']
 
     def get_cashier_username(self, obj):
         return obj.cashier.username if obj.cashier else None
@@ -893,28 +903,36 @@ class PaymentSerializer(serializers.ModelSerializer):
 
     
 
+class RefundItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True, default=None)
+
+    class Meta:
+        model = RefundItem
+        fields = ['id', 'sale_item', 'product', 'product_name', 'quantity', 'amount']
+
+
+class RefundLineInputSerializer(serializers.Serializer):
+    sale_item = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=20, decimal_places=2, min_value=Decimal('0.01'))
+
+
 class RefundSerializer(serializers.ModelSerializer):
     refunded_by = MeSerializer(read_only=True)
+    items = RefundItemSerializer(many=True, read_only=True)
+    # Omit to refund everything not yet refunded on the sale
+    lines = RefundLineInputSerializer(many=True, write_only=True, required=False)
 
     class Meta:
         model = Refund
-        fields = ['id', 'sale', 'refunded_by', 'refund_date', 'total_refund_amount']
+        fields = ['id', 'sale', 'refunded_by', 'refund_date', 'total_refund_amount', 'items', 'lines']
         read_only_fields = ['id', 'refund_date', 'refunded_by', 'total_refund_amount']
 
     def create(self, validated_data):
         user = self.context['request'].user
-        sale = validated_data['sale']
-
-        # Only allow refund if not already refunded
-        if sale.status == 'refunded':
-            raise serializers.ValidationError("This sale has already been refunded.")
-
-        refund = Refund.objects.create(
-            sale=sale,
-            refunded_by=user,
-            total_refund_amount=sale.paid_amount
-        )
-        return refund
+        try:
+            return create_refund(validated_data['sale'], user, validated_data.get('lines'))
+        except RefundError as exc:
+            raise serializers.ValidationError(str(exc))
 
 
 class ExpenseSerializer(serializers.ModelSerializer):
@@ -937,6 +955,18 @@ class PurchaseSerializer(serializers.ModelSerializer):
         fields = ['id', 'product_name', 'quantity', 'price_per_unit', 'total_price', 'date']
 
 
+class ReportJobSerializer(serializers.ModelSerializer):
+    requested_by_username = serializers.CharField(source='requested_by.username', read_only=True)
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'report_type', 'params', 'status', 'error', 'requested_by', 'requested_by_username',
+            'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
+
+
 class TimelineEventSerializer(serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     event_type_display = serializers.CharField(source='get_event_type_display', read_only=True)
@@ -1,5 +1,6 @@
 """
-Central timeline logging. Call this from views/serializers when key events happen.
+Central timeline logging. Views emit domain events (main/events.py); record_events() writes
+their timeline entries after commit. log_timeline() records a single entry directly.
 Every sale, payment, loan payment, refund, expense, order, transfer, repair is recorded with created_at.
 """
 from main.models import TimelineEvent
@@ -15,3 +16,19 @@ def log_timeline(event_type, entity_type, entity_id, description, user=None, det
         description=description,
         details=details or {},
     )
+
+
+def record_events(events):
+    """Event subscriber: the timeline entries of a committed batch, in one insert."""
+    TimelineEvent.objects.bulk_create([
+        TimelineEvent(
+            event_type=event_type,
+            entity_type=entity_type,
+            entity_id=entity_id,
+            user=event.user,
+            description=description,
+            details=details or {},
+        )
+        for event in events
+        for event_type, entity_type, entity_id, description, details in event.timeline()
+    ])
@@ -4,7 +4,7 @@ from django.urls import include, path
 from .views import SalesReportAPIView, ShortReportAPIView, CustomerStatementAPIView
 
 from .views import (
-    CategoryViewSet, DashboardMetricsView, LoanViewSet, LogoutView, MeView, MonthlySalesAPIView, ReportSummaryAPIView,
+    CategoryViewSet, DashboardBatchView, DashboardMetricsView, LoanViewSet, LogoutView, MeView, MonthlySalesAPIView, ReportSummaryAPIView,
     RecentLoginsAPIView, RecentSalesAPIView, SalesSummaryAPIView,
     StockEntryViewSet, StockReportAPIView, UserViewSet,
     ProductViewSet, SaleViewSet, ExpenseViewSet,
@@ -12,6 +12,8 @@ from .views import (
     LoginView, get_csrf_token, OrderViewSet, TimelineEventViewSet,
     POSCompleteSaleView, AdminUnitOverviewView, ShopCashbookAPIView, DailyCashCloseView,
     WorkshopCashbookAPIView, WorkshopCashCloseView, AdminCashbookReportView, QuoteViewSet,
+    ReportJobViewSet, PaymentReconciliationView, MobileMoneyImportView, dashboard_stream,
+    admin_unit_overview_async,
 )
 
 router = DefaultRouter()
@@ -32,6 +34,7 @@ router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'customers', CustomerViewSet, basename='customers')
 router.register(r'timeline', TimelineEventViewSet, basename='timeline')
 router.register(r'quotes', QuoteViewSet, basename='quote')
+router.register(r'reports/jobs', ReportJobViewSet, basename='report-job')
 
 # Main API URLs
 urlpatterns = router.urls
@@ -44,17 +47,22 @@ urlpatterns += [
 
     # Reports & dashboard
     path('dashboard/metrics/', DashboardMetricsView.as_view(), name='dashboard-metrics'),
+    path('dashboard/batch/', DashboardBatchView.as_view(), name='dashboard-batch'),
+    path('dashboard/stream/', dashboard_stream, name='dashboard-stream'),
     path('dashboard/monthly-sales/', MonthlySalesAPIView.as_view(), name='monthly-sales'),
     path('dashboard/recent-logins/', RecentLoginsAPIView.as_view(), name='recent-logins'),
     path('dashboard/recent-orders/', RecentSalesAPIView.as_view(), name='recent-sales'),
     path('auth/logout/', LogoutView.as_view(), name='auth-logout'),
     path('pos/complete-sale/', POSCompleteSaleView.as_view(), name='pos-complete-sale'),
     path('admin/unit-overview/', AdminUnitOverviewView.as_view(), name='admin-unit-overview'),
+    path('admin/unit-overview/async/', admin_unit_overview_async, name='admin-unit-overview-async'),
     path('finance/shop-cashbook/', ShopCashbookAPIView.as_view(), name='shop-cashbook'),
     path('finance/shop-cash-close/', DailyCashCloseView.as_view(), name='shop-cash-close'),
     path('finance/workshop-cashbook/', WorkshopCashbookAPIView.as_view(), name='workshop-cashbook'),
     path('finance/workshop-cash-close/', WorkshopCashCloseView.as_view(), name='workshop-cash-close'),
     path('admin/cashbook-report/', AdminCashbookReportView.as_view(), name='admin-cashbook-report'),
+    path('finance/reconciliation/', PaymentReconciliationView.as_view(), name='payment-reconciliation'),
+    path('finance/mobile-money/import/', MobileMoneyImportView.as_view(), name='mobile-money-import'),
     path('dashboard/sales-summary/', SalesSummaryAPIView.as_view(), name='sales-summary'),
     path("reports/sales/", SalesReportAPIView.as_view(), name="sales-report"),
     path("reports/stock/", StockReportAPIView.as_view(), name="stock-report"),
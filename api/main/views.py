@@ -7,16 +7,20 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_GET
 from django.http import JsonResponse
 from django.db import transaction
-from django.db.models import Sum, Count, F
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear, ExtractMonth, Coalesce
+from django.db.models import Sum, Count, F, Max
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear, Coalesce
 from datetime import timedelta
 from django.utils.timezone import now
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
+from datetime import timezone as dt_timezone
 from decimal import Decimal, InvalidOperation
+import hashlib
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from .pagination import OrderPagination, ProductPagination
 from .rounding import round_two
@@ -27,20 +31,35 @@ from django_filters.rest_framework import FilterSet
 from .models import (
     Category, Order, Product, StockEntry, Sale, SaleItem,
     Expense, Customer, Payment, Refund, TimelineEvent, Unit, DailyCashClose,
-    Quote,
+    Quote, ProductTombstone, ReportJob,
 )
 from .serializers import (
     CategorySerializer, ConfirmOrderSerializer, LoanSerializer, OrderSerializer, ProductSerializer, ProductSerializer, RejectOrderSerializer, SaleItemSerializer, StockEntrySerializer,
     SaleSerializer, ExpenseSerializer, CustomerSerializer,
     PaymentSerializer, UserCreateUpdateSerializer, RefundSerializer,
     MeSerializer, LoginSerializer, OrderUpdateSerializer, TimelineEventSerializer,
-    POSCompleteSaleSerializer, QuoteSerializer,
+    POSCompleteSaleSerializer, QuoteSerializer, ReportJobSerializer, RefundLineInputSerializer,
 )
 from .permissions import (
     All, IsAdminOnly, IsAdminOrReadOnly, IsCashierOnly,
     IsCashierOrAdmin, IsStaffOnly, IsStaffOrAdmin,
 )
-from .timeline import log_timeline
+from . import events
+from .events import emit
+from .exports import ExportMixin, EXPORT_RENDERER_CLASSES, export_format, export_rows, stream_export
+from .compact import CompactListMixin
+from .search import search_products, SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from .lookup import product_code_cache
+from .product_import import import_products, read_rows, ImportFormatError
+from . import report_jobs
+from .refunds import RefundError, create_refund, reverse_refund
+from .reconciliation import (
+    MATCH_WINDOW, StatementFormatError, import_statement, read_statement, reconciliation as reconciliation_report,
+)
+from coreshop.authentication import async_api_view
+from .overview import aunit_overview, unit_overview
+from . import widgets
+from .cashbook import close_day, day_summary, expected_cash, frozen_summary, summary_json, range_report as cashbook_range_report
 
 User = get_user_model()
 
@@ -124,108 +143,14 @@ class AdminUnitOverviewView(APIView):
     permission_classes = [IsCashierOrAdmin]
 
     def get(self, request):
-        from django.db.models import Q
-        today = now().date()
-        start_of_month = today.replace(day=1)
-        units = Unit.objects.all().order_by('id')
-
-        result = []
-        for unit in units:
-            expenses_qs = Expense.objects.filter(unit=unit, date__gte=start_of_month)
-            expenses_total = expenses_qs.aggregate(t=Sum('amount'))['t'] or 0
-            expenses_count = expenses_qs.count()
-            expenses_recent = ExpenseSerializer(
-                expenses_qs.select_related('unit', 'recorded_by').order_by('-date')[:10], many=True
-            ).data
-
-            loans_qs = Sale.objects.filter(is_loan=True).exclude(status='refunded')
-            if unit.code == 'shop':
-                loans_qs = loans_qs.filter(Q(unit=unit) | Q(unit__isnull=True))
-            else:
-                loans_qs = loans_qs.filter(unit=unit)
-            loans_count = loans_qs.filter(
-                Q(payment_status='not_paid') | Q(payment_status='partial')
-            ).count()
-            loans_outstanding = sum(
-                (s.final_amount - s.paid_amount)
-                for s in loans_qs.filter(
-                    Q(payment_status='not_paid') | Q(payment_status='partial')
-                )
-            )
-            loans_recent = LoanSerializer(
-                loans_qs.select_related('unit', 'customer', 'user')[:10], many=True
-            ).data
-
-            if unit.code == 'shop':
-                stock_qs = StockEntry.objects.filter(
-                    Q(product__unit=unit) | Q(product__unit__isnull=True)
-                ).select_related('product', 'product__unit', 'recorded_by').order_by('-date')[:50]
-                stock_count = StockEntry.objects.filter(
-                    Q(product__unit=unit) | Q(product__unit__isnull=True)
-                ).count()
-            else:
-                stock_qs = StockEntry.objects.filter(product__unit=unit).select_related(
-                    'product', 'product__unit', 'recorded_by'
-                ).order_by('-date')[:50]
-                stock_count = StockEntry.objects.filter(product__unit=unit).count()
-            stock_recent = StockEntrySerializer(stock_qs[:15], many=True).data
-
-            result.append({
-                'unit': {'id': unit.id, 'code': unit.code, 'name': unit.name},
-                'expenses': {
-                    'count': expenses_count,
-                    'total': float(expenses_total),
-                    'recent': expenses_recent,
-                },
-                'loans': {
-                    'count': loans_count,
-                    'outstanding': float(loans_outstanding),
-                    'recent': loans_recent,
-                },
-                'stock_movements': {
-                    'count': stock_count,
-                    'recent': stock_recent,
-                },
-            })
+        return Response(unit_overview())
 
-        # Add workshop repair debts (RepairInvoice unpaid/partial)
-        workshop = Unit.objects.filter(code='workshop').first()
-        if workshop:
-            try:
-                from onyango.models import RepairInvoice
-                repair_invoices = RepairInvoice.objects.filter(
-                    job__unit=workshop
-                ).filter(
-                    Q(payment_status='unpaid') | Q(payment_status='partial')
-                )
-                repair_debt_count = repair_invoices.count()
-                repair_debt_outstanding = sum(
-                    float(i.total_amount - i.paid_amount)
-                    for i in repair_invoices
-                )
-                unit_data = next((r for r in result if r['unit']['code'] == 'workshop'), None)
-                if unit_data:
-                    unit_data['repair_debts'] = {
-                        'count': repair_debt_count,
-                        'outstanding': repair_debt_outstanding,
-                    }
-            except Exception:
-                pass
 
-        # All units combined (for admin overview)
-        all_expenses = Expense.objects.filter(date__gte=start_of_month)
-        all_loans = Sale.objects.filter(is_loan=True).exclude(status='refunded').filter(
-            Q(payment_status='not_paid') | Q(payment_status='partial')
-        )
-        return Response({
-            'units': result,
-            'totals': {
-                'expenses_count': all_expenses.count(),
-                'expenses_total': float(all_expenses.aggregate(t=Sum('amount'))['t'] or 0),
-                'loans_count': all_loans.count(),
-                'loans_outstanding': sum(float(s.final_amount - s.paid_amount) for s in all_loans),
-            },
-        })
+@require_GET
+@async_api_view(IsCashierOrAdmin)
+async def admin_unit_overview_async(request):
+    """GET admin/unit-overview/async/: AdminUnitOverviewView with its blocks queried concurrently."""
+    return JsonResponse(await aunit_overview())
 
 
 class POSCompleteSaleView(APIView):
@@ -236,19 +161,37 @@ class POSCompleteSaleView(APIView):
         serializer = POSCompleteSaleSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         sale = serializer.save()
-        log_timeline('sale_created', 'sale', sale.id, f"Sale #{sale.id} - TZS {sale.final_amount} ({sale.get_payment_status_display()})", user=request.user, details={'amount': str(sale.final_amount), 'payment_status': sale.payment_status, 'is_loan': sale.is_loan})
-        if sale.paid_amount and float(sale.paid_amount) > 0:
-            evt = 'loan_payment' if sale.is_loan else 'payment_recorded'
-            log_timeline(evt, 'payment', None, f"Payment TZS {sale.paid_amount} for Sale #{sale.id}", user=request.user, details={'sale_id': sale.id, 'amount': str(sale.paid_amount)})
+        emit(events.SaleCompleted(sale=sale, user=request.user))
         return Response(SaleSerializer(sale).data, status=status.HTTP_201_CREATED)
 
 
+CASHBOOK_MAX_RANGE_DAYS = 366
+
+
+def _cashbook_range(request, unit):
+    """?date_from=&date_to= on the cashbooks: per-day totals + running balance (?detail=true adds the rows)."""
+    date_from_str = request.query_params.get('date_from')
+    date_to_str = request.query_params.get('date_to')
+    try:
+        date_to = datetime.strptime(date_to_str.strip(), "%Y-%m-%d").date() if date_to_str else now().date()
+        date_from = datetime.strptime(date_from_str.strip(), "%Y-%m-%d").date() if date_from_str else date_to
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+    if date_from > date_to:
+        return Response({"error": "date_from must be on or before date_to."}, status=status.HTTP_400_BAD_REQUEST)
+    if (date_to - date_from).days >= CASHBOOK_MAX_RANGE_DAYS:
+        return Response({"error": f"Range too long (max {CASHBOOK_MAX_RANGE_DAYS} days)."}, status=status.HTTP_400_BAD_REQUEST)
+    detail = str(request.query_params.get('detail', '')).lower() in ('1', 'true', 'yes')
+    return Response(cashbook_range_report(unit, date_from, date_to, detail=detail))
+
+
 class ShopCashbookAPIView(APIView):
     """
     Daily cashbook for the Shop unit:
     - Payments (sales & loan repayments)
     - Expenses
     - Net cash for the day
+    With date_from/date_to: per-day totals and running balance over the range.
     """
     permission_classes = [permissions.IsAuthenticated, All]
 
@@ -266,6 +209,9 @@ class ShopCashbookAPIView(APIView):
         if not shop:
             return Response({"error": "Shop unit not configured."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if 'date_from' in request.query_params or 'date_to' in request.query_params:
+            return _cashbook_range(request, shop)
+
         # Payments for sales belonging to the shop (or no unit treated as shop)
         payments_qs = Payment.objects.filter(
             payment_date__date=target_date,
@@ -274,13 +220,8 @@ class ShopCashbookAPIView(APIView):
             Q(sale__unit=shop) | Q(sale__unit__isnull=True)
         ).select_related('sale', 'cashier')
 
-        payments_total = payments_qs.aggregate(
-            total=Coalesce(
-                Sum('amount_paid'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
+        close = DailyCashClose.objects.filter(unit=shop, date=target_date).select_related('closed_by').first()
+        summary, frozen = day_summary(shop, target_date, close)
 
         payments = [
             {
@@ -301,24 +242,6 @@ class ShopCashbookAPIView(APIView):
             transfer_order__from_unit=shop,
         ).select_related('transfer_order', 'settled_by')
 
-        settlements_total = settlements_qs.aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
-        # Only cleared settlements should count towards expected cash in till
-        settlements_cleared_qs = settlements_qs.filter(cleared=True)
-        settlements_cleared_total = settlements_cleared_qs.aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
         material_payments = [
             {
                 "id": s.id,
@@ -335,7 +258,7 @@ class ShopCashbookAPIView(APIView):
 
         # Combined incoming cash to shop: sales + workshop materials
         # For expected cash, include only shop sales + CLEARED materials
-        total_incoming = (payments_total or Decimal('0')) + (settlements_cleared_total or Decimal('0'))
+        total_incoming = summary['payments_total'] + summary['settlements_cleared_total']
 
         # Expenses for the shop unit on that date
         expenses_qs = Expense.objects.filter(
@@ -343,13 +266,6 @@ class ShopCashbookAPIView(APIView):
             unit=shop,
         ).select_related('recorded_by')
 
-        expenses_total = expenses_qs.aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
         expenses = [
             {
                 "id": e.id,
@@ -361,17 +277,15 @@ class ShopCashbookAPIView(APIView):
             for e in expenses_qs.order_by('-id')
         ]
 
-        expected_cash = float(total_incoming - expenses_total)
-
-        close = DailyCashClose.objects.filter(unit=shop, date=target_date).first()
-
         return Response(
             {
                 "unit": {"id": shop.id, "code": shop.code, "name": shop.name},
                 "date": target_date.isoformat(),
                 "payments_total": float(total_incoming),
-                "expenses_total": float(expenses_total),
-                "net_cash": expected_cash,
+                "expenses_total": float(summary['expenses_total']),
+                "net_cash": float(expected_cash(shop, summary)),
+                "summary": summary_json(summary),
+                "frozen": frozen,
                 "payments": payments + material_payments,
                 "expenses": expenses,
                 "close": {
@@ -412,44 +326,8 @@ class DailyCashCloseView(APIView):
         except (InvalidOperation, TypeError):
             return Response({"error": "Invalid actual_cash value."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Reuse cashbook computation for expected_cash
-        payments_total = Payment.objects.filter(
-            payment_date__date=target_date,
-            sale__status__in=['confirmed'],
-        ).filter(
-            Q(sale__unit=shop) | Q(sale__unit__isnull=True)
-        ).aggregate(
-            total=Coalesce(
-                Sum('amount_paid'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
-        expenses_total = Expense.objects.filter(
-            date=target_date,
-            unit=shop,
-        ).aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
-        expected_cash = payments_total - expenses_total
-        variance = actual_cash_val - expected_cash
-
-        close, created = DailyCashClose.objects.update_or_create(
-            unit=shop,
-            date=target_date,
-            defaults={
-                "expected_cash": expected_cash,
-                "actual_cash": actual_cash_val,
-                "variance": variance,
-                "closed_by": request.user,
-            },
-        )
+        # Same totals as the cashbook, frozen on the close row
+        close, created = close_day(shop, target_date, actual_cash_val, request.user)
 
         return Response(
             {
@@ -504,13 +382,11 @@ class WorkshopCashbookAPIView(APIView):
     - Incoming: repair payments (RepairPayment for workshop jobs)
     - Outgoing: material payments to shop (TransferSettlement where to_unit=workshop), workshop expenses
     - Net = repair payments - material payments - expenses
+    With date_from/date_to: per-day totals and running balance over the range.
     """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from django.db.models import Value
-        from django.db.models.functions import Coalesce
-        from django.db.models import DecimalField
         from onyango.models import RepairPayment, TransferSettlement
 
         date_str = request.query_params.get('date')
@@ -523,19 +399,17 @@ class WorkshopCashbookAPIView(APIView):
         if not workshop:
             return Response({"error": "Workshop unit not configured."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if 'date_from' in request.query_params or 'date_to' in request.query_params:
+            return _cashbook_range(request, workshop)
+
         # Incoming: repair payments for workshop jobs on this date
         repair_payments_qs = RepairPayment.objects.filter(
             payment_date__date=target_date,
             invoice__job__unit=workshop,
         ).select_related('invoice', 'invoice__job', 'received_by')
 
-        payments_in_total = repair_payments_qs.aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
+        close = DailyCashClose.objects.filter(unit=workshop, date=target_date).select_related('closed_by').first()
+        summary, frozen = day_summary(workshop, target_date, close)
 
         payments_in = [
             {
@@ -556,14 +430,6 @@ class WorkshopCashbookAPIView(APIView):
             transfer_order__to_unit=workshop,
         ).select_related('transfer_order', 'settled_by')
 
-        materials_total = materials_qs.aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
         payments_out_materials = [
             {
                 "id": s.id,
@@ -582,14 +448,6 @@ class WorkshopCashbookAPIView(APIView):
             unit=workshop,
         ).select_related('recorded_by')
 
-        expenses_total = expenses_qs.aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
         expenses = [
             {
                 "id": e.id,
@@ -601,16 +459,17 @@ class WorkshopCashbookAPIView(APIView):
             for e in expenses_qs.order_by('-id')
         ]
 
-        net_cash = payments_in_total - materials_total - expenses_total
-        close = DailyCashClose.objects.filter(unit=workshop, date=target_date).first()
+        materials_total = summary['settlements_cleared_total'] + summary['settlements_uncleared_total']
 
         return Response({
             "unit": {"id": workshop.id, "code": workshop.code, "name": workshop.name},
             "date": target_date.isoformat(),
-            "payments_in_total": float(payments_in_total),
+            "payments_in_total": float(summary['payments_total']),
             "payments_out_materials_total": float(materials_total),
-            "expenses_total": float(expenses_total),
-            "net_cash": float(net_cash),
+            "expenses_total": float(summary['expenses_total']),
+            "net_cash": float(expected_cash(workshop, summary)),
+            "summary": summary_json(summary),
+            "frozen": frozen,
             "payments_in": payments_in,
             "payments_out_materials": payments_out_materials,
             "expenses": expenses,
@@ -632,11 +491,6 @@ class WorkshopCashCloseView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        from django.db.models import Value
-        from django.db.models.functions import Coalesce
-        from django.db.models import DecimalField
-        from onyango.models import RepairPayment, TransferSettlement
-
         workshop = Unit.objects.filter(code='workshop').first()
         if not workshop:
             return Response({"error": "Workshop unit not configured."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -656,52 +510,7 @@ class WorkshopCashCloseView(APIView):
         except (InvalidOperation, TypeError):
             return Response({"error": "Invalid actual_cash value."}, status=status.HTTP_400_BAD_REQUEST)
 
-        payments_in_total = RepairPayment.objects.filter(
-            payment_date__date=target_date,
-            invoice__job__unit=workshop,
-        ).aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
-        materials_total = TransferSettlement.objects.filter(
-            settlement_date__date=target_date,
-            transfer_order__to_unit=workshop,
-        ).aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
-        expenses_total = Expense.objects.filter(
-            date=target_date,
-            unit=workshop,
-        ).aggregate(
-            total=Coalesce(
-                Sum('amount'),
-                Value(0),
-                output_field=DecimalField(max_digits=20, decimal_places=2),
-            )
-        )['total'] or Decimal('0')
-
-        expected_cash = payments_in_total - materials_total - expenses_total
-        variance = actual_cash_val - expected_cash
-
-        close, created = DailyCashClose.objects.update_or_create(
-            unit=workshop,
-            date=target_date,
-            defaults={
-                "expected_cash": expected_cash,
-                "actual_cash": actual_cash_val,
-                "variance": variance,
-                "closed_by": request.user,
-            },
-        )
+        close, created = close_day(workshop, target_date, actual_cash_val, request.user)
 
         return Response(
             {
@@ -720,8 +529,21 @@ class WorkshopCashCloseView(APIView):
 class AdminCashbookReportView(APIView):
     """
     Admin report: list daily cash closes from Shop and/or Workshop with optional date range and unit filter.
+    ?format=csv|xlsx streams the same rows as a spreadsheet.
     """
     permission_classes = [permissions.IsAuthenticated, IsAdminOnly]
+    renderer_classes = EXPORT_RENDERER_CLASSES
+    export_columns = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('unit', 'unit__code'),
+        ('unit_name', 'unit__name'),
+        ('expected_cash', 'expected_cash'),
+        ('actual_cash', 'actual_cash'),
+        ('variance', 'variance'),
+        ('closed_by', 'closed_by__username'),
+        ('created_at', 'created_at'),
+    )
 
     def get(self, request):
         from datetime import datetime as dt
@@ -753,8 +575,13 @@ class AdminCashbookReportView(APIView):
                 except ValueError:
                     return Response({"error": "Invalid unit. Use 'shop', 'workshop', or a unit id."}, status=status.HTTP_400_BAD_REQUEST)
 
+        fmt = export_format(request)
+        if fmt:
+            return stream_export(qs, self.export_columns, 'cashbook-report', fmt)
+
         results = []
         for close in qs:
+            summary = frozen_summary(close)
             results.append({
                 "id": close.id,
                 "date": close.date.isoformat(),
@@ -768,10 +595,81 @@ class AdminCashbookReportView(APIView):
                 "variance": float(close.variance),
                 "closed_by": close.closed_by.username if close.closed_by else None,
                 "created_at": close.created_at.isoformat(),
+                "summary": summary_json(summary) if summary else None,
             })
         return Response({"results": results})
 
 
+RECONCILIATION_MAX_RANGE_DAYS = 93
+MAX_MATCH_WINDOW_MINUTES = 24 * 60
+
+
+class PaymentReconciliationView(APIView):
+    """
+    Expected takings per day, unit and payment method (cash, mobile_money, card, ...), with
+    mobile-money payments matched against imported statement lines.
+    ?date_from=&date_to= (YYYY-MM-DD, default today), ?unit=shop|workshop|<id>.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdminOnly]
+
+    def get(self, request):
+        date_from_str = request.query_params.get('date_from')
+        date_to_str = request.query_params.get('date_to')
+        try:
+            date_to = datetime.strptime(date_to_str.strip(), "%Y-%m-%d").date() if date_to_str else now().date()
+            date_from = datetime.strptime(date_from_str.strip(), "%Y-%m-%d").date() if date_from_str else date_to
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        if date_from > date_to:
+            return Response({"error": "date_from must be on or before date_to."}, status=status.HTTP_400_BAD_REQUEST)
+        if (date_to - date_from).days >= RECONCILIATION_MAX_RANGE_DAYS:
+            return Response({"error": f"Range too long (max {RECONCILIATION_MAX_RANGE_DAYS} days)."}, status=status.HTTP_400_BAD_REQUEST)
+
+        unit = None
+        unit_param = request.query_params.get('unit')
+        if unit_param:
+            if unit_param.lower() in ('shop', 'workshop'):
+                unit = Unit.objects.filter(code=unit_param.lower()).first()
+            else:
+                try:
+                    unit = Unit.objects.filter(id=int(unit_param)).first()
+                except ValueError:
+                    return Response({"error": "Invalid unit. Use 'shop', 'workshop', or a unit id."}, status=status.HTTP_400_BAD_REQUEST)
+            if unit is None:
+                return Response({"error": "Unit not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(reconciliation_report(date_from, date_to, unit))
+
+
+class MobileMoneyImportView(APIView):
+    """
+    Upload a mobile-money statement CSV as 'file' (M-Pesa style headers such as Receipt No.,
+    Completion Time, Paid In, or reference/occurred_at/amount). New lines are stored and
+    matched to mobile-money payments of the same amount within ?window_minutes= (default 30).
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdminOnly]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Upload the statement CSV as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+        window = MATCH_WINDOW
+        if request.query_params.get('window_minutes'):
+            try:
+                minutes = int(request.query_params['window_minutes'])
+            except ValueError:
+                minutes = 0
+            if not 0 < minutes <= MAX_MATCH_WINDOW_MINUTES:
+                return Response({"error": f"window_minutes must be between 1 and {MAX_MATCH_WINDOW_MINUTES}."}, status=status.HTTP_400_BAD_REQUEST)
+            window = timedelta(minutes=minutes)
+        try:
+            rows, errors = read_statement(upload)
+        except (StatementFormatError, UnicodeDecodeError) as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        report = import_statement(rows, user=request.user, window=window)
+        report['errors'] = errors
+        return Response(report)
+
+
 class MeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -826,14 +724,28 @@ class ProductFilter(FilterSet):
         return queryset  # None → return all
 
 # Then in your ViewSet
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(CompactListMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('category').order_by('id')
     serializer_class = ProductSerializer
     permission_classes = [IsAdminOrReadOnly]
+    pagination_class = ProductPagination
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category']
-    search_fields = ['name']
+    search_fields = ['name', 'code', 'category__name']
     ordering_fields = ['quantity_in_stock', 'created_at']
+    compact_fields = (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('code', 'code'),
+        ('category', 'category'),
+        ('category_name', 'category__name'),
+        ('unit', 'unit'),
+        ('buying_price', 'buying_price'),
+        ('selling_price', 'selling_price'),
+        ('wholesale_price', 'wholesale_price'),
+        ('quantity_in_stock', 'quantity_in_stock'),
+        ('threshold', 'threshold'),
+    )
 
     def perform_create(self, serializer):
         product = serializer.save()
@@ -881,6 +793,7 @@ class ProductViewSet(viewsets.ModelViewSet):
                 recorded_by=self.request.user
             )
 
+    @transaction.atomic
     def perform_destroy(self, instance):
         StockEntry.objects.create(
             product=instance,
@@ -888,8 +801,120 @@ class ProductViewSet(viewsets.ModelViewSet):
             quantity=instance.quantity_in_stock,
             recorded_by=self.request.user
         )
+        ProductTombstone.objects.create(product_id=instance.id, code=instance.code)
         instance.delete()
 
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Catalog delta sync for tills: products changed and ids deleted since ?since= (the watermark
+        returned by the previous sync; omit it for a full download). Send the ETag back as
+        If-None-Match to get 304 Not Modified when nothing has changed.
+        """
+        changed = Product.objects.select_related('category')
+        deleted = ProductTombstone.objects.all()
+        since = None
+        since_param = request.query_params.get('since')
+        if since_param:
+            # a '+' offset arrives as a space when the client does not URL-encode it
+            since = parse_datetime(since_param.strip().replace(' ', '+'))
+            if since is None:
+                return Response({"error": "Invalid since. Use the watermark from the previous sync (ISO datetime)."}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            # >= so rows written in the same instant as the watermark are never missed
+            changed = changed.filter(updated_at__gte=since)
+            deleted = deleted.filter(deleted_at__gte=since)
+
+        changed_stats = changed.aggregate(count=Count('id'), last=Max('updated_at'))
+        deleted_stats = deleted.aggregate(count=Count('id'), last=Max('deleted_at'))
+        fingerprint = '|'.join(str(v) for v in (
+            since, changed_stats['count'], changed_stats['last'], deleted_stats['count'], deleted_stats['last'],
+        ))
+        etag = '"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        marks = [m for m in (changed_stats['last'], deleted_stats['last'], since) if m is not None]
+        watermark = max(marks) if marks else None
+        data = {
+            'full': since is None,
+            'watermark': watermark.astimezone(dt_timezone.utc).isoformat().replace('+00:00', 'Z') if watermark else None,
+            'products': ProductSerializer(changed.order_by('updated_at', 'id'), many=True).data,
+            'deleted': list(deleted.values_list('product_id', flat=True).distinct()),
+        }
+        return Response(data, headers={'ETag': etag})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked search over name, code and category: ?q=<text>&limit=<n> (default 20, max 100)."""
+        query = (request.query_params.get('q') or '').strip()
+        if not query:
+            return Response([])
+        try:
+            limit = min(int(request.query_params.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+        except (TypeError, ValueError):
+            return Response({"error": "limit must be a number."}, status=status.HTTP_400_BAD_REQUEST)
+        products = search_products(query, limit=max(limit, 1))
+        return Response(ProductSerializer(products, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def lookup(self, request):
+        """Scanner fast path: ?code=<product code> -> id, name, prices and stock."""
+        code = (request.query_params.get('code') or '').strip()
+        if not code:
+            return Response({"error": "code is required."}, status=status.HTTP_400_BAD_REQUEST)
+        row = product_code_cache.get(code)
+        if row is None:
+            return Response({"error": f"No product with code {code}."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(row)
+
+    @action(detail=False, methods=['get', 'post'], url_path='lookup/batch')
+    def lookup_batch(self, request):
+        """Several codes at once: ?codes=A,B,C or POST {"codes": [...]}. Unknown codes are listed in missing."""
+        if request.method == 'POST':
+            codes = request.data.get('codes') or []
+            if not isinstance(codes, list):
+                return Response({"error": "codes must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            codes = (request.query_params.get('codes') or '').split(',')
+        codes = list(dict.fromkeys(str(c).strip() for c in codes if str(c).strip()))
+        if not codes:
+            return Response({"error": "codes is required."}, status=status.HTTP_400_BAD_REQUEST)
+        found = product_code_cache.get_many(codes)
+        return Response({
+            'results': found,
+            'missing': [code for code in codes if code not in found],
+        })
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminOnly])
+    def import_products(self, request):
+        """
+        Bulk create / reprice products keyed on code: upload a CSV or JSON file as 'file', or
+        send a JSON list (or {"rows": [...]}). ?dry_run=true reports the diff without writing.
+        """
+        dry_run = str(request.query_params.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                rows = read_rows(upload, upload.name)
+            elif isinstance(request.data, list):
+                rows = request.data
+            else:
+                rows = request.data.get('rows')
+                if not isinstance(rows, list):
+                    return Response({"error": "Send a CSV/JSON file as 'file' or a list of rows."}, status=status.HTTP_400_BAD_REQUEST)
+            report, ok = import_products(rows, user=request.user, dry_run=dry_run)
+        except ImportFormatError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if not ok:
+            return Response(report, status=status.HTTP_400_BAD_REQUEST)
+        if not dry_run:
+            emit(events.ProductsImported(report=report, user=request.user))
+        return Response(report)
+
 
 class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all()
@@ -906,19 +931,28 @@ class CustomerViewSet(viewsets.ModelViewSet):
         serializer = SaleItemSerializer(sale_items, many=True)
         return Response(serializer.data)
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all().select_related('sale', 'cashier')
     serializer_class = PaymentSerializer
     permission_classes = [IsStaffOrAdmin]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
-    filterset_fields = ['sale']
+    filterset_fields = ['sale', 'method']
     search_fields = ['sale__id', 'cashier__username']
     ordering_fields = ['payment_date', 'amount_paid']
+    export_filename = 'payments'
+    export_columns = (
+        ('id', 'id'),
+        ('payment_date', 'payment_date'),
+        ('sale_id', 'sale_id'),
+        ('amount_paid', 'amount_paid'),
+        ('payment_method', 'payment_method'),
+        ('method', 'method'),
+        ('cashier', 'cashier__username'),
+    )
 
     def perform_create(self, serializer):
         payment = serializer.save(cashier=self.request.user)
-        evt = 'loan_payment' if getattr(payment.sale, 'is_loan', False) else 'payment_recorded'
-        log_timeline(evt, 'payment', payment.id, f"Payment TZS {payment.amount_paid} for Sale #{payment.sale_id} ({payment.payment_method or 'N/A'})", user=self.request.user, details={'payment_id': payment.id, 'sale_id': payment.sale_id, 'amount': str(payment.amount_paid)})
+        emit(events.PaymentRecorded(payment=payment, user=self.request.user))
 
     def perform_update(self, serializer):
         serializer.save()
@@ -948,7 +982,7 @@ class RefundViewSet(viewsets.ModelViewSet):
         # Reverse the refund effect
         product = instance.product
         product.quantity_in_stock -= instance.quantity
-        product.save(update_fields=['quantity_in_stock'])
+        product.save(update_fields=['quantity_in_stock', 'updated_at'])
 
         sale = instance.sale
         sale.refund_total = (sale.refund_total or 0) - instance.refund_amount
@@ -959,20 +993,33 @@ class RefundViewSet(viewsets.ModelViewSet):
 
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(CompactListMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['customer__name', 'notes']
     ordering_fields = ['created_at', 'status']
     pagination_class = OrderPagination
+    compact_fields = (
+        ('id', 'id'),
+        ('created_at', 'created_at'),
+        ('status', 'status'),
+        ('order_type', 'order_type'),
+        ('discount_amount', 'discount_amount'),
+        ('customer_id', 'customer_id'),
+        ('customer_name', 'customer__name'),
+        ('user_id', 'user_id'),
+        ('username', 'user__username'),
+        ('unit_code', 'user__unit__code'),
+        ('item_count', Count('items')),
+    )
 
     def get_queryset(self):
         user = self.request.user
         status = self.request.query_params.get("status", None)
         date = self.request.query_params.get("date", None)  # <-- new date param
 
-        base_qs = Order.objects.all()
+        base_qs = Order.objects.select_related('user__unit', 'customer').prefetch_related('items__product__category')
 
         if status:
             base_qs = base_qs.filter(status=status)
@@ -1000,7 +1047,7 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         order = serializer.save()
-        log_timeline('order_created', 'order', order.id, f"Order #{order.id} created ({order.get_order_type_display()})", user=self.request.user, details={'order_id': order.id, 'status': order.status})
+        emit(events.OrderCreated(order=order, user=self.request.user))
 
     @action(detail=True, methods=['post'], permission_classes=[IsStaffOrAdmin])
     @transaction.atomic
@@ -1011,11 +1058,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         sale = serializer.save()
-        log_timeline('order_confirmed', 'order', self.get_object().id, f"Order #{self.get_object().id} confirmed → Sale #{sale.id}", user=request.user, details={'order_id': self.get_object().id, 'sale_id': sale.id})
-        log_timeline('sale_created', 'sale', sale.id, f"Sale #{sale.id} - TZS {sale.final_amount} ({sale.get_payment_status_display()})", user=request.user, details={'amount': str(sale.final_amount), 'payment_status': sale.payment_status, 'is_loan': sale.is_loan})
-        if sale.paid_amount and float(sale.paid_amount) > 0:
-            evt = 'loan_payment' if getattr(sale, 'is_loan', False) else 'payment_recorded'
-            log_timeline(evt, 'payment', None, f"Payment TZS {sale.paid_amount} for Sale #{sale.id}", user=request.user, details={'sale_id': sale.id, 'amount': str(sale.paid_amount)})
+        emit(events.SaleCompleted(sale=sale, order_id=sale.order_id, user=request.user))
         return Response(SaleSerializer(sale).data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['patch'], permission_classes=[IsStaffOrAdmin])
@@ -1051,7 +1094,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        log_timeline('order_rejected', 'order', order.id, f"Order #{order.id} rejected", user=request.user, details={'order_id': order.id})
+        emit(events.OrderRejected(order_id=order.id, user=request.user))
         return Response({'message': 'Order rejected successfully'}, status=200)
 
     @action(detail=True, methods=["post"], permission_classes=[IsStaffOrAdmin])
@@ -1083,7 +1126,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         return Response({"message": "Rejected order permanently deleted."}, status=204)
     
 
-class SaleViewSet(viewsets.ReadOnlyModelViewSet):
+class SaleViewSet(ExportMixin, CompactListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
     permission_classes = [All]
@@ -1091,10 +1134,48 @@ class SaleViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['fulfillment_status', 'status', 'payment_status']
     search_fields = ['customer__name', 'payment_method']
     ordering_fields = ['date', 'total_amount', 'status']
+    export_filename = 'sales'
+    export_columns = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('unit', 'unit__code'),
+        ('customer', 'customer__name'),
+        ('cashier', 'user__username'),
+        ('sale_type', 'sale_type'),
+        ('status', 'status'),
+        ('payment_status', 'payment_status'),
+        ('payment_method', 'payment_method'),
+        ('total_amount', 'total_amount'),
+        ('discount_amount', 'discount_amount'),
+        ('final_amount', 'final_amount'),
+        ('paid_amount', 'paid_amount'),
+        ('refund_total', 'refund_total'),
+        ('is_loan', 'is_loan'),
+    )
+    compact_fields = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('unit', 'unit'),
+        ('customer_id', 'customer_id'),
+        ('customer_name', 'customer__name'),
+        ('cashier', 'user__username'),
+        ('sale_type', 'sale_type'),
+        ('status', 'status'),
+        ('payment_status', 'payment_status'),
+        ('payment_method', 'payment_method'),
+        ('total_amount', 'total_amount'),
+        ('discount_amount', 'discount_amount'),
+        ('final_amount', 'final_amount'),
+        ('paid_amount', 'paid_amount'),
+        ('refund_total', 'refund_total'),
+        ('is_loan', 'is_loan'),
+        ('fulfillment_status', 'fulfillment_status'),
+        ('item_count', Count('items')),
+    )
 
     def get_queryset(self):
         user = self.request.user
-        qs = Sale.objects.all().select_related('customer', 'user', 'checked_by').prefetch_related('items__product')
+        qs = Sale.objects.all().select_related('customer', 'user', 'checked_by').prefetch_related('items__product__category')
 
         # 🔐 Role restriction: cashier sees only their sales
         if user.role == 'cashier':
@@ -1164,17 +1245,24 @@ class SaleViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Create Refund (model save() updates sale status, refund_total, creates Payment, returns stock)
-        refund = Refund.objects.create(
-            sale=sale,
-            refunded_by=request.user,
-            total_refund_amount=sale.paid_amount
-        )
+        # Optional {"lines": [{"sale_item": id, "quantity": q}]} for a partial refund; default is the whole sale
+        lines = None
+        if request.data.get('lines') is not None:
+            line_serializer = RefundLineInputSerializer(data=request.data.get('lines'), many=True)
+            line_serializer.is_valid(raise_exception=True)
+            lines = line_serializer.validated_data
+        try:
+            refund = create_refund(sale, request.user, lines)
+        except RefundError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
-        log_timeline('refund_created', 'refund', refund.id, f"Refund #{refund.id} - TZS {refund.total_refund_amount} for Sale #{sale.id}", user=request.user, details={'refund_id': refund.id, 'sale_id': sale.id, 'amount': str(refund.total_refund_amount)})
+        emit(events.RefundCreated(refund=refund, user=request.user))
 
         return Response(
-            {"detail": f"Refund processed. Refunded amount: {refund.total_refund_amount} TZS"},
+            {
+                "detail": f"Refund processed. Refunded amount: {refund.total_refund_amount} TZS",
+                "refund": RefundSerializer(refund).data,
+            },
             status=status.HTTP_200_OK
         )
 
@@ -1183,57 +1271,7 @@ class SalesSummaryAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        today = now().date()
-        current_year = today.year
-        current_month = today.month
-        base_qs = _sales_queryset_for_unit(request)
-
-        current_month_revenue = (
-            base_qs
-            .filter(date__year=current_year, date__month=current_month)
-            .aggregate(total=Sum('paid_amount'))['total'] or 0
-        )
-
-        monthly_sales_count = (
-            base_qs
-            .filter(date__year=current_year, date__month=current_month)
-            .count()
-        )
-
-        if current_month == 1:
-            prev_year = current_year - 1
-            prev_month = 12
-        else:
-            prev_year = current_year
-            prev_month = current_month - 1
-
-        prev_month_revenue = (
-            base_qs
-            .filter(date__year=prev_year, date__month=prev_month)
-            .aggregate(total=Sum('paid_amount'))['total'] or 0
-        )
-
-        todays_revenue = (
-            base_qs
-            .filter(date__date=today)
-            .aggregate(total=Sum('paid_amount'))['total'] or 0
-        )
-
-        if prev_month_revenue == 0:
-            progress_percent = 100.0 if current_month_revenue > 0 else 0.0
-        else:
-            progress_percent = ((current_month_revenue - prev_month_revenue) / prev_month_revenue) * 100
-
-        data = {
-            "monthly_revenue": float(current_month_revenue),
-            "monthly_sales_count": monthly_sales_count,
-            "todays_revenue": float(todays_revenue),
-            "prev_month_revenue": float(prev_month_revenue),
-            "progress_percent": round(progress_percent, 2),
-        }
-        return Response(data)
-
-
+        return Response(widgets.sales_summary(widgets.WidgetContext(request), request.query_params))
 
 
 from rest_framework import viewsets, status
@@ -1359,8 +1397,8 @@ class LoanViewSet(viewsets.ReadOnlyModelViewSet):
                 cashier=request.user,
                 payment_method=payment_method,
             )
-            # Payment.save() triggers sale.update_paid_amount() and sale.save() (which sets payment_status)
-        log_timeline('loan_payment', 'payment', None, f"Loan payment TZS {amount} for Sale #{sale.id}", user=request.user, details={'sale_id': sale.id, 'amount': str(amount)})
+            # Payment.save() adds the amount to sale.paid_amount and updates payment_status in one UPDATE
+        emit(events.LoanPaymentRecorded(sale_id=sale.id, amount=amount, user=request.user))
 
         return Response({"message": "Payment recorded successfully"}, status=status.HTTP_200_OK)
 
@@ -1368,9 +1406,19 @@ class LoanViewSet(viewsets.ReadOnlyModelViewSet):
 
 #Update ExpenseViewSet` to filter expenses by date range
 from django.utils.dateparse import parse_date
-class ExpenseViewSet(viewsets.ModelViewSet):
+class ExpenseViewSet(ExportMixin, viewsets.ModelViewSet):
     serializer_class = ExpenseSerializer
     permission_classes = [All]
+    export_filename = 'expenses'
+    export_columns = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('unit', 'unit__code'),
+        ('category', 'category'),
+        ('description', 'description'),
+        ('amount', 'amount'),
+        ('recorded_by', 'recorded_by__username'),
+    )
 
     def get_queryset(self):
         request = self.request
@@ -1419,7 +1467,7 @@ class ExpenseViewSet(viewsets.ModelViewSet):
             except (ValueError, TypeError):
                 pass
         expense = serializer.save(recorded_by=user)
-        log_timeline('expense_created', 'expense', expense.id, f"Expense: {expense.description} - TZS {expense.amount} ({expense.get_category_display()})", user=self.request.user, details={'expense_id': expense.id, 'amount': str(expense.amount), 'category': expense.category})
+        emit(events.ExpenseRecorded(expense=expense, user=self.request.user))
 
 
 class StockEntryFilter(django_filters.FilterSet):
@@ -1433,7 +1481,7 @@ class StockEntryFilter(django_filters.FilterSet):
         fields = ['start_date', 'end_date', 'product', 'unit']
 
 
-class StockEntryViewSet(viewsets.ReadOnlyModelViewSet):
+class StockEntryViewSet(ExportMixin, CompactListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = StockEntrySerializer
     permission_classes = [All]
     filter_backends = [
@@ -1444,10 +1492,36 @@ class StockEntryViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = StockEntryFilter
     search_fields = ['product__name', 'recorded_by__username']
     ordering_fields = ['date', 'quantity']
+    export_filename = 'stock-entries'
+    export_columns = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('product_id', 'product_id'),
+        ('product_code', 'product__code'),
+        ('product', 'product__name'),
+        ('entry_type', 'entry_type'),
+        ('quantity', 'quantity'),
+        ('ref_type', 'ref_type'),
+        ('ref_id', 'ref_id'),
+        ('recorded_by', 'recorded_by__username'),
+    )
+    compact_fields = (
+        ('id', 'id'),
+        ('date', 'date'),
+        ('entry_type', 'entry_type'),
+        ('quantity', 'quantity'),
+        ('product_id', 'product_id'),
+        ('product_name', 'product__name'),
+        ('product_code', 'product__code'),
+        ('category_name', 'product__category__name'),
+        ('ref_type', 'ref_type'),
+        ('ref_id', 'ref_id'),
+        ('recorded_by_username', 'recorded_by__username'),
+    )
 
     def get_queryset(self):
         user = self.request.user
-        qs = StockEntry.objects.all().select_related('product', 'product__unit', 'recorded_by').order_by('-date')
+        qs = StockEntry.objects.all().select_related('product__category', 'product__unit', 'recorded_by__unit').order_by('-date')
         # Non-admin: filter by user's unit (product.unit)
         if user.role not in ('admin', 'owner', 'manager') and user.unit_id:
             qs = qs.filter(product__unit=user.unit)
@@ -1482,10 +1556,10 @@ class TimelineEventViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 
-from django.db.models import Q, Sum, Count, F, ExpressionWrapper, DecimalField, Value
+from django.db.models import Q, Sum, Count, F, ExpressionWrapper, DecimalField
 
 from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, TruncYear
-from django.db.models import Sum, F, ExpressionWrapper, DecimalField, Q, Count, Value
+from django.db.models import Sum, F, ExpressionWrapper, DecimalField, Q, Count
 from django.utils.timezone import now
 from datetime import timedelta
 from rest_framework.response import Response
@@ -1542,84 +1616,97 @@ class ReportSummaryAPIView(APIView):
 
 
 class RefundViewSet(viewsets.ModelViewSet):
-    queryset = Refund.objects.all()
+    queryset = Refund.objects.all().select_related('refunded_by').prefetch_related('items__product')
     serializer_class = RefundSerializer
     permission_classes = [IsStaffOrAdmin]
     filter_backends = [filters.OrderingFilter, filters.SearchFilter]
     search_fields = ['sale__id', 'refunded_by__username']
-    ordering_fields = ['refund_date', 'refund_amount']
+    ordering_fields = ['refund_date', 'total_refund_amount']
 
-    @transaction.atomic
     def perform_create(self, serializer):
-        # Refund model handles stock and sale refund_total automatically
-        refund = serializer.save(refunded_by=self.request.user)
-        log_timeline('refund_created', 'refund', refund.id, f"Refund #{refund.id} - TZS {refund.total_refund_amount} for Sale #{refund.sale_id}", user=self.request.user, details={'refund_id': refund.id, 'sale_id': refund.sale_id, 'amount': str(refund.total_refund_amount)})
+        # main.refunds.create_refund handles stock, the reversing payment and sale totals
+        refund = serializer.save()
+        emit(events.RefundCreated(refund=refund, user=self.request.user))
+
+    def perform_update(self, serializer):
+        raise ValidationError("Refunds cannot be updated. Cancel and create a new one if needed.")
 
-    @transaction.atomic
     def perform_destroy(self, instance):
-        # Rollback stock
-        instance.product.remove_stock(instance.quantity, instance.refunded_by)
+        try:
+            reverse_refund(instance, self.request.user)
+        except RefundError as exc:
+            raise ValidationError(str(exc))
 
-        # Adjust sale refund_total
-        sale = instance.sale
-        sale.refund_total = (sale.refund_total or 0) - instance.refund_amount
-        if sale.refund_total <= 0:
-            sale.status = 'confirmed'
-            sale.payment_status = 'paid' if sale.paid_amount >= sale.final_amount else 'partial'
-        sale.save()
 
-        instance.delete()
 
+@require_GET
+@async_api_view()
+async def dashboard_stream(request):
+    """
+    GET dashboard/stream/: Server-Sent Events with live dashboard deltas (see main/live.py).
+    ?types=sale,payment limits the delta types; a reconnecting EventSource resumes from its
+    Last-Event-ID (or ?last_event_id=), or gets a `resync` event to reload when that is too old.
+    """
+    from django.http import StreamingHttpResponse
+    from . import live
+
+    types = None
+    if request.GET.get('types'):
+        types = {t.strip() for t in request.GET['types'].split(',') if t.strip()}
+        unknown = types - set(live.DELTA_TYPES)
+        if unknown:
+            return JsonResponse({'error': f"Unknown delta type(s): {', '.join(sorted(unknown))}. Use {', '.join(live.DELTA_TYPES)}."}, status=400)
+    raw_last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_id = int(raw_last_id) if raw_last_id else None
+    except ValueError:
+        last_id = None
+
+    response = StreamingHttpResponse(live.stream(last_id, types), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: do not buffer the stream
+    return response
 
 
-def _sales_queryset_for_unit(request):
-    """Sale queryset (non-refunded), optionally filtered by unit (query param unit_id)."""
-    from django.db.models import Q
-    qs = Sale.objects.exclude(status='refunded')
-    unit_id = request.query_params.get('unit')
-    if unit_id:
-        unit = Unit.objects.filter(id=unit_id).first()
-        if unit:
-            if unit.code == 'shop':
-                qs = qs.filter(Q(unit=unit) | Q(unit__isnull=True))
-            else:
-                qs = qs.filter(unit=unit)
-    return qs
+class DashboardMetricsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(widgets.dashboard_metrics(widgets.WidgetContext(request), request.query_params))
 
 
-class DashboardMetricsView(APIView):
+class DashboardBatchView(APIView):
+    """
+    Several dashboard widgets in one round trip, sharing one user/unit context and query cache
+    (main/widgets.py). Results are keyed by widget key (default: the name); a widget the user
+    may not see gets {"error": ..., "status": 403}.
+    POST {"widgets": ["metrics", {"name": "sales-summary", "params": {"unit": 1}, "key": "shop-summary"}]}
+    GET ?widgets=metrics,sales-summary&unit=1 (the other query params go to every widget)
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        valid_sales = _sales_queryset_for_unit(request)
-        total_sales = valid_sales.count()
-        total_revenue = valid_sales.aggregate(total=Sum('paid_amount'))['total'] or 0
-        return Response({
-            'total_sales': total_sales,
-            'total_revenue': float(total_revenue),
-        })
+        params = {key: value for key, value in request.query_params.items() if key != 'widgets'}
+        names = [name.strip() for name in request.query_params.get('widgets', '').split(',') if name.strip()]
+        return self._run(request, [{'name': name, 'params': params} for name in names])
 
+    def post(self, request):
+        payload = request.data.get('widgets') if isinstance(request.data, dict) else None
+        return self._run(request, payload)
+
+    def _run(self, request, payload):
+        try:
+            batch = widgets.parse_batch(payload)
+        except widgets.WidgetError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': widgets.run_batch(widgets.WidgetContext(request), batch, view=self)})
 
 
 class MonthlySalesAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        current_year = now().year
-        base_qs = _sales_queryset_for_unit(request)
-        monthly_sales = (
-            base_qs
-            .filter(date__year=current_year)
-            .annotate(month=ExtractMonth('date'))
-            .values('month')
-            .annotate(total_amount=Sum('paid_amount'))
-            .order_by('month')
-        )
-        sales_data = [0] * 12
-        for entry in monthly_sales:
-            sales_data[entry['month'] - 1] = float(entry['total_amount'] or 0)
-        return Response({"sales": sales_data})
-
+        return Response(widgets.monthly_sales(widgets.WidgetContext(request), request.query_params))
 
 
 from django.db.models import Sum, F, Q
@@ -1752,23 +1839,14 @@ class RecentLoginsAPIView(APIView):
     permission_classes = [IsAdminOnly]
 
     def get(self, request):
-        recent_users = User.objects.filter(last_login__isnull=False).order_by('-last_login')[:5]
-        data = [
-            {"username": u.username, "last_login": u.last_login, "role": u.role}
-            for u in recent_users
-        ]
-        return Response(data)
+        return Response(widgets.recent_logins(widgets.WidgetContext(request), request.query_params))
 
 
 class RecentSalesAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        base_qs = _sales_queryset_for_unit(request)
-        recent_sales = base_qs.order_by('-date')[:10]
-        serializer = SaleSerializer(recent_sales, many=True)
-        return Response(serializer.data)
-
+        return Response(widgets.recent_orders(widgets.WidgetContext(request), request.query_params))
 
 
 # StockReportAPIView
@@ -2102,11 +2180,72 @@ class ShortReportAPIView(APIView):
         }, status=200)
 
 
+class ReportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Heavy reports run in the background (manage.py run_report_jobs).
+    POST {"report_type": "sales"|"stock"|"short", "params": {...same query params as the report...}}
+    queues a job (or returns the identical one already queued/running); poll the job, then
+    GET result/ for the JSON, or result/?format=csv|xlsx for its table.
+    """
+    serializer_class = ReportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = EXPORT_RENDERER_CLASSES
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status', 'report_type']
+
+    def get_queryset(self):
+        qs = ReportJob.objects.select_related('requested_by')
+        if self.request.user.role != 'admin':
+            qs = qs.filter(requested_by=self.request.user)
+        return qs
+
+    def create(self, request):
+        report_type = request.data.get('report_type')
+        if report_type not in report_jobs.REPORTS:
+            return Response({"error": f"report_type must be one of: {', '.join(report_jobs.REPORTS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        params = request.data.get('params') or {}
+        if not isinstance(params, dict):
+            return Response({"error": "params must be an object."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Same access rules as the synchronous report
+        view_class = report_jobs.report_view_class(report_type)
+        for permission_class in view_class.permission_classes:
+            if not permission_class().has_permission(request, self):
+                return Response({"error": "You do not have permission to run this report."}, status=status.HTTP_403_FORBIDDEN)
+
+        job, created = report_jobs.submit(report_type, params, request.user)
+        return Response(self.get_serializer(job).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'done':
+            return Response({"error": f"Report is {job.status}.", "status": job.status, "detail": job.error or None}, status=status.HTTP_409_CONFLICT)
+        fmt = export_format(request)
+        if fmt:
+            headers, rows = report_jobs.result_table(job)
+            return export_rows(headers, rows, f'{job.report_type}-report-{job.id}', fmt)
+        return Response(job.result)
+
+
 class CustomerStatementAPIView(APIView):
     """
     Per-customer shop statement: sales, payments, and outstanding balances.
+    ?format=csv|xlsx streams one row per sale instead.
     """
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = EXPORT_RENDERER_CLASSES
+    export_columns = (
+        ('sale_id', 'id'),
+        ('date', 'date'),
+        ('sale_type', 'sale_type'),
+        ('status', 'status'),
+        ('payment_status', 'payment_status'),
+        ('final_amount', 'final_amount'),
+        ('paid_amount', 'paid_amount'),
+        ('outstanding', 'outstanding'),
+        ('cashier', 'user__username'),
+    )
 
     def get(self, request):
         customer_id = request.query_params.get("customer_id")
@@ -2141,6 +2280,13 @@ class CustomerStatementAPIView(APIView):
         elif end_date:
             sales_qs = sales_qs.filter(date__date__lte=end_date)
 
+        fmt = export_format(request)
+        if fmt:
+            export_qs = sales_qs.annotate(
+                outstanding=ExpressionWrapper(F('final_amount') - F('paid_amount'), output_field=DecimalField(max_digits=20, decimal_places=2))
+            ).order_by('date', 'id')
+            return stream_export(export_qs, self.export_columns, f'customer-{customer.id}-statement', fmt)
+
         sales_qs = sales_qs.select_related('user').prefetch_related('items__product', 'payments')
 
         sales_data = []
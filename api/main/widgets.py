@@ -0,0 +1,187 @@
+"""
+Dashboard widgets: the bodies of dashboard/metrics/, monthly-sales/, sales-summary/,
+recent-logins/, recent-orders/ and onyango/dashboard/, and dashboard/batch/ which evaluates
+several of them in one request.
+
+A widget is a function (ctx, params) -> data. The WidgetContext holds the request and a
+request-scoped query cache, so the widgets of one batch share their unit lookups and sales
+aggregates: monthly-sales and sales-summary read the same per-month totals, and every
+unit-filtered widget resolves ?unit= once.
+"""
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractMonth
+from django.utils.timezone import now
+from rest_framework import permissions
+
+from .models import Sale, Unit
+from .permissions import IsAdminOnly
+from .serializers import SaleSerializer
+
+MAX_BATCH_WIDGETS = 20
+
+
+class WidgetError(ValueError):
+    pass
+
+
+class WidgetContext:
+    """The request (user, auth) and query cache shared by the widgets of one request."""
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+        self._cache = {}
+
+    def cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def unit(self, unit_id):
+        if not unit_id:
+            return None
+        try:
+            unit_id = int(unit_id)
+        except (TypeError, ValueError):
+            return None
+        return self.cached(('unit', unit_id), lambda: Unit.objects.filter(id=unit_id).first())
+
+    def sales(self, unit_id):
+        """Sale queryset (non-refunded), optionally filtered by unit (the unit param)."""
+        qs = Sale.objects.exclude(status='refunded')
+        unit = self.unit(unit_id)
+        if unit:
+            if unit.code == 'shop':
+                qs = qs.filter(Q(unit=unit) | Q(unit__isnull=True))
+            else:
+                qs = qs.filter(unit=unit)
+        return qs
+
+    def monthly_totals(self, unit_id, year):
+        """{month: (paid total, sale count)} for the year, one grouped query per unit and year."""
+        def compute():
+            rows = (
+                self.sales(unit_id)
+                .filter(date__year=year)
+                .annotate(month=ExtractMonth('date'))
+                .values('month')
+                .annotate(total=Sum('paid_amount'), count=Count('id'))
+                .order_by('month')
+            )
+            return {row['month']: (row['total'] or 0, row['count']) for row in rows}
+        return self.cached(('monthly', self.unit(unit_id), year), compute)
+
+
+def dashboard_metrics(ctx, params):
+    totals = ctx.sales(params.get('unit')).aggregate(count=Count('id'), revenue=Sum('paid_amount'))
+    return {
+        'total_sales': totals['count'],
+        'total_revenue': float(totals['revenue'] or 0),
+    }
+
+
+def monthly_sales(ctx, params):
+    sales_data = [0] * 12
+    for month, (total, _) in ctx.monthly_totals(params.get('unit'), now().year).items():
+        sales_data[month - 1] = float(total)
+    return {"sales": sales_data}
+
+
+def sales_summary(ctx, params):
+    today = now().date()
+    unit_id = params.get('unit')
+    current_month_revenue, monthly_sales_count = ctx.monthly_totals(unit_id, today.year).get(today.month, (0, 0))
+    if today.month == 1:
+        prev_year, prev_month = today.year - 1, 12
+    else:
+        prev_year, prev_month = today.year, today.month - 1
+    prev_month_revenue = ctx.monthly_totals(unit_id, prev_year).get(prev_month, (0, 0))[0]
+    todays_revenue = ctx.sales(unit_id).filter(date__date=today).aggregate(total=Sum('paid_amount'))['total'] or 0
+
+    if prev_month_revenue == 0:
+        progress_percent = 100.0 if current_month_revenue > 0 else 0.0
+    else:
+        progress_percent = ((current_month_revenue - prev_month_revenue) / prev_month_revenue) * 100
+
+    return {
+        "monthly_revenue": float(current_month_revenue),
+        "monthly_sales_count": monthly_sales_count,
+        "todays_revenue": float(todays_revenue),
+        "prev_month_revenue": float(prev_month_revenue),
+        "progress_percent": round(progress_percent, 2),
+    }
+
+
+def recent_logins(ctx, params):
+    from django.contrib.auth import get_user_model
+    recent_users = get_user_model().objects.filter(last_login__isnull=False).order_by('-last_login')[:5]
+    return [
+        {"username": u.username, "last_login": u.last_login, "role": u.role}
+        for u in recent_users
+    ]
+
+
+def recent_orders(ctx, params):
+    recent_sales = (
+        ctx.sales(params.get('unit'))
+        .select_related('customer', 'user', 'checked_by')
+        .prefetch_related('items__product__category')
+        .order_by('-date')[:10]
+    )
+    return SaleSerializer(recent_sales, many=True).data
+
+
+def onyango_dashboard(ctx, params):
+    from onyango.dashboard import onyango_dashboard as dashboard
+    return dashboard()
+
+
+# name: (widget, permission classes of its standalone view)
+WIDGETS = {
+    'metrics': (dashboard_metrics, [permissions.IsAuthenticated]),
+    'monthly-sales': (monthly_sales, [permissions.IsAuthenticated]),
+    'sales-summary': (sales_summary, [permissions.IsAuthenticated]),
+    'recent-logins': (recent_logins, [IsAdminOnly]),
+    'recent-orders': (recent_orders, [permissions.IsAuthenticated]),
+    'onyango-dashboard': (onyango_dashboard, [permissions.IsAuthenticated]),
+}
+
+
+def parse_batch(payload):
+    """
+    [(key, name, params), ...] from a batch payload: a list of widget names or
+    {"name": ..., "params": {...}, "key": ...} objects (key defaults to the name).
+    """
+    if not isinstance(payload, list) or not payload:
+        raise WidgetError("widgets must be a non-empty list.")
+    if len(payload) > MAX_BATCH_WIDGETS:
+        raise WidgetError(f"At most {MAX_BATCH_WIDGETS} widgets per batch.")
+    parsed = []
+    for item in payload:
+        if isinstance(item, str):
+            item = {'name': item}
+        if not isinstance(item, dict):
+            raise WidgetError("Each widget must be a name or an object with a name.")
+        name, params = item.get('name'), item.get('params') or {}
+        if not isinstance(name, str) or name not in WIDGETS:
+            raise WidgetError(f"Unknown widget {name!r}. Use {', '.join(WIDGETS)}.")
+        if not isinstance(params, dict):
+            raise WidgetError(f"params of {name!r} must be an object.")
+        parsed.append((str(item.get('key') or name), name, params))
+    keys = [key for key, _, _ in parsed]
+    duplicates = sorted({key for key in keys if keys.count(key) > 1})
+    if duplicates:
+        raise WidgetError(f"Duplicate widget key(s): {', '.join(duplicates)}. Give repeated widgets a distinct key.")
+    return parsed
+
+
+def run_batch(ctx, widgets, view=None):
+    """{key: data} for the parsed widgets; a widget the user may not see gets {'error': ..., 'status': 403}."""
+    results = {}
+    for key, name, params in widgets:
+        widget, permission_classes = WIDGETS[name]
+        if not all(permission().has_permission(ctx.request, view) for permission in permission_classes):
+            results[key] = {'error': 'You do not have permission to perform this action.', 'status': 403}
+            continue
+        results[key] = widget(ctx, params)
+    return results
@@ -3,7 +3,7 @@ from .models import (
     Supplier, PurchaseOrder, PurchaseOrderLine, GoodsReceipt, GoodsReceiptLine,
     RepairJob, RepairJobPart, LabourCharge, RepairInvoice, RepairPayment,
     MaterialRequest, MaterialRequestLine, TransferOrder, TransferOrderLine, TransferSettlement,
-    ActivityLog,
+    TransferBalance, ActivityLog,
 )
 
 
@@ -62,7 +62,8 @@ class RepairInvoiceAdmin(admin.ModelAdmin):
 
 @admin.register(RepairPayment)
 class RepairPaymentAdmin(admin.ModelAdmin):
-    list_display = ('invoice', 'amount', 'payment_method', 'payment_date', 'received_by')
+    list_display = ('invoice', 'amount', 'payment_method', 'method', 'payment_date', 'received_by')
+    list_filter = ('method', 'payment_date')
 
 
 class MaterialRequestLineInline(admin.TabularInline):
@@ -94,6 +95,12 @@ class TransferSettlementAdmin(admin.ModelAdmin):
     list_display = ('id', 'transfer_order', 'amount', 'settlement_date', 'settled_by')
 
 
+@admin.register(TransferBalance)
+class TransferBalanceAdmin(admin.ModelAdmin):
+    list_display = ('from_unit', 'to_unit', 'open_count', 'outstanding', 'updated_at')
+    readonly_fields = ('from_unit', 'to_unit', 'open_count', 'outstanding', 'updated_at')
+
+
 @admin.register(ActivityLog)
 class ActivityLogAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'action', 'entity_type', 'entity_id', 'timestamp')
@@ -7,4 +7,14 @@ class OnyangoConfig(AppConfig):
     verbose_name = 'Onyango Hardware'
 
     def ready(self):
-        pass
+        from django.db.models.signals import post_save, post_delete
+        from .board import invalidate_board
+        post_save.connect(invalidate_board, sender='onyango.RepairJob', dispatch_uid='repair_board_save')
+        post_delete.connect(invalidate_board, sender='onyango.RepairJob', dispatch_uid='repair_board_delete')
+        from .models import recount_unit_balances
+        post_delete.connect(recount_unit_balances, sender='main.Unit', dispatch_uid='transfer_balance_unit_delete')
+        from main.events import subscribe
+        from .events import record_activity
+        from .profitability import invalidate_report
+        subscribe(record_activity)
+        subscribe(invalidate_report)
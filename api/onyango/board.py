@@ -0,0 +1,125 @@
+"""
+Workshop workload board (repair-jobs/board/).
+
+Queue metrics come from three grouped queries (jobs per status, open jobs per technician,
+turnaround per job type) and are cached in Django's cache. RepairJob saves and deletes bump a
+generation number (signals wired in OnyangoConfig.ready), which retires every cached board at
+once; BOARD_CACHE_SECONDS bounds staleness for workers whose local cache missed the bump.
+Ages are computed from the cached intake dates at read time, so they stay current on a hit.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from .models import RepairJob
+
+BOARD_CACHE_SECONDS = 60
+BOARD_GENERATION_KEY = 'onyango:repair-board:generation'
+OPEN_STATUSES = ('received', 'in_progress', 'on_hold')
+# Fields whose change moves a job on the board
+BOARD_FIELDS = {'status', 'assigned_to', 'due_date', 'intake_date', 'completed_date', 'job_type', 'unit'}
+TURNAROUND_DAYS = 90
+
+
+def _generation():
+    return cache.get_or_set(BOARD_GENERATION_KEY, 1, None)
+
+
+def invalidate_board(sender=None, instance=None, update_fields=None, **kwargs):
+    """Signal receiver: a job changed status (or was added/removed), so cached boards are stale."""
+    if update_fields is not None and not BOARD_FIELDS.intersection(update_fields):
+        return
+    try:
+        cache.incr(BOARD_GENERATION_KEY)
+    except ValueError:
+        cache.set(BOARD_GENERATION_KEY, 2, None)
+
+
+def _compute(unit_id, today, turnaround_days):
+    jobs = RepairJob.objects.all()
+    if unit_id:
+        jobs = jobs.filter(unit_id=unit_id)
+
+    by_status = {code: 0 for code, _ in RepairJob.STATUS_CHOICES}
+    for row in jobs.values('status').annotate(n=Count('id')).order_by():
+        by_status[row['status']] = row['n']
+
+    technician_rows = (
+        jobs.filter(status__in=OPEN_STATUSES)
+        .values('assigned_to', 'assigned_to__username')
+        .annotate(
+            open=Count('id'),
+            **{s: Count('id', filter=Q(status=s)) for s in OPEN_STATUSES},
+            high_priority=Count('id', filter=Q(priority='high')),
+            overdue=Count('id', filter=Q(due_date__lt=today)),
+            due_today=Count('id', filter=Q(due_date=today)),
+            oldest_intake=Min('intake_date'),
+        )
+        .order_by('-open', 'assigned_to__username')
+    )
+    technicians = [
+        {
+            'technician_id': row['assigned_to'],
+            'technician': row['assigned_to__username'] if row['assigned_to'] else None,
+            'open': row['open'],
+            'by_status': {s: row[s] for s in OPEN_STATUSES},
+            'high_priority': row['high_priority'],
+            'overdue': row['overdue'],
+            'due_today': row['due_today'],
+            'oldest_intake': row['oldest_intake'],
+        }
+        for row in technician_rows
+    ]
+
+    turnaround_rows = (
+        jobs.filter(completed_date__isnull=False, completed_date__date__gte=today - timedelta(days=turnaround_days))
+        .values('job_type', 'job_type__name')
+        .annotate(
+            completed=Count('id'),
+            avg_turnaround=Avg(ExpressionWrapper(F('completed_date') - F('intake_date'), output_field=DurationField())),
+        )
+        .order_by('job_type__name')
+    )
+    turnaround = [
+        {
+            'job_type_id': row['job_type'],
+            'job_type': row['job_type__name'],
+            'completed': row['completed'],
+            'avg_turnaround_hours': round(row['avg_turnaround'].total_seconds() / 3600, 2) if row['avg_turnaround'] is not None else None,
+        }
+        for row in turnaround_rows
+    ]
+    return {'by_status': by_status, 'technicians': technicians, 'turnaround': turnaround}
+
+
+def repair_board(unit_id=None, turnaround_days=TURNAROUND_DAYS):
+    now = timezone.now()
+    today = timezone.localdate(now)
+    key = f'onyango:repair-board:{_generation()}:{unit_id or "all"}:{today.isoformat()}:{turnaround_days}'
+    data = cache.get(key)
+    cached = data is not None
+    if not cached:
+        data = _compute(unit_id, today, turnaround_days)
+        cache.set(key, data, BOARD_CACHE_SECONDS)
+
+    technicians = []
+    for tech in data['technicians']:
+        oldest = tech['oldest_intake']
+        technicians.append({
+            **tech,
+            'oldest_intake': oldest.isoformat() if oldest else None,
+            'oldest_age_days': round((now - oldest).total_seconds() / 86400, 2) if oldest else None,
+        })
+    return {
+        'generated_at': now.isoformat(),
+        'date': today.isoformat(),
+        'cached': cached,
+        'by_status': data['by_status'],
+        'open_total': sum(t['open'] for t in technicians),
+        'overdue_total': sum(t['overdue'] for t in technicians),
+        'technicians': technicians,
+        'turnaround_days': turnaround_days,
+        'turnaround': data['turnaround'],
+    }
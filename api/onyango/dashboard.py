@@ -0,0 +1,113 @@
+"""
+Onyango dashboard (dashboard/): today's shop sales, low stock, workshop repairs and revenue,
+and pending transfers.
+
+The shop and workshop blocks are independent queries. onyango_dashboard() runs them one
+after another for the sync view; aonyango_dashboard() runs them concurrently
+(main/concurrency.py) for the async view at dashboard/async/. Both return the same payload.
+"""
+from decimal import Decimal
+from functools import partial
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from main.concurrency import run_blocks, run_blocks_sync
+from main.models import Product, Sale, Unit
+
+from .models import RepairJob, RepairPayment, TransferBalance, TransferSettlement
+
+OPEN_REPAIR_EXCLUDED = ('completed', 'collected', 'cancelled')
+
+
+def _daily_sales(shop, today):
+    # Shop: today's sales (from main.Sale with unit=shop or no unit for backward compat)
+    sales_qs = Sale.objects.exclude(status='refunded')
+    if shop:
+        sales_qs = sales_qs.filter(Q(unit=shop) | Q(unit__isnull=True))
+    return sales_qs.filter(date__date=today).aggregate(total=Sum('paid_amount'))['total'] or 0
+
+
+def _low_stock():
+    return Product.objects.filter(quantity_in_stock__lte=F('threshold')).count()
+
+
+def _repairs(workshop, today):
+    """(pending, completed today) repair jobs of the workshop (all jobs without one)."""
+    jobs = RepairJob.objects.filter(unit=workshop) if workshop else RepairJob.objects.all()
+    return (
+        jobs.exclude(status__in=OPEN_REPAIR_EXCLUDED).count(),
+        jobs.filter(completed_date__date=today).count(),
+    )
+
+
+def _repair_revenue(workshop, today):
+    payments = RepairPayment.objects.filter(payment_date__date=today)
+    if workshop:
+        payments = payments.filter(invoice__job__unit=workshop)
+    return payments.aggregate(total=Sum('amount'))['total'] or 0
+
+
+def _materials_paid(workshop, today):
+    # Materials paid to shop today (cash out from workshop)
+    return TransferSettlement.objects.filter(
+        settlement_date__date=today,
+        transfer_order__to_unit=workshop,
+    ).aggregate(total=Coalesce(Sum('amount'), Decimal('0')))['total'] or Decimal('0')
+
+
+def _pending_transfers():
+    # Pending transfers (unsettled), from the per unit pair balances kept by TransferOrder
+    return TransferBalance.objects.aggregate(
+        count=Coalesce(Sum('open_count'), 0),
+        outstanding=Coalesce(Sum('outstanding'), Decimal('0')),
+    )
+
+
+def _blocks(shop, workshop):
+    today = timezone.now().date()
+    blocks = {
+        'daily_sales': partial(_daily_sales, shop, today),
+        'low_stock': _low_stock,
+        'repairs': partial(_repairs, workshop, today),
+        'repair_revenue': partial(_repair_revenue, workshop, today),
+        'transfers': _pending_transfers,
+    }
+    if workshop:
+        blocks['materials_paid'] = partial(_materials_paid, workshop, today)
+    return blocks
+
+
+def _assemble(results):
+    pending_repairs, completed_today = results['repairs']
+    repair_revenue_today = results['repair_revenue']
+    materials_paid_today = results.get('materials_paid', Decimal('0'))
+    # Implied workshop income: repair revenue less the materials paid to the shop
+    workshop_income_today = Decimal(str(repair_revenue_today or 0)) - materials_paid_today
+    return {
+        'daily_sales': float(results['daily_sales']),
+        'repair_revenue_today': float(repair_revenue_today),
+        'workshop_materials_paid_today': float(materials_paid_today),
+        'workshop_income_today': float(workshop_income_today),
+        'low_stock_count': results['low_stock'],
+        'pending_repairs': pending_repairs,
+        'completed_repairs_today': completed_today,
+        'pending_transfers_count': results['transfers']['count'],
+        'pending_transfer_amount': float(results['transfers']['outstanding']),
+    }
+
+
+def _units(units):
+    by_code = {unit.code: unit for unit in units}
+    return by_code.get('shop'), by_code.get('workshop')
+
+
+def onyango_dashboard():
+    shop, workshop = _units(Unit.objects.filter(code__in=('shop', 'workshop')))
+    return _assemble(run_blocks_sync(_blocks(shop, workshop)))
+
+
+async def aonyango_dashboard():
+    shop, workshop = _units([unit async for unit in Unit.objects.filter(code__in=('shop', 'workshop'))])
+    return _assemble(await run_blocks(_blocks(shop, workshop)))
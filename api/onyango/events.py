@@ -0,0 +1,232 @@
+"""
+Workshop domain events (see main/events.py) and the activity log subscriber.
+"""
+from dataclasses import dataclass
+from typing import Any
+
+from main.events import Event
+
+from .models import ActivityLog
+
+
+def record_activity(events):
+    """Event subscriber: the activity log rows of a committed batch, in one insert."""
+    rows = []
+    for event in events:
+        entry = event.activity()
+        if entry:
+            action, entity_type, entity_id, details = entry
+            rows.append(ActivityLog(user=event.user, action=action, entity_type=entity_type, entity_id=entity_id, details=details))
+    ActivityLog.objects.bulk_create(rows)
+
+
+# ---------- Purchasing ----------
+@dataclass(kw_only=True)
+class PurchaseOrderCreated(Event):
+    purchase_order: Any
+
+    def timeline(self):
+        po = self.purchase_order
+        return [('purchase_order_created', 'purchase_order', po.id, f"Purchase order #{po.id} created - {po.supplier.name}", {'purchase_order_id': po.id, 'supplier_id': po.supplier_id})]
+
+
+@dataclass(kw_only=True)
+class PurchaseOrdersBulkCreated(Event):
+    purchase_orders: list
+    line_count: int
+
+    def timeline(self):
+        orders = self.purchase_orders
+        po_ids = [po.id for po in orders]
+        return [(
+            'purchase_order_created', 'purchase_order', None,
+            f"{len(po_ids)} purchase orders created ({self.line_count} lines)",
+            {'purchase_order_ids': po_ids, 'supplier_ids': [po.supplier_id for po in orders], 'line_count': self.line_count},
+        )]
+
+
+@dataclass(kw_only=True)
+class GoodsReceived(Event):
+    receipt: Any
+
+    def timeline(self):
+        receipt = self.receipt
+        return [('goods_receipt', 'goods_receipt', receipt.id, f"Goods receipt #{receipt.id} for PO #{receipt.order_id}", {'goods_receipt_id': receipt.id, 'purchase_order_id': receipt.order_id})]
+
+
+# ---------- Repair jobs ----------
+@dataclass(kw_only=True)
+class RepairJobCreated(Event):
+    job: Any
+
+    def timeline(self):
+        job = self.job
+        return [('repair_job_created', 'repair_job', job.id, f"Repair job #{job.id} - {job.item_description} (Customer: {job.customer.name})", {'repair_job_id': job.id, 'customer_id': job.customer_id})]
+
+    def activity(self):
+        return 'created_repair_job', 'repair_job', self.job.id, None
+
+
+@dataclass(kw_only=True)
+class RepairJobUpdated(Event):
+    """A job edit; labour and parts changes rewrite the invoice totals."""
+    job: Any
+
+
+@dataclass(kw_only=True)
+class RepairJobDeleted(Event):
+    job_id: int
+
+
+@dataclass(kw_only=True)
+class RepairJobCompleted(Event):
+    job_id: int
+
+    def timeline(self):
+        return [('repair_job_completed', 'repair_job', self.job_id, f"Repair job #{self.job_id} completed", {'repair_job_id': self.job_id})]
+
+    def activity(self):
+        return 'completed_repair_job', 'repair_job', self.job_id, None
+
+
+@dataclass(kw_only=True)
+class RepairJobCollected(Event):
+    job_id: int
+
+    def timeline(self):
+        return [('repair_job_collected', 'repair_job', self.job_id, f"Repair job #{self.job_id} collected by customer", {'repair_job_id': self.job_id})]
+
+    def activity(self):
+        return 'collected_repair_job', 'repair_job', self.job_id, None
+
+
+@dataclass(kw_only=True)
+class RepairPaymentRecorded(Event):
+    payment: Any
+
+    def timeline(self):
+        payment = self.payment
+        return [('repair_payment', 'repair_payment', payment.id, f"Repair payment TZS {payment.amount} for Job #{payment.invoice.job_id}", {'repair_payment_id': payment.id, 'invoice_id': payment.invoice_id, 'amount': str(payment.amount)})]
+
+
+# ---------- Material requests ----------
+@dataclass(kw_only=True)
+class MaterialRequestCreated(Event):
+    """A new request; it is created as submitted so the shop can approve it."""
+    material_request: Any
+
+    def timeline(self):
+        mr = self.material_request
+        job = mr.repair_job
+        customer_name = getattr(getattr(job, 'customer', None), 'name', None) if job else None
+        title = f"Material request #{mr.id} created and submitted for approval"
+        if job and customer_name:
+            title = f"Material request #{mr.id} for Repair #{job.id} ({customer_name}) submitted for approval"
+        return [('material_request_submitted', 'material_request', mr.id, title, {
+            'material_request_id': mr.id,
+            'repair_job_id': job.id if job else None,
+            'customer_name': customer_name,
+        })]
+
+    def activity(self):
+        return 'created_material_request', 'material_request', self.material_request.id, None
+
+
+@dataclass(kw_only=True)
+class MaterialRequestSubmitted(Event):
+    material_request_id: int
+    resubmitted: bool = False
+
+    def timeline(self):
+        verb = 'resubmitted' if self.resubmitted else 'submitted'
+        return [('material_request_submitted', 'material_request', self.material_request_id, f"Material request #{self.material_request_id} {verb} for approval", {'material_request_id': self.material_request_id})]
+
+    def activity(self):
+        return 'submitted_material_request', 'material_request', self.material_request_id, None
+
+
+@dataclass(kw_only=True)
+class MaterialRequestUpdated(Event):
+    material_request_id: int
+    old_status: str
+
+    def timeline(self):
+        status_msg = 'updated' if self.old_status == 'approved' else 'updated (back to draft – can resubmit)'
+        return [('material_request_updated', 'material_request', self.material_request_id, f"Material request #{self.material_request_id} {status_msg}", {'material_request_id': self.material_request_id, 'old_status': self.old_status})]
+
+    def activity(self):
+        return 'updated_material_request', 'material_request', self.material_request_id, None
+
+
+@dataclass(kw_only=True)
+class MaterialRequestDeleted(Event):
+    material_request_id: int
+
+    def activity(self):
+        return 'deleted_material_request', 'material_request', self.material_request_id, None
+
+
+@dataclass(kw_only=True)
+class MaterialRequestApproved(Event):
+    material_request_id: int
+    transfer: Any
+
+    def timeline(self):
+        mr_id, transfer = self.material_request_id, self.transfer
+        return [
+            ('material_request_approved', 'material_request', mr_id, f"Material request #{mr_id} approved", {'material_request_id': mr_id}),
+            ('transfer_confirmed', 'transfer_order', transfer.id, f"Transfer #{transfer.id} confirmed - TZS {transfer.total_amount} (Shop → Workshop)", {'transfer_id': transfer.id, 'amount': str(transfer.total_amount)}),
+        ]
+
+    def activity(self):
+        return 'approved_material_request', 'material_request', self.material_request_id, {'transfer_id': self.transfer.id}
+
+
+@dataclass(kw_only=True)
+class MaterialRequestRejected(Event):
+    material_request_id: int
+    reason: str
+
+    def timeline(self):
+        return [('material_request_rejected', 'material_request', self.material_request_id, f"Material request #{self.material_request_id} rejected", {'material_request_id': self.material_request_id, 'reason': self.reason})]
+
+    def activity(self):
+        return 'rejected_material_request', 'material_request', self.material_request_id, None
+
+
+# ---------- Transfers ----------
+@dataclass(kw_only=True)
+class MaterialsPaid(Event):
+    """The workshop paid the shop for a job's materials (transfer-orders/<id>/pay/)."""
+    settlement: Any
+    job_id: int
+
+    def timeline(self):
+        s = self.settlement
+        return [('materials_paid', 'transfer_order', s.transfer_order_id, f"Materials payment TZS {s.amount} for Transfer #{s.transfer_order_id} (Repair #{self.job_id})", {'transfer_order_id': s.transfer_order_id, 'repair_job_id': self.job_id, 'amount': str(s.amount)})]
+
+    def activity(self):
+        s = self.settlement
+        return 'paid_materials', 'transfer_order', s.transfer_order_id, {'settlement_id': s.id, 'amount': str(s.amount)}
+
+
+@dataclass(kw_only=True)
+class TransferSettled(Event):
+    settlement: Any
+
+    def timeline(self):
+        s = self.settlement
+        return [('transfer_settled', 'transfer_settlement', s.id, f"Settlement TZS {s.amount} for Transfer #{s.transfer_order_id}", {'settlement_id': s.id, 'transfer_order_id': s.transfer_order_id, 'amount': str(s.amount)})]
+
+
+@dataclass(kw_only=True)
+class MaterialsPaymentCleared(Event):
+    settlement: Any
+
+    def timeline(self):
+        s = self.settlement
+        return [('materials_payment_cleared', 'transfer_settlement', s.id, f"Materials payment TZS {s.amount} for Transfer #{s.transfer_order_id} cleared in cash by {self.user.username}", {'settlement_id': s.id, 'transfer_order_id': s.transfer_order_id, 'amount': str(s.amount)})]
+
+    def activity(self):
+        s = self.settlement
+        return 'cleared_material_payment', 'transfer_settlement', s.id, {'transfer_order_id': s.transfer_order_id, 'amount': str(s.amount)}
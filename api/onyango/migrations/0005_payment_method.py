@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+from main.migrations._payment_methods_0048 import normalize_payment_method
+
+
+def backfill_method(apps, schema_editor):
+    # One UPDATE per distinct free-text value, not per payment
+    RepairPayment = apps.get_model('onyango', 'RepairPayment')
+    raw_values = RepairPayment.objects.values_list('payment_method', flat=True).distinct().order_by()
+    for raw in list(raw_values):
+        method = normalize_payment_method(raw)
+        if method != 'other':
+            RepairPayment.objects.filter(payment_method=raw).update(method=method)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('onyango', '0004_materialrequestline_quantity_decimal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repairpayment',
+            name='method',
+            field=models.CharField(choices=[('cash', 'Cash'), ('mobile_money', 'Mobile money'), ('card', 'Card'), ('bank', 'Bank transfer'), ('refund', 'Refund'), ('other', 'Other')], default='other', editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='repairpayment',
+            index=models.Index(fields=['method', 'amount', 'payment_date'], name='repairpayment_method_match_idx'),
+        ),
+        migrations.RunPython(backfill_method, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def backfill_balances(apps, schema_editor):
+    TransferOrder = apps.get_model('onyango', 'TransferOrder')
+    TransferBalance = apps.get_model('onyango', 'TransferBalance')
+    rows = (
+        TransferOrder.objects.exclude(status='closed')
+        .values('from_unit_id', 'to_unit_id')
+        .annotate(open_count=Count('id'), outstanding=Sum(F('total_amount') - F('settled_amount')))
+        .order_by()
+    )
+    TransferBalance.objects.bulk_create([TransferBalance(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0049_refund_item'),
+        ('onyango', '0005_payment_method'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_count', models.IntegerField(default=0)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transferorder',
+            index=models.Index(fields=['status', 'due_date'], name='transfer_status_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='transferbalance',
+            name='from_unit',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.unit'),
+        ),
+        migrations.AddField(
+            model_name='transferbalance',
+            name='to_unit',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.unit'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='transferbalance',
+            unique_together={('from_unit', 'to_unit')},
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,16 @@
 Onyango Hardware — Shop & Workshop models.
 References: main.Unit, main.Product, main.Customer, AUTH_USER_MODEL.
 """
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
 from django.conf import settings
+from django.utils import timezone
+
+from main.payment_methods import PAYMENT_METHODS, normalize_payment_method
 
 
 def get_shop_unit():
@@ -65,6 +73,32 @@ class PurchaseOrderLine(models.Model):
         return f"{self.product.name} x {self.quantity}"
 
 
+def update_purchase_order_status(order):
+    """
+    Recompute PO status from its lines' received_quantity (one aggregate query).
+    Fully received -> 'received', anything received -> 'partially_received'; closed orders are left alone.
+    """
+    if order.status == 'closed':
+        return order.status
+    counts = order.lines.aggregate(
+        lines=models.Count('id'),
+        complete=models.Count('id', filter=models.Q(received_quantity__gte=models.F('quantity'))),
+        started=models.Count('id', filter=models.Q(received_quantity__gt=0)),
+    )
+    if not counts['lines']:
+        return order.status
+    if counts['complete'] == counts['lines']:
+        new_status = 'received'
+    elif counts['started']:
+        new_status = 'partially_received'
+    else:
+        new_status = order.status
+    if new_status != order.status:
+        PurchaseOrder.objects.filter(pk=order.pk).update(status=new_status)
+        order.status = new_status
+    return new_status
+
+
 class GoodsReceipt(models.Model):
     order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name='receipts')
     receipt_date = models.DateTimeField(auto_now_add=True)
@@ -179,6 +213,19 @@ class RepairInvoice(models.Model):
     def __str__(self):
         return f"Invoice for Repair #{self.job_id}"
 
+    def add_paid_amount(self, amount):
+        """Apply a repair payment (negative to reverse one) with a single UPDATE; payments are not re-read."""
+        paid = F('paid_amount') + Value(amount)
+        RepairInvoice.objects.filter(pk=self.pk).update(
+            payment_status=Case(
+                When(GreaterThanOrEqual(paid, F('total_amount')), then=Value('paid')),
+                When(GreaterThan(paid, 0), then=Value('partial')),
+                default=F('payment_status'),
+            ),
+            paid_amount=paid,
+        )
+        self.refresh_from_db(fields=['paid_amount', 'payment_status'])
+
 
 def update_repair_invoice_totals(job):
     """
@@ -186,21 +233,33 @@ def update_repair_invoice_totals(job):
     total_amount = that fixed price (we do NOT add materials on top).
     total_parts = materials cost (from transfer) — used only to split payment:
     when paid, materials portion goes to shop (transfer settlement), remainder = workshop income.
+    Parts and labour are summed in SQL, together with the fixed price, in one query.
     """
     from decimal import Decimal
     inv = getattr(job, 'invoice', None)
     if not inv:
         return
-    inv.total_parts = sum(
-        (p.quantity_used * p.unit_cost) for p in job.parts_used.all()
+    money = models.DecimalField(max_digits=20, decimal_places=2)
+    parts = (
+        RepairJobPart.objects.filter(job=OuterRef('pk')).order_by().values('job')
+        .annotate(total=Sum(F('quantity_used') * F('unit_cost'), output_field=money)).values('total')
+    )
+    labour = (
+        LabourCharge.objects.filter(job=OuterRef('pk')).order_by().values('job')
+        .annotate(total=Sum('amount')).values('total')
     )
-    if job.job_type_id:
-        inv.total_amount = job.job_type.fixed_price + inv.tax_amount
+    totals = RepairJob.objects.filter(pk=job.pk).values('job_type__fixed_price').annotate(
+        parts=Coalesce(Subquery(parts), Value(Decimal('0')), output_field=money),
+        labour=Coalesce(Subquery(labour), Value(Decimal('0')), output_field=money),
+    ).get()
+    inv.total_parts = totals['parts']
+    if totals['job_type__fixed_price'] is not None:
+        inv.total_amount = totals['job_type__fixed_price'] + inv.tax_amount
         inv.total_labour = max(Decimal('0'), inv.total_amount - inv.total_parts - inv.tax_amount)  # workshop income
     else:
-        inv.total_labour = sum(lc.amount for lc in job.labour_charges.all())
+        inv.total_labour = totals['labour']
         inv.total_amount = inv.total_labour + inv.total_parts + inv.tax_amount
-    inv.save()
+    inv.save(update_fields=['total_parts', 'total_labour', 'total_amount'])
 
 
 class RepairPayment(models.Model):
@@ -210,17 +269,40 @@ class RepairPayment(models.Model):
     payment_date = models.DateTimeField(auto_now_add=True)
     received_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     materials_settled = models.BooleanField(default=False, help_text="True when materials portion has been sent to shop via TransferSettlement.")
+    # Normalized from payment_method on save (see main/payment_methods.py)
+    method = models.CharField(max_length=20, choices=PAYMENT_METHODS, default='other', editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['method', 'amount', 'payment_date'], name='repairpayment_method_match_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.invoice.paid_amount = sum(p.amount for p in self.invoice.payments.all())
-        if self.invoice.paid_amount >= self.invoice.total_amount:
-            self.invoice.payment_status = 'paid'
-        elif self.invoice.paid_amount > 0:
-            self.invoice.payment_status = 'partial'
-        self.invoice.save()
+        self.method = normalize_payment_method(self.payment_method)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'payment_method' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'method'}
+        with transaction.atomic():
+            delta = self._amount_delta(update_fields)
+            super().save(*args, **kwargs)
+            if delta:
+                self.invoice.add_paid_amount(delta)
         self._settle_materials_to_shop()
 
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.invoice.add_paid_amount(-self.amount)
+        return result
+
+    def _amount_delta(self, update_fields):
+        if self._state.adding:
+            return self.amount
+        if update_fields is not None and 'amount' not in update_fields:
+            return 0
+        previous = RepairPayment.objects.filter(pk=self.pk).values_list('amount', flat=True).first()
+        return self.amount - (previous or 0)
+
     def _settle_materials_to_shop(self):
         """
         Manual-only mode: material payments are NOT auto-settled from customer payments.
@@ -283,9 +365,142 @@ class TransferOrder(models.Model):
     confirmed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='confirmed_transfers')
     confirmed_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Aging of unsettled transfers (status != closed, bucketed by due_date)
+            models.Index(fields=['status', 'due_date'], name='transfer_status_due_idx'),
+        ]
+
     def __str__(self):
         return f"Transfer #{self.id} - {self.get_status_display()}"
 
+    @staticmethod
+    def balance_key(values):
+        """(from_unit_id, to_unit_id, open, outstanding) of a transfer's contribution to TransferBalance."""
+        from_unit_id, to_unit_id, status, total, settled = values
+        if status == 'closed':
+            return from_unit_id, to_unit_id, 0, Decimal('0')
+        return from_unit_id, to_unit_id, 1, (total or Decimal('0')) - (settled or Decimal('0'))
+
+    def _balance_values(self):
+        return self.from_unit_id, self.to_unit_id, self.status, self.total_amount, self.settled_amount
+
+    def _stored_balance_values(self, lock=False):
+        qs = TransferOrder.objects.filter(pk=self.pk)
+        if lock:
+            qs = qs.select_for_update()
+        return qs.values_list('from_unit_id', 'to_unit_id', 'status', 'total_amount', 'settled_amount').first()
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            before = None if self._state.adding else self._stored_balance_values(lock=True)
+            super().save(*args, **kwargs)
+            # Re-read rather than trust self: a save with update_fields keeps the stored
+            # settled_amount, which a settlement may have moved since self was loaded
+            TransferBalance.move(before, self._stored_balance_values())
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            before = self._stored_balance_values(lock=True)
+            result = super().delete(*args, **kwargs)
+            TransferBalance.move(before, None)
+        return result
+
+    def add_settled_amount(self, amount):
+        """Apply a settlement (negative to reverse one) with a single UPDATE; settlements are not re-read."""
+        settled = F('settled_amount') + Value(amount)
+        with transaction.atomic():
+            before = self._stored_balance_values(lock=True)
+            TransferOrder.objects.filter(pk=self.pk).update(
+                status=Case(
+                    When(GreaterThanOrEqual(settled, F('total_amount')), then=Value('closed')),
+                    When(GreaterThan(settled, 0), then=Value('partially_settled')),
+                    # A reversal that takes the last payment off reopens the transfer
+                    When(status__in=('closed', 'partially_settled'), then=Value('confirmed')),
+                    default=F('status'),
+                ),
+                settled_amount=settled,
+            )
+            self.refresh_from_db(fields=['settled_amount', 'status'])
+            TransferBalance.move(before, self._balance_values())
+
+
+class TransferBalance(models.Model):
+    """
+    Open transfers and outstanding amount (total - settled) per unit pair, maintained by
+    TransferOrder.save / delete / add_settled_amount so the dashboard does not scan transfers.
+    Closed transfers do not count. `verify_payment_totals` checks it against the transfers.
+    """
+    from_unit = models.ForeignKey('main.Unit', on_delete=models.CASCADE, null=True, related_name='+')
+    to_unit = models.ForeignKey('main.Unit', on_delete=models.CASCADE, null=True, related_name='+')
+    open_count = models.IntegerField(default=0)
+    outstanding = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('from_unit', 'to_unit')
+
+    def __str__(self):
+        return f"{self.from_unit_id} -> {self.to_unit_id}: {self.open_count} open, {self.outstanding} outstanding"
+
+    @classmethod
+    def move(cls, before, after):
+        """Replace a transfer's contribution `before` with `after` (balance_values tuples or None)."""
+        deltas = {}
+        for values, sign in ((before, -1), (after, 1)):
+            if values is None:
+                continue
+            from_unit_id, to_unit_id, count, amount = TransferOrder.balance_key(values)
+            current = deltas.setdefault((from_unit_id, to_unit_id), [0, Decimal('0')])
+            current[0] += sign * count
+            current[1] += sign * amount
+        for (from_unit_id, to_unit_id), (count, amount) in deltas.items():
+            if count or amount:
+                cls.objects.get_or_create(from_unit_id=from_unit_id, to_unit_id=to_unit_id)
+                cls.objects.filter(from_unit_id=from_unit_id, to_unit_id=to_unit_id).update(
+                    open_count=F('open_count') + count,
+                    outstanding=F('outstanding') + Value(amount),
+                    updated_at=timezone.now(),
+                )
+
+    @classmethod
+    def expected(cls):
+        """{(from_unit_id, to_unit_id): (open_count, outstanding)} recomputed from the transfers."""
+        rows = (
+            TransferOrder.objects.exclude(status='closed')
+            .values('from_unit_id', 'to_unit_id')
+            .annotate(open_count=Count('id'), outstanding=Sum(F('total_amount') - F('settled_amount')))
+            .order_by()
+        )
+        return {(r['from_unit_id'], r['to_unit_id']): (r['open_count'], r['outstanding'] or Decimal('0')) for r in rows}
+
+    @classmethod
+    def recount(cls, pairs, expected=None):
+        """Reset the rows of the given (from_unit_id, to_unit_id) pairs to expected()."""
+        expected = cls.expected() if expected is None else expected
+        with transaction.atomic():
+            for from_unit_id, to_unit_id in pairs:
+                count, outstanding = expected.get((from_unit_id, to_unit_id), (0, Decimal('0')))
+                # filter(), not get(): NULL units are not covered by unique_together
+                cls.objects.filter(from_unit_id=from_unit_id, to_unit_id=to_unit_id).delete()
+                if count or outstanding:
+                    cls.objects.create(from_unit_id=from_unit_id, to_unit_id=to_unit_id, open_count=count, outstanding=outstanding)
+
+
+def recount_unit_balances(sender, instance, **kwargs):
+    """
+    Unit post_delete: the unit's transfers now have a NULL unit (SET_NULL, a queryset UPDATE
+    that skips TransferOrder.save) and its balance rows are gone (CASCADE), so the pairs
+    with a missing unit are recounted from the transfers.
+    """
+    expected = TransferBalance.expected()
+    pairs = {pair for pair in expected if None in pair}
+    pairs.update(
+        TransferBalance.objects.filter(Q(from_unit__isnull=True) | Q(to_unit__isnull=True))
+        .values_list('from_unit_id', 'to_unit_id')
+    )
+    TransferBalance.recount(pairs, expected)
+
 
 class TransferOrderLine(models.Model):
     transfer = models.ForeignKey(TransferOrder, on_delete=models.CASCADE, related_name='lines')
@@ -316,14 +531,25 @@ class TransferSettlement(models.Model):
     )
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        t = self.transfer_order
-        t.settled_amount = sum(s.amount for s in t.settlements.all())
-        if t.settled_amount >= t.total_amount:
-            t.status = 'closed'
-        elif t.settled_amount > 0:
-            t.status = 'partially_settled'
-        t.save()
+        with transaction.atomic():
+            delta = self._amount_delta(kwargs.get('update_fields'))
+            super().save(*args, **kwargs)
+            if delta:
+                self.transfer_order.add_settled_amount(delta)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.transfer_order.add_settled_amount(-self.amount)
+        return result
+
+    def _amount_delta(self, update_fields):
+        if self._state.adding:
+            return self.amount
+        if update_fields is not None and 'amount' not in update_fields:
+            return 0
+        previous = TransferSettlement.objects.filter(pk=self.pk).values_list('amount', flat=True).first()
+        return self.amount - (previous or 0)
 
     def __str__(self):
         return f"Settlement {self.amount} for Transfer #{self.transfer_order_id}"
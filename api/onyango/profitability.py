@@ -0,0 +1,160 @@
+"""
+Workshop profitability report (reports/workshop-profitability/).
+
+One grouped query over repair jobs, by job type, technician and intake month. Per-job material
+cost, shop settlements and cash collected come from correlated subqueries summed inside the
+group, so no per-job rows reach Python:
+- revenue: invoice total_amount (the job type's fixed price, or labour + parts)
+- material_cost: transfer lines sent to the job (at transfer price) plus parts recorded on the
+  job that did not come through a transfer line (at unit cost)
+- labour_margin: revenue - material_cost
+- collected: invoice paid_amount (the running total of repair payments)
+- settled_to_shop: what the workshop has paid the shop for the job's transfers
+Job type and technician rollups are summed from the grouped rows. Results are cached per
+parameter set for REPORT_CACHE_SECONDS; pass refresh=True to bypass the cache. Events that move
+revenue, cost or cash (see invalidate_report) retire every cached report.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from . import events
+from .models import RepairJob, RepairJobPart, TransferOrder, TransferOrderLine
+
+REPORT_CACHE_SECONDS = 600
+REPORT_GENERATION_KEY = 'onyango:workshop-profitability:generation'
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+ZERO = Decimal('0')
+TOTALS = ('revenue', 'material_cost', 'collected', 'settled_to_shop')
+
+
+# Events after which a cached report no longer matches the data
+INVALIDATING_EVENTS = (
+    events.RepairJobCreated, events.RepairJobUpdated, events.RepairJobDeleted,
+    events.RepairPaymentRecorded, events.MaterialRequestApproved,
+    events.MaterialRequestUpdated, events.MaterialsPaid, events.TransferSettled,
+)
+
+
+def invalidate_report(batch):
+    """Event subscriber: bump the report generation when a committed batch changes its figures."""
+    if not any(isinstance(event, INVALIDATING_EVENTS) for event in batch):
+        return
+    try:
+        cache.incr(REPORT_GENERATION_KEY)
+    except ValueError:
+        cache.set(REPORT_GENERATION_KEY, 2, None)
+
+
+def _job_sum(queryset, job_field, amount):
+    total = queryset.filter(**{job_field: OuterRef('pk')}).order_by().values(job_field).annotate(total=Sum(amount, output_field=MONEY)).values('total')
+    return Coalesce(Subquery(total), Value(ZERO), output_field=MONEY)
+
+
+def _summary(row):
+    revenue, material_cost = row['revenue'], row['material_cost']
+    return {
+        'jobs': row['jobs'],
+        'revenue': float(revenue),
+        'material_cost': float(material_cost),
+        'labour_margin': float(revenue - material_cost),
+        'margin_ratio': round(float((revenue - material_cost) / revenue), 4) if revenue else None,
+        'collected': float(row['collected']),
+        'cash_collected_ratio': round(float(row['collected'] / revenue), 4) if revenue else None,
+        'settled_to_shop': float(row['settled_to_shop']),
+    }
+
+
+def _rollup(rows, key):
+    groups = {}
+    for row in rows:
+        group = groups.setdefault(key(row), {'jobs': 0, **{t: ZERO for t in TOTALS}})
+        group['jobs'] += row['jobs']
+        for t in TOTALS:
+            group[t] += row[t]
+    return groups
+
+
+def workshop_profitability(date_from=None, date_to=None, unit_id=None, refresh=False):
+    generation = cache.get_or_set(REPORT_GENERATION_KEY, 1, None)
+    key = f'onyango:workshop-profitability:{generation}:{date_from}:{date_to}:{unit_id}'
+    report = None if refresh else cache.get(key)
+    if report is not None:
+        return report
+
+    jobs = RepairJob.objects.exclude(status='cancelled').filter(invoice__isnull=False)
+    if date_from:
+        jobs = jobs.filter(intake_date__date__gte=date_from)
+    if date_to:
+        jobs = jobs.filter(intake_date__date__lte=date_to)
+    if unit_id:
+        jobs = jobs.filter(unit_id=unit_id)
+
+    transferred = _job_sum(
+        TransferOrderLine.objects.exclude(transfer__status='draft'),
+        'transfer__material_request__repair_job', F('quantity') * F('transfer_price'),
+    )
+    untransferred_parts = _job_sum(
+        RepairJobPart.objects.filter(transfer_line__isnull=True), 'job', F('quantity_used') * F('unit_cost'),
+    )
+    settled = _job_sum(TransferOrder.objects.exclude(status='draft'), 'material_request__repair_job', F('settled_amount'))
+
+    rows = list(
+        jobs.values(
+            'job_type', 'job_type__name', 'job_type__fixed_price', 'assigned_to', 'assigned_to__username',
+            month=TruncMonth('intake_date'),
+        )
+        .annotate(
+            jobs=Count('id'),
+            revenue=Coalesce(Sum('invoice__total_amount'), Value(ZERO), output_field=MONEY),
+            material_cost=Coalesce(Sum(transferred + untransferred_parts), Value(ZERO), output_field=MONEY),
+            collected=Coalesce(Sum('invoice__paid_amount'), Value(ZERO), output_field=MONEY),
+            settled_to_shop=Coalesce(Sum(settled), Value(ZERO), output_field=MONEY),
+        )
+        .order_by('month', 'job_type__name', 'assigned_to__username')
+    )
+
+    job_types = []
+    for (job_type_id, name, fixed_price), totals in _rollup(
+        rows, lambda r: (r['job_type'], r['job_type__name'], r['job_type__fixed_price'])
+    ).items():
+        avg_material = totals['material_cost'] / totals['jobs']
+        job_types.append({
+            'job_type_id': job_type_id,
+            'job_type': name,
+            'fixed_price': float(fixed_price) if fixed_price is not None else None,
+            'avg_material_cost': float(round(avg_material, 2)),
+            # Whether the fixed price has, on average, paid for the materials
+            'covers_materials': fixed_price >= avg_material if fixed_price is not None else None,
+            **_summary(totals),
+        })
+    job_types.sort(key=lambda r: r['labour_margin'])
+
+    technicians = [
+        {'technician_id': tech_id, 'technician': username, **_summary(totals)}
+        for (tech_id, username), totals in _rollup(rows, lambda r: (r['assigned_to'], r['assigned_to__username'])).items()
+    ]
+    technicians.sort(key=lambda r: r['labour_margin'], reverse=True)
+
+    report = {
+        'date_from': date_from.isoformat() if date_from else None,
+        'date_to': date_to.isoformat() if date_to else None,
+        'totals': _summary(_rollup(rows, lambda r: None).get(None, {'jobs': 0, **{t: ZERO for t in TOTALS}})),
+        'job_types': job_types,
+        'technicians': technicians,
+        'months': [
+            {
+                'month': row['month'].strftime('%Y-%m'),
+                'job_type_id': row['job_type'],
+                'job_type': row['job_type__name'],
+                'technician_id': row['assigned_to'],
+                'technician': row['assigned_to__username'],
+                **_summary(row),
+            }
+            for row in rows
+        ],
+    }
+    cache.set(key, report, REPORT_CACHE_SECONDS)
+    return report
@@ -1,12 +1,16 @@
+from decimal import Decimal
 from rest_framework import serializers
 from django.db import transaction
-from main.models import Unit, Product, Customer
+from django.db.models import Case, When, Value, F, DecimalField, IntegerField
+from django.utils import timezone
+from main.models import Unit, Product, Customer, StockEntry
+from main.lookup import product_code_cache
 from main.rounding import round_two
 from .models import (
     Supplier, PurchaseOrder, PurchaseOrderLine, GoodsReceipt, GoodsReceiptLine,
     JobType, RepairJob, RepairJobPart, LabourCharge, RepairInvoice, RepairPayment,
     MaterialRequest, MaterialRequestLine, TransferOrder, TransferOrderLine, TransferSettlement,
-    ActivityLog,
+    ActivityLog, update_purchase_order_status,
 )
 
 
@@ -52,7 +56,76 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
         return po
 
 
+class PurchaseOrderBulkRowSerializer(serializers.Serializer):
+    supplier = serializers.IntegerField()
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=20, decimal_places=2, min_value=0, required=False)
+
+
+class PurchaseOrderBulkSerializer(serializers.Serializer):
+    """
+    Restock many SKUs in one request: rows of (supplier, product, quantity, unit_price).
+    Rows are grouped into one PurchaseOrder per supplier; unit_price defaults to the product buying price.
+    Suppliers and products are resolved with one query each instead of one per row.
+    """
+    rows = PurchaseOrderBulkRowSerializer(many=True)
+    expected_delivery = serializers.DateField(required=False, allow_null=True)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_rows(self, rows):
+        if not rows:
+            raise serializers.ValidationError("At least one row is required.")
+        suppliers = Supplier.objects.in_bulk({r['supplier'] for r in rows})
+        products = Product.objects.only('id', 'name', 'buying_price').in_bulk({r['product'] for r in rows})
+        errors = []
+        for i, r in enumerate(rows):
+            if r['supplier'] not in suppliers:
+                errors.append(f"Row {i + 1}: supplier {r['supplier']} not found.")
+            if r['product'] not in products:
+                errors.append(f"Row {i + 1}: product {r['product']} not found.")
+        if errors:
+            raise serializers.ValidationError(errors)
+        self._suppliers = suppliers
+        self._products = products
+        return rows
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        user = request.user if request else None
+        rows_by_supplier = {}
+        for r in validated_data['rows']:
+            rows_by_supplier.setdefault(r['supplier'], []).append(r)
+
+        with transaction.atomic():
+            orders = PurchaseOrder.objects.bulk_create([
+                PurchaseOrder(
+                    supplier=self._suppliers[supplier_id],
+                    expected_delivery=validated_data.get('expected_delivery'),
+                    notes=validated_data.get('notes') or None,
+                    created_by=user,
+                )
+                for supplier_id in rows_by_supplier
+            ])
+            lines = []
+            for po, supplier_rows in zip(orders, rows_by_supplier.values()):
+                for r in supplier_rows:
+                    product = self._products[r['product']]
+                    unit_price = r.get('unit_price')
+                    lines.append(PurchaseOrderLine(
+                        order=po,
+                        product=product,
+                        quantity=r['quantity'],
+                        unit_price=unit_price if unit_price is not None else product.buying_price,
+                    ))
+            PurchaseOrderLine.objects.bulk_create(lines)
+        return orders
+
+
 class GoodsReceiptLineSerializer(serializers.ModelSerializer):
+    # Plain id so a large receipt is validated with one product query, not one per line
+    product = serializers.IntegerField(source='product_id')
+
     class Meta:
         model = GoodsReceiptLine
         fields = ['id', 'product', 'quantity', 'unit_price']
@@ -66,29 +139,73 @@ class GoodsReceiptSerializer(serializers.ModelSerializer):
         fields = ['id', 'order', 'lines', 'notes', 'received_by', 'receipt_date']
         read_only_fields = ['receipt_date']
 
+    def validate_lines(self, lines):
+        product_ids = {line['product_id'] for line in lines}
+        found = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        missing = sorted(product_ids - found)
+        if missing:
+            raise serializers.ValidationError([f"Product {pid} not found." for pid in missing])
+        return lines
+
     def create(self, validated_data):
+        """
+        Post a receipt in a constant number of statements regardless of line count:
+        bulk-insert receipt lines and stock entries, then apply stock and PO received
+        quantities as single CASE/WHEN updates with F() increments.
+        """
         lines_data = validated_data.pop('lines')
         request = self.context.get('request')
-        validated_data['received_by'] = request.user if request else None
-        receipt = GoodsReceipt.objects.create(**validated_data)
+        user = request.user if request else None
+        validated_data['received_by'] = user
+        order = validated_data['order']
+        now = timezone.now()
+
+        received_by_product = {}
         for line in lines_data:
-            grl = GoodsReceiptLine.objects.create(receipt=receipt, **line)
-            product = grl.product
-            product.quantity_in_stock += grl.quantity
-            product.save()
-            from main.models import StockEntry
-            StockEntry.objects.create(
-                product=product,
-                entry_type='received',
-                quantity=grl.quantity,
-                recorded_by=validated_data['received_by'],
-                ref_type='goods_receipt',
-                ref_id=receipt.id,
+            pid = line['product_id']
+            received_by_product[pid] = received_by_product.get(pid, 0) + line['quantity']
+
+        with transaction.atomic():
+            receipt = GoodsReceipt.objects.create(**validated_data)
+            GoodsReceiptLine.objects.bulk_create([
+                GoodsReceiptLine(receipt=receipt, **line) for line in lines_data
+            ])
+            StockEntry.objects.bulk_create([
+                StockEntry(
+                    product_id=line['product_id'],
+                    entry_type='received',
+                    quantity=line['quantity'],
+                    recorded_by=user,
+                    ref_type='goods_receipt',
+                    ref_id=receipt.id,
+                )
+                for line in lines_data
+            ])
+            Product.objects.filter(id__in=received_by_product).update(
+                quantity_in_stock=F('quantity_in_stock') + Case(
+                    *[When(id=pid, then=Value(Decimal(qty))) for pid, qty in received_by_product.items()],
+                    output_field=DecimalField(max_digits=20, decimal_places=2),
+                ),
+                updated_at=now,
             )
-            pol = receipt.order.lines.filter(product=product).first()
-            if pol:
-                pol.received_quantity = (pol.received_quantity or 0) + grl.quantity
-                pol.save()
+            # .update() skips the post_save eviction
+            transaction.on_commit(lambda: product_code_cache.evict_ids(list(received_by_product)))
+
+            # First PO line per product takes the receipt, as before
+            po_lines = {}
+            for pol_id, product_id in order.lines.order_by('id').values_list('id', 'product_id'):
+                po_lines.setdefault(product_id, pol_id)
+            increments = {
+                po_lines[pid]: qty for pid, qty in received_by_product.items() if pid in po_lines
+            }
+            if increments:
+                PurchaseOrderLine.objects.filter(id__in=increments).update(
+                    received_quantity=F('received_quantity') + Case(
+                        *[When(id=pol_id, then=Value(qty)) for pol_id, qty in increments.items()],
+                        output_field=IntegerField(),
+                    ),
+                )
+            update_purchase_order_status(order)
         return receipt
 
 
@@ -109,12 +226,16 @@ class CustomerMinSerializer(serializers.ModelSerializer):
 
 # ---------- Repair Job ----------
 class LabourChargeSerializer(serializers.ModelSerializer):
+    # Writable so job edits can refer to existing rows (see sync_job_rows)
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = LabourCharge
         fields = ['id', 'description', 'amount', 'labour_type']
 
 
 class RepairJobPartSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
     product_name = serializers.CharField(source='product.name', read_only=True)
 
     class Meta:
@@ -131,8 +252,8 @@ class RepairInvoiceSerializer(serializers.ModelSerializer):
 class RepairPaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = RepairPayment
-        fields = ['id', 'invoice', 'amount', 'payment_method', 'payment_date', 'received_by']
-        read_only_fields = ['payment_date']
+        fields = ['id', 'invoice', 'amount', 'payment_method', 'method', 'payment_date', 'received_by']
+        read_only_fields = ['payment_date', 'method']
 
 
 class JobTypeMinSerializer(serializers.ModelSerializer):
@@ -160,6 +281,50 @@ class RepairJobSerializer(serializers.ModelSerializer):
         read_only_fields = ['intake_date']
 
 
+def sync_job_rows(model, job, rows, field_name):
+    """
+    Make a job's labour charges / parts match `rows` without rewriting unchanged ones.
+
+    A row with an id updates that row; a row without one is paired with an existing row that has
+    the same values, or created. Changed rows are bulk-updated, new ones bulk-created and existing
+    rows left unpaired are deleted in one query.
+    """
+    fields = [f for f in model._meta.concrete_fields if f.name not in ('id', 'job')]
+    existing = {obj.id: obj for obj in model.objects.filter(job=job).order_by('id')}
+    candidates = [model(job=job, **{k: v for k, v in row.items() if k != 'id'}) for row in rows]
+
+    changed, added, unpaired = [], [], []
+    for row, candidate in zip(rows, candidates):
+        pk = row.get('id')
+        if pk is None:
+            unpaired.append(candidate)
+            continue
+        obj = existing.pop(pk, None)
+        if obj is None:
+            raise serializers.ValidationError({field_name: [f"{model._meta.verbose_name.capitalize()} {pk} does not belong to this job."]})
+        updates = [f.attname for f in fields if f.name in row and getattr(obj, f.attname) != getattr(candidate, f.attname)]
+        if updates:
+            for attname in updates:
+                setattr(obj, attname, getattr(candidate, attname))
+            changed.append(obj)
+
+    by_values = {}
+    for obj in existing.values():
+        by_values.setdefault(tuple(getattr(obj, f.attname) for f in fields), []).append(obj)
+    for candidate in unpaired:
+        same = by_values.get(tuple(getattr(candidate, f.attname) for f in fields))
+        if same:
+            del existing[same.pop(0).id]
+        else:
+            added.append(candidate)
+
+    if changed:
+        model.objects.bulk_update(changed, [f.attname for f in fields])
+    model.objects.bulk_create(added)
+    if existing:
+        model.objects.filter(id__in=list(existing)).delete()
+
+
 class RepairJobCreateUpdateSerializer(serializers.ModelSerializer):
     labour_charges = LabourChargeSerializer(many=True, required=False)
     parts_used = RepairJobPartSerializer(many=True, required=False)
@@ -171,6 +336,7 @@ class RepairJobCreateUpdateSerializer(serializers.ModelSerializer):
             'due_date', 'assigned_to', 'notes', 'labour_charges', 'parts_used',
         ]
 
+    @transaction.atomic
     def create(self, validated_data):
         labour_data = validated_data.pop('labour_charges', [])
         parts_data = validated_data.pop('parts_used', [])
@@ -180,15 +346,14 @@ class RepairJobCreateUpdateSerializer(serializers.ModelSerializer):
             validated_data['unit'] = workshop
         validated_data['created_by'] = request.user if request else None
         job = RepairJob.objects.create(**validated_data)
-        for l in labour_data:
-            LabourCharge.objects.create(job=job, **l)
-        for p in parts_data:
-            RepairJobPart.objects.create(job=job, **p)
+        LabourCharge.objects.bulk_create([LabourCharge(job=job, **{k: v for k, v in l.items() if k != 'id'}) for l in labour_data])
+        RepairJobPart.objects.bulk_create([RepairJobPart(job=job, **{k: v for k, v in p.items() if k != 'id'}) for p in parts_data])
         RepairInvoice.objects.create(job=job)
         from .models import update_repair_invoice_totals
         update_repair_invoice_totals(job)
         return job
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         labour_data = validated_data.pop('labour_charges', None)
         parts_data = validated_data.pop('parts_used', None)
@@ -196,13 +361,9 @@ class RepairJobCreateUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         if labour_data is not None:
-            instance.labour_charges.all().delete()
-            for l in labour_data:
-                LabourCharge.objects.create(job=instance, **l)
+            sync_job_rows(LabourCharge, instance, labour_data, 'labour_charges')
         if parts_data is not None:
-            instance.parts_used.all().delete()
-            for p in parts_data:
-                RepairJobPart.objects.create(job=instance, **p)
+            sync_job_rows(RepairJobPart, instance, parts_data, 'parts_used')
         from .models import update_repair_invoice_totals
         update_repair_invoice_totals(instance)
         return instance
@@ -267,8 +428,7 @@ class MaterialRequestSerializer(serializers.ModelSerializer):
                 setattr(instance, attr, value)
         if lines_data is not None:
             instance.lines.all().delete()
-            for line in lines_data:
-                MaterialRequestLine.objects.create(request=instance, **line)
+            MaterialRequestLine.objects.bulk_create([MaterialRequestLine(request=instance, **line) for line in lines_data])
         instance.save()
         return instance
 
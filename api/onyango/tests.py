@@ -1,3 +1,80 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from main.models import Category, Product, Unit, User
+
+from .models import MaterialRequest, MaterialRequestLine, TransferBalance, TransferOrder, TransferSettlement
+from .transfers import approve_material_request, reconcile_transfer
+
+
+class TransferBalanceTests(TestCase):
+    """TransferBalance must always equal what expected() recomputes from the transfers."""
+
+    def setUp(self):
+        self.shop, _ = Unit.objects.get_or_create(code='shop', defaults={'name': 'Shop'})
+        self.workshop, _ = Unit.objects.get_or_create(code='workshop', defaults={'name': 'Workshop'})
+        self.user = User.objects.create_user('storekeeper', password='x', role='admin', unit=self.shop)
+        category = Category.objects.create(name='Parts')
+        self.product = Product.objects.create(
+            name='Filter', code='F1', category=category, unit=self.shop,
+            buying_price=Decimal('10'), selling_price=Decimal('15'), quantity_in_stock=Decimal('100'),
+        )
+
+    def approve(self, quantity):
+        mr = MaterialRequest.objects.create(unit=self.workshop, status='submitted', requested_by=self.user)
+        MaterialRequestLine.objects.create(request=mr, product=self.product, quantity_requested=quantity)
+        return mr, approve_material_request(mr, self.user)
+
+    def settle(self, transfer, amount):
+        return TransferSettlement.objects.create(transfer_order=transfer, amount=Decimal(amount), settled_by=self.user)
+
+    def assertBalance(self, open_count, outstanding):
+        stored = {
+            (b.from_unit_id, b.to_unit_id): (b.open_count, b.outstanding)
+            for b in TransferBalance.objects.all() if b.open_count or b.outstanding
+        }
+        self.assertEqual(stored, TransferBalance.expected())
+        self.assertEqual(stored.get((self.shop.id, self.workshop.id), (0, Decimal('0'))), (open_count, Decimal(outstanding)))
+
+    def test_approve(self):
+        self.approve(3)
+        self.approve(5)
+        self.assertBalance(2, '80')
+
+    def test_settle_and_close(self):
+        _, transfer = self.approve(3)
+        self.settle(transfer, '10')
+        self.assertBalance(1, '20')
+        self.settle(transfer, '20')
+        self.assertBalance(0, '0')
+
+    def test_settlement_reversed(self):
+        _, transfer = self.approve(3)
+        settlement = self.settle(transfer, '30')
+        self.assertBalance(0, '0')
+        settlement.delete()
+        self.assertBalance(1, '30')
+
+    def test_reconcile(self):
+        mr, transfer = self.approve(5)
+        self.settle(transfer, '20')
+        MaterialRequestLine.objects.filter(request=mr).update(quantity_requested=2)
+        transfer.refresh_from_db()
+        reconcile_transfer(mr, transfer, self.user)
+        self.assertBalance(0, '0')
+
+    def test_reconcile_after_concurrent_settlement(self):
+        mr, transfer = self.approve(5)
+        # Settled through another instance after `transfer` was loaded
+        self.settle(TransferOrder.objects.get(pk=transfer.pk), '20')
+        MaterialRequestLine.objects.filter(request=mr).update(quantity_requested=4)
+        reconcile_transfer(mr, transfer, self.user)
+        self.assertBalance(1, '20')
+
+    def test_delete(self):
+        _, first = self.approve(3)
+        self.approve(5)
+        self.settle(first, '10')
+        first.delete()
+        self.assertBalance(1, '50')
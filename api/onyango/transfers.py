@@ -0,0 +1,262 @@
+"""
+Shop -> Workshop material transfers: stock movements for approving a material request and
+for reconciling the transfer when an approved request is edited.
+
+transfer_aging() buckets unsettled transfers by how far past due_date they are.
+
+Stock moves are set-based: the products are fetched once with a row lock, then moved with
+one CASE-based F() UPDATE per direction and bulk-created StockEntry rows. Decrements are
+conditional (quantity_in_stock >= amount taken), so a concurrent sale that drains a product
+makes the whole transaction fail instead of driving stock negative. Query count does not
+depend on the number of lines.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from main.lookup import product_code_cache
+from main.models import Product, StockEntry, Unit
+from .models import MaterialRequest, MaterialRequestLine, TransferOrder, TransferOrderLine
+
+
+class TransferError(ValueError):
+    pass
+
+
+class InsufficientStock(TransferError):
+    pass
+
+
+def _per_product(quantities):
+    return Case(
+        *(When(pk=pk, then=Value(qty)) for pk, qty in quantities.items()),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+
+
+def locked_products(product_ids):
+    """{id: Product} for the given ids, row-locked until the end of the transaction."""
+    return Product.objects.select_for_update().in_bulk(list(product_ids))
+
+
+def check_stock(products, quantities):
+    """Raise InsufficientStock naming every product that has less than `quantities` asks for."""
+    short = [
+        products[pk].name for pk, qty in quantities.items()
+        if qty > 0 and (pk not in products or products[pk].quantity_in_stock < qty)
+    ]
+    if short:
+        raise InsufficientStock(f"Insufficient stock for {', '.join(short)}")
+
+
+def move_stock(deltas, user, transfer_id):
+    """
+    Apply {product_id: quantity} to shop stock for a transfer: positive quantities go out to
+    the workshop ('transferred_out'), negative ones come back ('transferred_in').
+    """
+    deltas = {pk: qty for pk, qty in deltas.items() if qty}
+    if not deltas:
+        return
+    now = timezone.now()
+    out = {pk: qty for pk, qty in deltas.items() if qty > 0}
+    back = {pk: -qty for pk, qty in deltas.items() if qty < 0}
+    if out:
+        taken = Product.objects.filter(pk__in=list(out), quantity_in_stock__gte=_per_product(out)).update(
+            quantity_in_stock=F('quantity_in_stock') - _per_product(out), updated_at=now,
+        )
+        if taken != len(out):
+            check_stock(Product.objects.in_bulk(list(out)), out)
+            raise InsufficientStock("Insufficient stock")
+    if back:
+        Product.objects.filter(pk__in=list(back)).update(
+            quantity_in_stock=F('quantity_in_stock') + _per_product(back), updated_at=now,
+        )
+    StockEntry.objects.bulk_create([
+        StockEntry(
+            product_id=pk,
+            entry_type='transferred_out' if qty > 0 else 'transferred_in',
+            quantity=abs(qty),
+            recorded_by=user,
+            ref_type='transfer_order',
+            ref_id=transfer_id,
+        )
+        for pk, qty in deltas.items()
+    ])
+    ids = list(deltas)
+    transaction.on_commit(lambda: product_code_cache.evict_ids(ids))
+
+
+@transaction.atomic
+def approve_material_request(mr, user):
+    """
+    Approve a submitted request: confirm a transfer at buying price and take the stock out of
+    the shop. Raises TransferError (nothing is written) if the request is no longer submitted
+    or any product is short.
+    """
+    units = {u.code: u for u in Unit.objects.filter(code__in=('shop', 'workshop'))}
+    if len(units) < 2:
+        raise TransferError('Shop or Workshop unit not configured.')
+
+    now = timezone.now()
+    # Conditional update: two approvers racing cannot both create a transfer
+    approved = MaterialRequest.objects.filter(pk=mr.pk, status='submitted').update(
+        status='approved', reviewed_by=user, reviewed_at=now, updated_at=now,
+    )
+    if not approved:
+        raise TransferError('Only submitted requests can be approved.')
+    mr.status, mr.reviewed_by, mr.reviewed_at = 'approved', user, now
+
+    lines = list(MaterialRequestLine.objects.filter(request=mr).order_by('id').values_list('product_id', 'quantity_requested'))
+    quantities = defaultdict(Decimal)
+    for product_id, qty in lines:
+        quantities[product_id] += qty
+    products = locked_products(quantities)
+    check_stock(products, quantities)
+
+    transfer = TransferOrder.objects.create(
+        material_request=mr,
+        from_unit=units['shop'],
+        to_unit=units['workshop'],
+        status='confirmed',
+        total_amount=sum((products[pk].buying_price * qty for pk, qty in lines), Decimal('0')),
+        settled_amount=0,
+        confirmed_by=user,
+        confirmed_at=now,
+    )
+    TransferOrderLine.objects.bulk_create([
+        TransferOrderLine(transfer=transfer, product_id=pk, quantity=qty, transfer_price=products[pk].buying_price)
+        for pk, qty in lines
+    ])
+    move_stock(quantities, user, transfer.id)
+    return transfer
+
+
+@transaction.atomic
+def reconcile_transfer(mr, transfer, user):
+    """
+    Bring an approved request's transfer in line with the request's (edited) lines.
+
+    The request lines and transfer lines are read once each and diffed per product in memory:
+    the stock difference moves in bulk (move_stock), changed lines are bulk-updated, new ones
+    bulk-created and dropped ones deleted in one query. Lines whose quantity did not change keep
+    their transfer price; changed and new lines are priced at the current buying price.
+    Returns {'added': n, 'changed': n, 'removed': n}.
+    """
+    wanted = defaultdict(Decimal)
+    for product_id, qty in MaterialRequestLine.objects.filter(request=mr).values_list('product_id', 'quantity_requested'):
+        wanted[product_id] += qty
+    current = defaultdict(list)
+    for line in TransferOrderLine.objects.filter(transfer=transfer).order_by('id'):
+        current[line.product_id].append(line)
+
+    deltas = {
+        pk: wanted.get(pk, Decimal('0')) - sum((line.quantity for line in current.get(pk, ())), Decimal('0'))
+        for pk in set(wanted) | set(current)
+    }
+    products = locked_products(deltas)
+    try:
+        check_stock(products, deltas)
+    except InsufficientStock:
+        short = [
+            f"{products[pk].name} (available {products[pk].quantity_in_stock}, need {delta} more)"
+            for pk, delta in deltas.items() if delta > 0 and products[pk].quantity_in_stock < delta
+        ]
+        raise InsufficientStock(f"Insufficient stock for {'; '.join(short)}.")
+
+    added, changed, removed = [], [], []
+    for pk, qty in wanted.items():
+        lines = current.get(pk, [])
+        removed += [line.id for line in lines[1:]]  # one transfer line per product
+        if not lines:
+            added.append(TransferOrderLine(transfer=transfer, product_id=pk, quantity=qty, transfer_price=products[pk].buying_price or 0))
+        elif deltas[pk] or len(lines) > 1:
+            line = lines[0]
+            line.quantity = qty
+            if deltas[pk]:
+                line.transfer_price = products[pk].buying_price or 0
+            changed.append(line)
+    for pk, lines in current.items():
+        if pk not in wanted:
+            removed += [line.id for line in lines]
+
+    TransferOrderLine.objects.bulk_create(added)
+    TransferOrderLine.objects.bulk_update(changed, ['quantity', 'transfer_price'])
+    if removed:
+        TransferOrderLine.objects.filter(id__in=removed).delete()
+    move_stock(deltas, user, transfer.id)
+
+    kept = [lines[0] for pk, lines in current.items() if pk in wanted]
+    transfer.total_amount = sum((line.transfer_price * line.quantity for line in kept + added), Decimal('0'))
+    # settled_amount is not touched: it follows payments
+    if transfer.settled_amount >= transfer.total_amount:
+        transfer.status = 'closed'
+    elif transfer.settled_amount > 0:
+        transfer.status = 'partially_settled'
+    else:
+        transfer.status = 'confirmed'
+    transfer.save(update_fields=['total_amount', 'status'])
+    return {'added': len(added), 'changed': len(changed), 'removed': len(removed)}
+
+
+# (bucket, days overdue from, days overdue to) on due_date; not_due and no_due_date come first
+AGING_BUCKETS = (('1_30', 1, 30), ('31_60', 31, 60), ('61_90', 61, 90), ('over_90', 91, None))
+OVERDUE_LIST_LIMIT = 50
+
+
+def transfer_aging(today=None):
+    """
+    Outstanding (total - settled) of unsettled transfers per unit pair, bucketed by days past
+    due_date, in one grouped query; plus the most overdue transfers.
+    """
+    today = today or timezone.localdate()
+    money = DecimalField(max_digits=20, decimal_places=2)
+    outstanding = F('total_amount') - F('settled_amount')
+    buckets = {'not_due': Q(due_date__gte=today), 'no_due_date': Q(due_date__isnull=True)}
+    for name, low, high in AGING_BUCKETS:
+        bucket = Q(due_date__lte=today - timedelta(days=low))
+        if high is not None:
+            bucket &= Q(due_date__gte=today - timedelta(days=high))
+        buckets[name] = bucket
+
+    annotations = {}
+    for name, condition in buckets.items():
+        annotations[f'{name}_count'] = Count('id', filter=condition)
+        annotations[f'{name}_amount'] = Coalesce(Sum(outstanding, filter=condition, output_field=money), Value(Decimal('0')), output_field=money)
+    unsettled = TransferOrder.objects.exclude(status='closed')
+    rows = unsettled.values('from_unit_id', 'from_unit__code', 'to_unit_id', 'to_unit__code').annotate(**annotations).order_by('from_unit_id', 'to_unit_id')
+
+    overdue = (
+        unsettled.filter(due_date__lt=today)
+        .select_related('material_request')
+        .order_by('due_date', 'id')[:OVERDUE_LIST_LIMIT]
+    )
+    return {
+        'date': today.isoformat(),
+        'pairs': [
+            {
+                'from_unit': {'id': row['from_unit_id'], 'code': row['from_unit__code']},
+                'to_unit': {'id': row['to_unit_id'], 'code': row['to_unit__code']},
+                'buckets': {
+                    name: {'count': row[f'{name}_count'], 'amount': float(row[f'{name}_amount'])}
+                    for name in buckets
+                },
+            }
+            for row in rows
+        ],
+        'overdue': [
+            {
+                'transfer_id': t.id,
+                'job_id': t.material_request.repair_job_id if t.material_request else None,
+                'due_date': t.due_date.isoformat(),
+                'days_overdue': (today - t.due_date).days,
+                'outstanding': float(t.total_amount - t.settled_amount),
+                'status': t.status,
+            }
+            for t in overdue
+        ],
+    }
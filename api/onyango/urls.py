@@ -17,5 +17,8 @@ router.register(r'activity-logs', views.ActivityLogViewSet, basename='activitylo
 
 urlpatterns = [
     path('dashboard/', views.OnyangoDashboardView.as_view(), name='onyango-dashboard'),
+    path('dashboard/async/', views.onyango_dashboard_async, name='onyango-dashboard-async'),
+    path('reports/suppliers/', views.SupplierPerformanceReportView.as_view(), name='supplier-performance-report'),
+    path('reports/workshop-profitability/', views.WorkshopProfitabilityReportView.as_view(), name='workshop-profitability-report'),
     path('', include(router.urls)),
 ]
@@ -4,27 +4,32 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum, Count, Q, F
-from django.db.models.functions import Coalesce
-from main.models import Unit, Product, Sale, StockEntry
+from datetime import datetime
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from django.db.models import Sum, Count, Q, F, Avg, Case, When, Value, Subquery, OuterRef, ExpressionWrapper, DecimalField, DurationField
+from django.db.models.functions import Coalesce, Least, TruncDate
+from main.models import Unit
 from .models import (
     Supplier, PurchaseOrder, PurchaseOrderLine, GoodsReceipt, GoodsReceiptLine,
     JobType, RepairJob, RepairJobPart, LabourCharge, RepairInvoice, RepairPayment,
-    MaterialRequest, MaterialRequestLine, TransferOrder, TransferOrderLine, TransferSettlement,
+    MaterialRequest, MaterialRequestLine, TransferOrder, TransferSettlement,
     ActivityLog,
 )
 from .serializers import (
-    UnitSerializer, SupplierSerializer, PurchaseOrderSerializer, PurchaseOrderLineSerializer,
+    UnitSerializer, SupplierSerializer, PurchaseOrderSerializer, PurchaseOrderLineSerializer, PurchaseOrderBulkSerializer,
     GoodsReceiptSerializer, JobTypeSerializer, RepairJobSerializer, RepairJobCreateUpdateSerializer,
     RepairInvoiceSerializer, RepairPaymentSerializer, MaterialRequestSerializer,
     TransferOrderSerializer, TransferSettlementSerializer, ActivityLogSerializer,
 )
 from .permissions import IsOwnerOrManager, IsOwnerOrManagerOrReadOnly, IsShopStaff, IsWorkshopStaff, CanApproveTransfer, CanSettleTransfer
-from main.timeline import log_timeline
-
-
-def log_activity(user, action_name, entity_type, entity_id=None, details=None):
-    ActivityLog.objects.create(user=user, action=action_name, entity_type=entity_type, entity_id=entity_id, details=details)
+from coreshop.authentication import async_api_view
+from main.events import emit
+from . import events
+from .transfers import InsufficientStock, TransferError, approve_material_request, reconcile_transfer, transfer_aging
+from .board import TURNAROUND_DAYS, repair_board
+from .profitability import workshop_profitability
+from .dashboard import aonyango_dashboard, onyango_dashboard
 
 
 # ---------- Units ----------
@@ -52,7 +57,124 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         po = serializer.save()
-        log_timeline('purchase_order_created', 'purchase_order', po.id, f"Purchase order #{po.id} created - {po.supplier.name}", user=self.request.user, details={'purchase_order_id': po.id, 'supplier_id': po.supplier_id})
+        emit(events.PurchaseOrderCreated(purchase_order=po, user=self.request.user))
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create one purchase order per supplier from a list of (supplier, product, quantity, unit_price) rows."""
+        serializer = PurchaseOrderBulkSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        orders = serializer.save()
+        emit(events.PurchaseOrdersBulkCreated(purchase_orders=orders, line_count=len(serializer.validated_data['rows']), user=request.user))
+        qs = self.get_queryset().filter(id__in=[po.id for po in orders]).prefetch_related('lines__product')
+        return Response(PurchaseOrderSerializer(qs, many=True).data, status=status.HTTP_201_CREATED)
+
+
+# ---------- Supplier performance report ----------
+class SupplierPerformanceReportView(APIView):
+    """
+    Per-supplier purchasing KPIs, computed with grouped SQL:
+    - fill_rate: received / ordered quantity (over-deliveries capped at the ordered quantity)
+    - avg_lead_time_days: order_date -> first goods receipt, averaged over received POs
+    - open_po_value: outstanding quantity x unit price on POs not yet received/closed
+    Optional date_from / date_to (YYYY-MM-DD) filter on PO order_date.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrManager]
+
+    OPEN_STATUSES = ('draft', 'sent', 'partially_received')
+
+    def get(self, request):
+        orders = PurchaseOrder.objects.all()
+        for param, lookup in (('date_from', 'order_date__gte'), ('date_to', 'order_date__lte')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    orders = orders.filter(**{lookup: datetime.strptime(value.strip(), '%Y-%m-%d').date()})
+                except ValueError:
+                    return Response({'error': f'Invalid {param}. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        money = DecimalField(max_digits=20, decimal_places=2)
+        received = Least('received_quantity', 'quantity')
+        line_rows = (
+            PurchaseOrderLine.objects.filter(order__in=orders)
+            .values('order__supplier_id')
+            .annotate(
+                po_count=Count('order', distinct=True),
+                ordered_qty=Coalesce(Sum('quantity'), 0),
+                received_qty=Coalesce(Sum(received), 0),
+                ordered_value=Coalesce(Sum(F('quantity') * F('unit_price'), output_field=money), Value(0, output_field=money)),
+                open_po_value=Coalesce(
+                    Sum(
+                        Case(
+                            When(order__status__in=self.OPEN_STATUSES, then=(F('quantity') - received) * F('unit_price')),
+                            default=Value(0),
+                            output_field=money,
+                        )
+                    ),
+                    Value(0, output_field=money),
+                ),
+            )
+        )
+
+        first_receipt = GoodsReceipt.objects.filter(order=OuterRef('pk')).order_by('receipt_date').values('receipt_date')[:1]
+        lead_rows = (
+            orders.annotate(first_receipt=Subquery(first_receipt))
+            .filter(first_receipt__isnull=False)
+            .values('supplier_id')
+            .annotate(
+                avg_lead=Avg(ExpressionWrapper(TruncDate('first_receipt') - F('order_date'), output_field=DurationField())),
+                received_po_count=Count('id'),
+            )
+        )
+        lead_by_supplier = {row['supplier_id']: row for row in lead_rows}
+
+        suppliers = Supplier.objects.in_bulk([row['order__supplier_id'] for row in line_rows])
+        results = []
+        for row in line_rows:
+            supplier_id = row['order__supplier_id']
+            lead = lead_by_supplier.get(supplier_id)
+            avg_lead = lead['avg_lead'] if lead else None
+            ordered_qty = row['ordered_qty'] or 0
+            results.append({
+                'supplier_id': supplier_id,
+                'supplier_name': suppliers[supplier_id].name if supplier_id in suppliers else None,
+                'po_count': row['po_count'],
+                'received_po_count': lead['received_po_count'] if lead else 0,
+                'ordered_qty': ordered_qty,
+                'received_qty': row['received_qty'] or 0,
+                'fill_rate': round(float(row['received_qty'] or 0) / ordered_qty, 4) if ordered_qty else None,
+                'avg_lead_time_days': round(avg_lead.total_seconds() / 86400, 2) if avg_lead is not None else None,
+                'ordered_value': float(row['ordered_value']),
+                'open_po_value': float(row['open_po_value']),
+            })
+        results.sort(key=lambda r: r['open_po_value'], reverse=True)
+        return Response({'results': results})
+
+
+# ---------- Workshop profitability report ----------
+class WorkshopProfitabilityReportView(APIView):
+    """
+    Revenue, material cost, labour margin and cash-collected ratio per job type, technician and
+    intake month (see onyango/profitability.py). Optional date_from / date_to (YYYY-MM-DD) on
+    job intake date, unit (id) and refresh=1 to bypass the cached result.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrManager]
+
+    def get(self, request):
+        dates = {}
+        for param in ('date_from', 'date_to'):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    dates[param] = datetime.strptime(value.strip(), '%Y-%m-%d').date()
+                except ValueError:
+                    return Response({'error': f'Invalid {param}. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            unit_id = int(request.query_params['unit']) if request.query_params.get('unit') else None
+        except ValueError:
+            return Response({'error': 'unit must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        refresh = request.query_params.get('refresh') in ('1', 'true')
+        return Response(workshop_profitability(unit_id=unit_id, refresh=refresh, **dates))
 
 
 # ---------- Goods Receipts ----------
@@ -63,7 +185,7 @@ class GoodsReceiptViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         receipt = serializer.save()
-        log_timeline('goods_receipt', 'goods_receipt', receipt.id, f"Goods receipt #{receipt.id} for PO #{receipt.order_id}", user=self.request.user, details={'goods_receipt_id': receipt.id, 'purchase_order_id': receipt.order_id})
+        emit(events.GoodsReceived(receipt=receipt, user=self.request.user))
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -108,8 +230,16 @@ class RepairJobViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         job = serializer.save()
-        log_activity(self.request.user, 'created_repair_job', 'repair_job', job.id)
-        log_timeline('repair_job_created', 'repair_job', job.id, f"Repair job #{job.id} - {job.item_description} (Customer: {job.customer.name})", user=self.request.user, details={'repair_job_id': job.id, 'customer_id': job.customer_id})
+        emit(events.RepairJobCreated(job=job, user=self.request.user))
+
+    def perform_update(self, serializer):
+        job = serializer.save()
+        emit(events.RepairJobUpdated(job=job, user=self.request.user))
+
+    def perform_destroy(self, instance):
+        job_id = instance.id
+        instance.delete()
+        emit(events.RepairJobDeleted(job_id=job_id, user=self.request.user))
 
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
@@ -119,8 +249,7 @@ class RepairJobViewSet(viewsets.ModelViewSet):
         job.status = 'completed'
         job.completed_date = timezone.now()
         job.save()
-        log_activity(request.user, 'completed_repair_job', 'repair_job', job.id)
-        log_timeline('repair_job_completed', 'repair_job', job.id, f"Repair job #{job.id} completed", user=request.user, details={'repair_job_id': job.id})
+        emit(events.RepairJobCompleted(job_id=job.id, user=request.user))
         return Response(RepairJobSerializer(job).data)
 
     @action(detail=True, methods=['post'])
@@ -131,10 +260,21 @@ class RepairJobViewSet(viewsets.ModelViewSet):
         job.status = 'collected'
         job.collected_date = timezone.now()
         job.save()
-        log_activity(request.user, 'collected_repair_job', 'repair_job', job.id)
-        log_timeline('repair_job_collected', 'repair_job', job.id, f"Repair job #{job.id} collected by customer", user=request.user, details={'repair_job_id': job.id})
+        emit(events.RepairJobCollected(job_id=job.id, user=request.user))
         return Response(RepairJobSerializer(job).data)
 
+    @action(detail=False, methods=['get'])
+    def board(self, request):
+        """Technician workload board: queue counts, oldest job, overdue jobs and turnaround per job type."""
+        try:
+            unit_id = int(request.query_params['unit']) if request.query_params.get('unit') else None
+            days = int(request.query_params.get('days') or TURNAROUND_DAYS)
+        except ValueError:
+            return Response({'error': 'unit and days must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= 365:
+            return Response({'error': 'days must be between 1 and 365.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(repair_board(unit_id=unit_id, turnaround_days=days))
+
 
 # ---------- Repair Payments ----------
 class RepairPaymentViewSet(viewsets.ModelViewSet):
@@ -144,7 +284,7 @@ class RepairPaymentViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         payment = serializer.save(received_by=self.request.user)
-        log_timeline('repair_payment', 'repair_payment', payment.id, f"Repair payment TZS {payment.amount} for Job #{payment.invoice.job_id}", user=self.request.user, details={'repair_payment_id': payment.id, 'invoice_id': payment.invoice_id, 'amount': str(payment.amount)})
+        emit(events.RepairPaymentRecorded(payment=payment, user=self.request.user))
 
 
 # ---------- Material Requests ----------
@@ -156,24 +296,7 @@ class MaterialRequestViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         mr = serializer.save()
         # Timeline: material request created as submitted (requested) so shop can approve
-        job = mr.repair_job
-        customer_name = getattr(getattr(job, 'customer', None), 'name', None) if job else None
-        log_activity(self.request.user, 'created_material_request', 'material_request', mr.id)
-        title = f"Material request #{mr.id} created and submitted for approval"
-        if job and customer_name:
-            title = f"Material request #{mr.id} for Repair #{job.id} ({customer_name}) submitted for approval"
-        log_timeline(
-            'material_request_submitted',
-            'material_request',
-            mr.id,
-            title,
-            user=self.request.user,
-            details={
-                'material_request_id': mr.id,
-                'repair_job_id': job.id if job else None,
-                'customer_name': customer_name,
-            },
-        )
+        emit(events.MaterialRequestCreated(material_request=mr, user=self.request.user))
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -208,137 +331,18 @@ class MaterialRequestViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     def perform_update(self, serializer):
-        mr = serializer.save()
-        old_status = getattr(serializer, 'old_status', mr.status)
-        
-        # If approved request is being updated, we need to update the TransferOrder
-        if old_status == 'approved':
-            transfer = getattr(mr, 'transfer_order', None)
+        with transaction.atomic():
+            mr = serializer.save()
+            old_status = getattr(serializer, 'old_status', mr.status)
+
+            # If an approved request is edited, diff its TransferOrder against the new lines
+            transfer = getattr(mr, 'transfer_order', None) if old_status == 'approved' else None
             if transfer:
-                with transaction.atomic():
-                    # Calculate new total from updated lines
-                    new_total = 0
-                    existing_lines_map = {line.product_id: line for line in transfer.lines.all()}
-                    new_lines_data = []
-                    
-                    # Validate stock and prepare new lines
-                    for line in mr.lines.all():
-                        product = line.product
-                        # Refresh product to get latest stock
-                        product.refresh_from_db()
-                        qty_requested = line.quantity_requested
-                        
-                        # Check stock availability (consider already transferred quantities)
-                        existing_line = existing_lines_map.get(product.id)
-                        already_transferred = existing_line.quantity if existing_line else 0
-                        current_stock = product.quantity_in_stock or 0
-                        
-                        # If increasing quantity, check if additional stock is available
-                        if qty_requested > already_transferred:
-                            additional_needed = qty_requested - already_transferred
-                            if current_stock < additional_needed:
-                                raise serializers.ValidationError({
-                                    'lines': [f"Insufficient stock for {product.name} (available {current_stock}, need {additional_needed} more)."]
-                                })
-                        
-                        price = product.buying_price or 0
-                        new_total += price * qty_requested
-                        new_lines_data.append({
-                            'product': product,
-                            'quantity': qty_requested,
-                            'transfer_price': price,
-                            'existing_line': existing_line,
-                        })
-                    
-                    # Update or create transfer lines
-                    for item in new_lines_data:
-                        existing_line = item['existing_line']
-                        if existing_line:
-                            # Update existing line (quantity change)
-                            old_qty = existing_line.quantity
-                            new_qty = item['quantity']
-                            if new_qty != old_qty:
-                                # Adjust stock by the difference
-                                diff = new_qty - old_qty
-                                product = existing_line.product
-                                if diff > 0:
-                                    # Increasing quantity - deduct the difference
-                                    product.quantity_in_stock -= diff
-                                else:
-                                    # Decreasing quantity - add back the difference
-                                    product.quantity_in_stock += abs(diff)
-                                product.save()
-                                
-                                # Update stock entry
-                                StockEntry.objects.create(
-                                    product=product,
-                                    entry_type='transferred_out' if diff > 0 else 'transferred_in',
-                                    quantity=abs(diff),
-                                    recorded_by=self.request.user,
-                                    ref_type='transfer_order',
-                                    ref_id=transfer.id,
-                                )
-                                
-                                existing_line.quantity = new_qty
-                                existing_line.transfer_price = item['transfer_price']
-                                existing_line.save()
-                        else:
-                            # New line - create it and deduct stock
-                            TransferOrderLine.objects.create(
-                                transfer=transfer,
-                                product=item['product'],
-                                quantity=item['quantity'],
-                                transfer_price=item['transfer_price'],
-                            )
-                            item['product'].quantity_in_stock -= item['quantity']
-                            item['product'].save()
-                            StockEntry.objects.create(
-                                product=item['product'],
-                                entry_type='transferred_out',
-                                quantity=item['quantity'],
-                                recorded_by=self.request.user,
-                                ref_type='transfer_order',
-                                ref_id=transfer.id,
-                            )
-                    
-                    # Remove lines that are no longer in the request
-                    request_product_ids = {line.product_id for line in mr.lines.all()}
-                    for transfer_line in transfer.lines.all():
-                        if transfer_line.product_id not in request_product_ids:
-                            # Add back stock for removed line
-                            transfer_line.product.quantity_in_stock += transfer_line.quantity
-                            transfer_line.product.save()
-                            StockEntry.objects.create(
-                                product=transfer_line.product,
-                                entry_type='transferred_in',
-                                quantity=transfer_line.quantity,
-                                recorded_by=self.request.user,
-                                ref_type='transfer_order',
-                                ref_id=transfer.id,
-                            )
-                            transfer_line.delete()
-                    
-                    # Update transfer total (but don't change settled_amount - that's based on payments)
-                    transfer.total_amount = new_total
-                    # Update status based on settled_amount vs new total
-                    if transfer.settled_amount >= new_total:
-                        transfer.status = 'closed'
-                    elif transfer.settled_amount > 0:
-                        transfer.status = 'partially_settled'
-                    else:
-                        transfer.status = 'confirmed'  # Keep confirmed if no payments yet
-                    transfer.save()
-        
-        log_activity(self.request.user, 'updated_material_request', 'material_request', mr.id)
-        status_msg = 'updated' if old_status == 'approved' else 'updated (back to draft – can resubmit)'
-        log_timeline(
-            'material_request_updated',
-            'material_request',
-            mr.id,
-            f"Material request #{mr.id} {status_msg}",
-            user=self.request.user,
-            details={'material_request_id': mr.id, 'old_status': old_status},
-        )
+                try:
+                    reconcile_transfer(mr, transfer, self.request.user)
+                except InsufficientStock as exc:
+                    raise serializers.ValidationError({'lines': [str(exc)]})
+            emit(events.MaterialRequestUpdated(material_request_id=mr.id, old_status=old_status, user=self.request.user))
 
     def destroy(self, request, *args, **kwargs):
         mr = self.get_object()
@@ -349,7 +353,7 @@ class MaterialRequestViewSet(viewsets.ModelViewSet):
             )
         mr_id = mr.id
         mr.delete()
-        log_activity(request.user, 'deleted_material_request', 'material_request', mr_id)
+        emit(events.MaterialRequestDeleted(material_request_id=mr_id, user=request.user))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post'])
@@ -377,15 +381,7 @@ class MaterialRequestViewSet(viewsets.ModelViewSet):
         mr.reviewed_by = None
         mr.reviewed_at = None
         mr.save()
-        log_activity(request.user, 'submitted_material_request', 'material_request', mr.id)
-        log_timeline(
-            'material_request_submitted',
-            'material_request',
-            mr.id,
-            f"Material request #{mr.id} resubmitted for approval",
-            user=request.user,
-            details={'material_request_id': mr.id},
-        )
+        emit(events.MaterialRequestSubmitted(material_request_id=mr.id, resubmitted=True, user=request.user))
         return Response({'message': 'Resubmitted. Shop can approve or reject again.', 'status': 'submitted'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, CanApproveTransfer])
@@ -393,56 +389,12 @@ class MaterialRequestViewSet(viewsets.ModelViewSet):
         mr = self.get_object()
         if mr.status != 'submitted':
             return Response({'error': 'Only submitted requests can be approved.'}, status=status.HTTP_400_BAD_REQUEST)
-        with transaction.atomic():
-            mr.status = 'approved'
-            mr.reviewed_by = request.user
-            mr.reviewed_at = timezone.now()
-            mr.save()
-            shop = Unit.objects.filter(code='shop').first()
-            workshop = Unit.objects.filter(code='workshop').first()
-            if not shop or not workshop:
-                return Response({'error': 'Shop or Workshop unit not configured.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            total = 0
-            lines_data = []
-            for line in mr.lines.all():
-                if line.product.quantity_in_stock < line.quantity_requested:
-                    return Response({'error': f'Insufficient stock for {line.product.name}'}, status=status.HTTP_400_BAD_REQUEST)
-                price = line.product.buying_price
-                total += price * line.quantity_requested
-                lines_data.append({'product': line.product, 'quantity': line.quantity_requested, 'transfer_price': price})
-            transfer = TransferOrder.objects.create(
-                material_request=mr,
-                from_unit=shop,
-                to_unit=workshop,
-                status='draft',
-                total_amount=total,
-                settled_amount=0,
-            )
-            for item in lines_data:
-                TransferOrderLine.objects.create(
-                    transfer=transfer,
-                    product=item['product'],
-                    quantity=item['quantity'],
-                    transfer_price=item['transfer_price'],
-                )
-            transfer.status = 'confirmed'
-            transfer.confirmed_by = request.user
-            transfer.confirmed_at = timezone.now()
-            transfer.save()
-            for line in transfer.lines.all():
-                line.product.quantity_in_stock -= line.quantity
-                line.product.save()
-                StockEntry.objects.create(
-                    product=line.product,
-                    entry_type='transferred_out',
-                    quantity=line.quantity,
-                    recorded_by=request.user,
-                    ref_type='transfer_order',
-                    ref_id=transfer.id,
-                )
-            log_activity(request.user, 'approved_material_request', 'material_request', mr.id, {'transfer_id': transfer.id})
-            log_timeline('material_request_approved', 'material_request', mr.id, f"Material request #{mr.id} approved", user=request.user, details={'material_request_id': mr.id})
-            log_timeline('transfer_confirmed', 'transfer_order', transfer.id, f"Transfer #{transfer.id} confirmed - TZS {transfer.total_amount} (Shop → Workshop)", user=request.user, details={'transfer_id': transfer.id, 'amount': str(transfer.total_amount)})
+        try:
+            with transaction.atomic():
+                transfer = approve_material_request(mr, request.user)
+                emit(events.MaterialRequestApproved(material_request_id=mr.id, transfer=transfer, user=request.user))
+        except TransferError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'message': 'Approved and transfer created.', 'transfer_id': transfer.id}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, CanApproveTransfer])
@@ -456,8 +408,7 @@ class MaterialRequestViewSet(viewsets.ModelViewSet):
         mr.reviewed_at = timezone.now()
         mr.rejection_reason = reason
         mr.save()
-        log_activity(request.user, 'rejected_material_request', 'material_request', mr.id)
-        log_timeline('material_request_rejected', 'material_request', mr.id, f"Material request #{mr.id} rejected", user=request.user, details={'material_request_id': mr.id, 'reason': reason})
+        emit(events.MaterialRequestRejected(material_request_id=mr.id, reason=reason, user=request.user))
         return Response({'message': 'Request rejected.'}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
@@ -467,8 +418,7 @@ class MaterialRequestViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Only draft requests can be submitted.'}, status=status.HTTP_400_BAD_REQUEST)
         mr.status = 'submitted'
         mr.save()
-        log_activity(request.user, 'submitted_material_request', 'material_request', mr.id)
-        log_timeline('material_request_submitted', 'material_request', mr.id, f"Material request #{mr.id} submitted for approval", user=request.user, details={'material_request_id': mr.id})
+        emit(events.MaterialRequestSubmitted(material_request_id=mr.id, user=request.user))
         return Response({'message': 'Submitted.'}, status=status.HTTP_200_OK)
 
 
@@ -492,6 +442,11 @@ class TransferOrderViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(transfer_date__date=date_str)
         return qs
 
+    @action(detail=False, methods=['get'])
+    def aging(self, request):
+        """Unsettled transfer balances per unit pair by days past due date, and the most overdue transfers."""
+        return Response(transfer_aging())
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsWorkshopStaff])
     def pay(self, request, pk=None):
         """
@@ -539,15 +494,7 @@ class TransferOrderViewSet(viewsets.ReadOnlyModelViewSet):
         transfer.refresh_from_db()
         new_outstanding = (transfer.total_amount or Decimal('0')) - (transfer.settled_amount or Decimal('0'))
 
-        log_activity(request.user, 'paid_materials', 'transfer_order', transfer.id, {'settlement_id': settlement.id, 'amount': str(amount)})
-        log_timeline(
-            'materials_paid',
-            'transfer_order',
-            transfer.id,
-            f"Materials payment TZS {amount} for Transfer #{transfer.id} (Repair #{job.id})",
-            user=request.user,
-            details={'transfer_order_id': transfer.id, 'repair_job_id': job.id, 'amount': str(amount)},
-        )
+        emit(events.MaterialsPaid(settlement=settlement, job_id=job.id, user=request.user))
 
         return Response(
             {
@@ -569,7 +516,7 @@ class TransferSettlementViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         settlement = serializer.save()
-        log_timeline('transfer_settled', 'transfer_settlement', settlement.id, f"Settlement TZS {settlement.amount} for Transfer #{settlement.transfer_order_id}", user=self.request.user, details={'settlement_id': settlement.id, 'transfer_order_id': settlement.transfer_order_id, 'amount': str(settlement.amount)})
+        emit(events.TransferSettled(settlement=settlement, user=self.request.user))
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -597,10 +544,9 @@ class TransferSettlementViewSet(viewsets.ModelViewSet):
         settlement.cleared = True
         settlement.cleared_at = timezone.now()
         settlement.cleared_by = user
-        settlement.save()
+        settlement.save(update_fields=['cleared', 'cleared_at', 'cleared_by'])
 
-        log_activity(user, 'cleared_material_payment', 'transfer_settlement', settlement.id, {'transfer_order_id': settlement.transfer_order_id, 'amount': str(settlement.amount)})
-        log_timeline('materials_payment_cleared', 'transfer_settlement', settlement.id, f"Materials payment TZS {settlement.amount} for Transfer #{settlement.transfer_order_id} cleared in cash by {user.username}", user=user, details={'settlement_id': settlement.id, 'transfer_order_id': settlement.transfer_order_id, 'amount': str(settlement.amount)})
+        emit(events.MaterialsPaymentCleared(settlement=settlement, user=user))
 
         return Response({'message': 'Marked as cleared.'}, status=status.HTTP_200_OK)
 
@@ -617,52 +563,11 @@ class OnyangoDashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        from main.models import Expense
-        from decimal import Decimal
-        today = timezone.now().date()
-        shop = Unit.objects.filter(code='shop').first()
-        workshop = Unit.objects.filter(code='workshop').first()
-
-        # Shop: today's sales (from main.Sale with unit=shop or no unit for backward compat)
-        sales_qs = Sale.objects.exclude(status='refunded')
-        if shop:
-            sales_qs = sales_qs.filter(Q(unit=shop) | Q(unit__isnull=True))
-        daily_sales = sales_qs.filter(date__date=today).aggregate(total=Sum('paid_amount'))['total'] or 0
-        low_stock = Product.objects.filter(quantity_in_stock__lte=F('threshold')).count()
-
-        # Workshop: pending and completed today
-        if workshop:
-            pending_repairs = RepairJob.objects.filter(unit=workshop).exclude(status__in=('completed', 'collected', 'cancelled')).count()
-            completed_today = RepairJob.objects.filter(unit=workshop, completed_date__date=today).count()
-            repair_revenue_today = RepairPayment.objects.filter(invoice__job__unit=workshop, payment_date__date=today).aggregate(total=Sum('amount'))['total'] or 0
-            # Materials paid to shop today (cash out from workshop) and implied income
-            materials_paid_today = TransferSettlement.objects.filter(
-                settlement_date__date=today,
-                transfer_order__to_unit=workshop,
-            ).aggregate(total=Coalesce(Sum('amount'), Decimal('0')))['total'] or Decimal('0')
-            workshop_income_today = (Decimal(str(repair_revenue_today or 0)) - materials_paid_today)
-        else:
-            pending_repairs = RepairJob.objects.exclude(status__in=('completed', 'collected', 'cancelled')).count()
-            completed_today = RepairJob.objects.filter(completed_date__date=today).count()
-            repair_revenue_today = RepairPayment.objects.filter(payment_date__date=today).aggregate(total=Sum('amount'))['total'] or 0
-            materials_paid_today = Decimal('0')
-            workshop_income_today = Decimal(str(repair_revenue_today or 0))
-
-        # Pending transfers (unsettled)
-        open_transfers = TransferOrder.objects.exclude(status='closed')
-        pending_transfers = open_transfers.count()
-        pending_transfer_outstanding = Decimal('0')
-        for t in open_transfers:
-            pending_transfer_outstanding += (t.total_amount or Decimal('0')) - (t.settled_amount or Decimal('0'))
-
-        return Response({
-            'daily_sales': float(daily_sales),
-            'repair_revenue_today': float(repair_revenue_today),
-            'workshop_materials_paid_today': float(materials_paid_today),
-            'workshop_income_today': float(workshop_income_today),
-            'low_stock_count': low_stock,
-            'pending_repairs': pending_repairs,
-            'completed_repairs_today': completed_today,
-            'pending_transfers_count': pending_transfers,
-            'pending_transfer_amount': float(pending_transfer_outstanding),
-        })
+        return Response(onyango_dashboard())
+
+
+@require_GET
+@async_api_view()
+async def onyango_dashboard_async(request):
+    """GET dashboard/async/: OnyangoDashboardView with the shop/workshop blocks queried concurrently."""
+    return JsonResponse(await aonyango_dashboard())